@@ -2,41 +2,113 @@
 Functions and CLI for code to get mal anime information.
 '''
 
+import sys
+
+if __name__ == '__main__':
+    # while a daemon is running (see daemon.py), the cli is run on it before requests / bs4 are imported
+    import client
+    if client.forward_cli('anime', sys.argv[1:]):
+        sys.exit()
+
 import re
 from datetime import datetime
+from urllib.parse import urljoin
 import utility
+import fetcher
+import metrics
+import character
+import normalize
 from utility import Bs4Error
-from bs4 import NavigableString
 import argparse
-import sys
 
-dt = datetime.now()
-timestamp = dt.strftime('%Y-%m-%dT%H:%M:%S+08:00')
+### PAGE REGIONS
+# regions of each type of page that the parse functions use,
+# only these are parsed if partial parsing is enabled (utility.set_partial_parsing)
+PAGE_REGIONS = {
+    'anime': utility.page_regions(
+        ('meta', 'property', 'og:title'),
+        ('meta', 'property', 'og:url'),
+        ('meta', 'property', 'og:description'),
+        ('div', 'class', 'leftside'),                           # side bar with the dark_text sections
+        ('table', 'class', 'anime_detail_related_anime')
+    ),
+    'episode': utility.page_regions(('tr', 'class', 'episode-list-data'), ('div', 'class', 'pagination')),
+    'stats': utility.page_regions(('div', 'class', 'spaceit_pad'), ('table', 'class', 'score-stats')),
+    'characters': utility.page_regions(('div', 'class', 'js-scrollfix-bottom-rel')),    # characters and staff tables
+}
+
+### FIELDS
+# fields of get_anime_info that are on subpages, by subpage (see FULL_INFO_PAGES)
+SUBPAGE_FIELDS = {'episode_info': 'episode', 'stats': 'stats', 'characters': 'characters', 'staff': 'characters'}
+# fields that are always returned (they cost nothing extra)
+ID_FIELDS = ['mal_id', 'url', 'retrieved_on']
+# regions of the anime page that fields which are not side bar sections are parsed from,
+# every other field is a side bar section (e.g. score, members, genres)
+FIELD_REGIONS = {
+    'url': [('meta', 'property', 'og:url')],
+    'synopsis': [('meta', 'property', 'og:description')],
+    'related': [('table', 'class', 'anime_detail_related_anime')],
+}
+SIDEBAR_REGIONS = [('div', 'class', 'leftside'), ('meta', 'property', 'og:title')]     # og:title: english fallback
+# side bar sections of anime pages (dark_text names, lowercase)
+SIDEBAR_FIELDS = ['synonyms', 'japanese', 'english', 'german', 'spanish', 'french', 'type', 'episodes', 'status',
+                  'aired', 'premiered', 'broadcast', 'producers', 'licensors', 'studios', 'source', 'genre', 'genres',
+                  'theme', 'themes', 'demographic', 'demographics', 'duration', 'rating', 'score', 'ranked',
+                  'popularity', 'members', 'favorites']
+# every field of get_anime_info (with full=True)
+ANIME_FIELDS = sorted(set(ID_FIELDS) | set(FIELD_REGIONS) | set(SIDEBAR_FIELDS) | set(SUBPAGE_FIELDS))
 
 ### FUNCTIONS
-def get_anime_info(url, full=False):
+def get_anime_info(url, full=False, fields=None):
     '''
     Gets anime information from mal anime url.
 
     Parameters:
         url [string]: mal anime url (https://myanimelist.net/anime/...)
         full [bool] [defualt=False]: indicate whether to get additional information (episodes, mal statistics)
+        fields [list] [default=None]: only get these fields (e.g. ['score', 'members']), only the pages and
+            sections they are on are fetched and parsed (see get_anime_fields); full is ignored if given
 
     Returns
         info [dict]: mal anime information
     '''
-    # TODO change full option to dict option, as add on (so check if is boolean or dict)
+    if fields is not None:
+        return get_anime_fields(url, fields)
+
+    with metrics.scraping(url):
+        soup = utility.get_soup(url, regions=PAGE_REGIONS['anime'])
+        info = parse_anime_info(soup, url)
+
+        if full:
+            info.update(replace_unavailable(get_full_info(info['url'])))
+
+    return info
+
+
+def parse_anime_info(soup, url, fields=None):
+    '''
+    Parses anime information from a mal anime page.
+
+    Parameters:
+        soup [bs4.BeautifulSoup]: soup of a mal anime page
+        url [string]: mal anime url (https://myanimelist.net/anime/...)
+        fields [set] [default=None]: only parse these fields (and ID_FIELDS), all fields if not given
 
-    soup = utility.get_soup(url)
+    Returns
+        info [dict]: mal anime information
+    '''
     info = {}
+    wanted = None if fields is None else set(fields) | set(ID_FIELDS)
+    start = metrics.now()
 
     ### BASIC ANIME INFO
     ## META INFO -START
-    mal_id = url[url.find('/anime/')+1:].split('/')[1]
+    mal_id = utility.parse_mal_url(url).mal_id
     info['mal_id'] = mal_id
 
     title = soup.find('meta', property='og:title')
-    title['url'] = title['content'].strip()
+    if title:
+        title['url'] = title['content'].strip()
 
     url_tag = soup.find('meta', property="og:url")
     if url_tag:
@@ -44,26 +116,32 @@ def get_anime_info(url, full=False):
     else:
         info['url'] = url
 
-    synopsis_tag = soup.find('meta', property="og:description")
-    if synopsis_tag:
-        synopsis = synopsis_tag['content']
-        # removes default last line
-        synopsis = synopsis.replace("[Written by MAL Rewrite]", "")
-        info['synopsis'] = synopsis.strip()
-    else:
-        info['synopsis'] = ""
+    if wanted is None or 'synopsis' in wanted:
+        synopsis_tag = soup.find('meta', property="og:description")
+        if synopsis_tag:
+            synopsis = synopsis_tag['content']
+            # removes default last line
+            synopsis = synopsis.replace("[Written by MAL Rewrite]", "")
+            info['synopsis'] = synopsis.strip()
+        else:
+            info['synopsis'] = ""
+    metrics.observe_since('extract.meta', start)
     ### META INFO -END
 
     ### WEBPAGE INFO -START
     # CONSIDER skipping iteration as needed - test timing
     # dark_text spans are what comes before the value (e.g. Score: xxx <-- score text in dark_text span)
-    dark_text_tags = soup.find_all("span", {"class": "dark_text"})
+    start = metrics.now()
+    sidebar_wanted = wanted is None or bool(wanted - set(FIELD_REGIONS) - set(ID_FIELDS))
+    dark_text_tags = soup.find_all("span", {"class": "dark_text"}) if sidebar_wanted else []
     for tag in dark_text_tags:
         # SECTIONS: (alternative titles) english, synonyms, japanese
         #           (information) type, episodes
         section_name = tag.text.lower()
         if section_name[-1] == ":":
             section_name = section_name[:-1]
+        if wanted is not None and section_name not in wanted:
+            continue
         # print("section name : {}".format(section_name))
 
         span_parent = tag.parent
@@ -90,41 +168,30 @@ def get_anime_info(url, full=False):
             values = values[0]
             if section_name == 'synonyms':
                 values = values.split(',')
-            if section_name in ["episodes", "popularity", "members", "favorites"]:
-                values = re.sub(r'[#,]', '', values)
-                try:
-                    values = int(values)
-                except ValueError:
-                    if values.lower() == "unknown":
-                        values = None
+        # numbers (episodes, members etc.), score and rank are kept as strings, parsed by normalize.normalize_records
 
         if section_name == "score":
-            score = {}
-            for v in values:
-                try:
-                    # WARNING: might cause issues if less than 10 people scored the anime
-                    if float(v) <= 10:
-                        score['score'] = float(v)
-                    else:
-                        score['scored_by'] = int(v)
-                except ValueError:
-                    continue
-            values = score
+            # ratingValue / ratingCount if the page has them, otherwise told apart by their form (see normalize.split_score)
+            rating = span_parent.find(itemprop="ratingValue")
+            rating_count = span_parent.find(itemprop="ratingCount")
+            if rating or rating_count:
+                values = {'score': rating.text if rating else None,
+                          'scored_by': rating_count.text if rating_count else None}
 
         elif section_name == "ranked":
-            top_anime_rank = tag.nextSibling
-            if top_anime_rank.strip().lower() == "n/a":
-                values = None
-            else:
-                values = top_anime_rank
-                # change rank string to int (e.g. #7 to just 7)
-                values = int(re.sub(r'\D', '', values))
+            # rank string (e.g. #7), N/A if the anime is not ranked
+            values = str(tag.nextSibling)
 
         info[section_name] = values
+    metrics.observe_since('extract.sidebar', start)
     ### WEBPAGE INFO -END
 
     ### RELATED ANIME -START
-    related_anime_table = soup.find('table', {'class': 'anime_detail_related_anime'})
+    start = metrics.now()
+    if wanted is None or 'related' in wanted:
+        related_anime_table = soup.find('table', {'class': 'anime_detail_related_anime'})
+    else:
+        related_anime_table = None
     if related_anime_table:
         related_anime_info = []
         related_anime_rows = related_anime_table.find_all('tr')
@@ -141,32 +208,13 @@ def get_anime_info(url, full=False):
             })
         info['related'] = related_anime_info
     else: info['related'] = None
+    metrics.observe_since('extract.related', start)
     ### RELATED ANIME -END
 
-    if full:
-        # get anime episodes
-        try:
-            eps = get_anime_episodes("{}/episode".format(info['url']))
-            info["episode_info"] = eps
-        except Bs4Error:
-            info["episode_info"] = []
-
-        # get anime stats
-        stats = get_mal_stats("{}/stats".format(info['url']))
-        info["stats"] = stats
-
-        # get anime characters
-        characters = get_anime_characters("{}/characters".format(info['url']))
-        info["characters"] = characters
-
-        # get anime staff
-        staff = get_anime_staff("{}/characters".format(info['url']))
-        info["staff"] = staff
-
     ### POST-PROC BEFORE RETURN - START
     # if no english title in left side bar, use meta tag
-    if not 'english' in info:
-        info['english'] = soup.find('meta', property="og:title")['content']
+    if not 'english' in info and title:
+        info['english'] = title['content']
 
     # trim leading and trailing white spaces from synonyms
     if not 'synonyms' in info:
@@ -176,22 +224,97 @@ def get_anime_info(url, full=False):
     ### POST-PROC BEFORE RETURN - END
 
     # add timestamp
-    info['retrieved_on'] = timestamp
+    info['retrieved_on'] = utility.get_timestamp()
+
+    if wanted is not None:
+        info = {field: value for field, value in info.items() if field in wanted}
+
+    return normalize.normalize_record(info)
+
+
+def replace_unavailable(info):
+    '''
+    Replaces values that indicate unavailability ("Unknown", "N/A", empty lists etc.) with None (changes the input info).
+    See normalize.replace_unavailable, which does this for many records at once.
+
+    Parameters:
+        info [dict]: scraped information
+
+    Returns
+        info [dict]: scraped information
+    '''
+    normalize.replace_unavailable([info])
+    return info
 
-    for k,v in info.items():
-        # if string is of values in array, replace with None OR
-        # if list is empty, replace with None OR
-        # if list is empty, replace with None
-        if (type(v) is str and v.strip().lower() in ['unknown', 'n/a', 'none', 'add some', 'na']) or (type(v) is list and len(v)<1) or (type(v) is dict and not v):
-            # print('replace {}: {}, {}'.format(type(v),k,v))
-            info[k] = None
 
+async def aget_anime_info(url, full=False, fields=None):
+    '''
+    Async variant of get_anime_info, runs it on a worker thread so the event loop is not blocked.
+
+    Parameters:
+        url [string]: mal anime url (https://myanimelist.net/anime/...)
+        full [bool] [defualt=False]: indicate whether to get additional information (episodes, mal statistics)
+        fields [list] [default=None]: only get these fields (see get_anime_info)
+
+    Returns
+        info [dict]: mal anime information
+    '''
+    return await fetcher.run_async(get_anime_info, url, full=full, fields=fields)
+
+
+def get_anime_fields(url, fields):
+    '''
+    Gets selected fields of anime information from mal anime url. Only the pages the fields are on are
+    fetched (e.g. only /stats for ['stats']), and of the anime page only the regions and side bar sections
+    the fields are in are parsed (e.g. only the side bar for ['score', 'members']).
+
+    Parameters:
+        url [string]: mal anime url (https://myanimelist.net/anime/...)
+        fields [list]: fields of get_anime_info to get (side bar sections by their name, e.g. 'score',
+            'members', 'genres', and 'synopsis', 'related', 'episode_info', 'stats', 'characters', 'staff')
+
+    Returns
+        info [dict]: the fields that were found, and mal_id, url and retrieved_on (ID_FIELDS)
+    '''
+    fields = set(fields)
+    subpages = []
+    for field in fields:
+        if field in SUBPAGE_FIELDS and SUBPAGE_FIELDS[field] not in subpages:
+            subpages.append(SUBPAGE_FIELDS[field])
+    page_fields = fields - set(SUBPAGE_FIELDS) - set(ID_FIELDS)
+
+    with metrics.scraping(url):
+        # subpage urls are made from the url with the title (/anime/<mal id>/<title>/<subpage>),
+        # the anime page gives it if the url has no title
+        canonical = utility.parse_mal_url(url).url or url
+        has_title = len(canonical.split('/')) > 5
+        futures = []
+        if subpages and has_title:
+            futures = [fetcher.submit(get_subpage_info, canonical, page) for page in subpages]
+
+        if page_fields or not has_title:
+            regions = list(FIELD_REGIONS['url'])
+            for field in page_fields:
+                for region in FIELD_REGIONS.get(field, SIDEBAR_REGIONS):
+                    if region not in regions:
+                        regions.append(region)
+            soup = utility.make_soup(utility.get_html(utility.get_page(url)), regions=utility.page_regions(*regions))
+            info = parse_anime_info(soup, url, fields=page_fields)
+        else:
+            info = {'mal_id': utility.parse_mal_url(url).mal_id, 'url': canonical,
+                    'retrieved_on': utility.get_timestamp()}
+
+        if subpages and not has_title:
+            futures = [fetcher.submit(get_subpage_info, info['url'], page) for page in subpages]
+        for future in futures:
+            info.update(replace_unavailable({field: value for field, value in future.result().items()
+                                             if field in fields}))
     return info
 
 
 def get_anime_episodes(url):
     '''
-    Gets anime episodes information from mal anime url.
+    Gets anime episodes information from mal anime url (all episode pages, see iter_anime_episodes).
 
     Parameters:
         url [string]: mal anime episode url (https://myanimelist.net/anime/<mal_anime_id>/episode)
@@ -199,27 +322,115 @@ def get_anime_episodes(url):
     Returns
         eps [list]: contains each episode as its own individual dict object
     '''
-    soup = utility.get_soup(url)
+    return list(iter_anime_episodes(url))
+
 
-    eps = []
+def iter_anime_episodes(url, prefetch=True, parse_page=None):
+    '''
+    Yields anime episodes information from mal anime url, one episode at a time.
+
+    Long-running series split their episodes over several pages (100 episodes each, ?offset=100, ...).
+    The pages are followed one after the other, and only the page being parsed is held in memory.
+    With prefetch, the next page is fetched on the shared executor while the current one is parsed.
+
+    Parameters:
+        url [string]: mal anime episode url (https://myanimelist.net/anime/<mal_anime_id>/episode)
+        prefetch [bool] [default=True]: fetch the next page while the current one is parsed
+            (must be False when called from a task on the shared executor)
+        parse_page [callable] [default=None]: function (page type, url, html -> (eps, next page url)) to parse
+            each page with, instead of parsing it in this thread (e.g. pipeline.ParsePool.parse)
+
+    Returns
+        eps [generator]: yields each episode as its own individual dict object
+    '''
+    page_url = url
+    webpage = utility.get_page(page_url)
+    while True:
+        if parse_page is None:
+            soup = utility.make_soup(utility.get_html(webpage), regions=PAGE_REGIONS['episode'] if utility.partial_parsing else None)
+            next_page = parse_next_episode_page(soup)
+        else:
+            eps, next_page = parse_page('episode_page', page_url, utility.get_html(webpage))
+        webpage = None
+
+        if next_page is not None:
+            next_page = urljoin(page_url, next_page)
+            if prefetch:
+                future = fetcher.submit(utility.get_page, next_page)
+
+        if parse_page is None:
+            for row in soup.find_all("tr", class_ = "episode-list-data"):
+                yield parse_episode_row(row)
+            soup = None
+        else:
+            yield from eps
+
+        if next_page is None:
+            return
+        page_url = next_page
+        webpage = future.result() if prefetch else utility.get_page(page_url)
+
+
+def parse_anime_episodes(soup):
+    '''
+    Parses anime episodes information from a mal anime episode page.
+
+    Parameters:
+        soup [bs4.BeautifulSoup]: soup of a mal anime episode page (https://myanimelist.net/anime/<mal_anime_id>/episode)
+
+    Returns
+        eps [list]: contains each episode as its own individual dict object
+    '''
     ep_rows = soup.find_all("tr", class_ = "episode-list-data")
-    for row in ep_rows:
-        ep_num = row.find("td", class_ = "episode-number").text
-        titles = row.find("td", class_ = "episode-title")
-        title_link = titles.find("a")
-        ep_url = title_link["href"]
-        eng_title = title_link.text.strip()
-        jap_title = titles.find("span").text.strip()
-        aired = row.find("td", class_="episode-aired").text.strip()
-
-        eps.append({
-            "ep_num": int(ep_num),
-            "eng_title": eng_title,
-            "jap_title": jap_title,
-            "aired": aired,
-            "url": ep_url
-        })
-    return eps
+    return [parse_episode_row(row) for row in ep_rows]
+
+
+def parse_episode_page(soup):
+    '''
+    Parses one page of a mal anime episode list (see iter_anime_episodes).
+
+    Parameters:
+        soup [bs4.BeautifulSoup]: soup of a mal anime episode page
+
+    Returns
+        eps [list]: contains each episode as its own individual dict object
+        next_page [string]: url of the next episode page (None if this is the last page)
+    '''
+    return parse_anime_episodes(soup), parse_next_episode_page(soup)
+
+
+def parse_next_episode_page(soup):
+    '''
+    Returns the url of the next page of a mal anime episode list (None if it is the last page).
+    '''
+    pagination = soup.find("div", class_ = "pagination")
+    if pagination is None:
+        return None
+    current = pagination.find("a", class_ = "current")
+    next_link = current.find_next_sibling("a") if current else None
+    return next_link["href"] if next_link else None
+
+
+@metrics.timed('extract.episode_row')
+def parse_episode_row(row):
+    '''
+    Parses an episode row (tr.episode-list-data) of a mal anime episode page.
+    '''
+    ep_num = row.find("td", class_ = "episode-number").text
+    titles = row.find("td", class_ = "episode-title")
+    title_link = titles.find("a")
+    ep_url = title_link["href"]
+    eng_title = title_link.text.strip()
+    jap_title = titles.find("span").text.strip()
+    aired = row.find("td", class_="episode-aired").text.strip()
+
+    return {
+        "ep_num": int(ep_num),
+        "eng_title": eng_title,
+        "jap_title": jap_title,
+        "aired": aired,
+        "url": ep_url
+    }
 
 
 def get_mal_stats(url):
@@ -233,7 +444,22 @@ def get_mal_stats(url):
         stats (dict): mal stats
     '''
 
-    soup = utility.get_soup(url)
+    soup = utility.get_soup(url, regions=PAGE_REGIONS['stats'])
+    return parse_mal_stats(soup)
+
+
+@metrics.timed('extract.stats')
+def parse_mal_stats(soup):
+    '''
+    Parses anime mal stats information from a mal anime stats page.
+
+    Parameters:
+        soup (bs4.BeautifulSoup): soup of a mal anime stats page (https://myanimelist.net/anime/<anime_id>/stats)
+
+    Returns
+        stats (dict): mal stats
+    '''
+
     stats = {}
     divs = soup.find_all("div", class_="spaceit_pad")
     for d in divs:
@@ -272,7 +498,22 @@ def get_anime_characters(url):
         characters (dict): mal anime characters' information
     '''
 
-    soup = utility.get_soup(url)
+    soup = utility.get_soup(url, regions=PAGE_REGIONS['characters'])
+    return parse_anime_characters(soup)
+
+
+@metrics.timed('extract.characters')
+def parse_anime_characters(soup):
+    '''
+    Parses anime characters' information from a mal anime characters page.
+
+    Parameters:
+        soup (bs4.BeautifulSoup): soup of a mal anime characters page (https://myanimelist.net/anime/<mal anime id>/characters)
+
+    Returns
+        characters (dict): mal anime characters' information
+    '''
+
     # print(soup.prettify())
     characters = []
     h2_headers = soup.find_all('h2')
@@ -300,7 +541,7 @@ def get_anime_characters(url):
                         seiyuu_lang = cell.find("small")
                         if not seiyuu_lang:
                             continue
-                        seiyuu_lang = seiyuu_lang.contents[0]
+                        seiyuu_lang = str(seiyuu_lang.contents[0])
                         # print("\t{}".format(cell))
                         # print("\t{} [{}]".format(seiyuu_name, seiyuu_lang))
                         # print("\t{}".format(seiyuu_url))
@@ -327,7 +568,22 @@ def get_anime_staff(url):
         staff (dict): mal anime staff information
     '''
 
-    soup = utility.get_soup(url)
+    soup = utility.get_soup(url, regions=PAGE_REGIONS['characters'])
+    return parse_anime_staff(soup)
+
+
+@metrics.timed('extract.staff')
+def parse_anime_staff(soup):
+    '''
+    Parses anime staff information from a mal anime characters page.
+
+    Parameters:
+        soup (bs4.BeautifulSoup): soup of a mal anime characters page (https://myanimelist.net/anime/<mal anime id>/characters)
+
+    Returns
+        staff (dict): mal anime staff information
+    '''
+
     # print(soup.prettify())
     staff = []
     h2_headers = soup.find_all('h2')
@@ -362,69 +618,84 @@ def get_anime_staff(url):
     return staff
 
 
-def get_character_info(url):
+# subpages of an anime url that are scraped with full=True, and the (info key, parse function)
+# pairs that run on each of them; a subpage is fetched and parsed once, even if several need it
+# and all subpages are fetched at the same time
+FULL_INFO_PAGES = {
+    'episode': [('episode_info', parse_anime_episodes)],
+    'stats': [('stats', parse_mal_stats)],
+    'characters': [('characters', parse_anime_characters), ('staff', parse_anime_staff)],
+}
+
+def get_full_info(url, parse_page=None):
     '''
-    get character info (from anime mal url)
+    Gets the additional anime information (episodes, mal statistics, characters, staff) from
+    the subpages of a mal anime url. The subpages are fetched concurrently.
+
+    Parameters:
+        url [string]: mal anime url (https://myanimelist.net/anime/<mal anime id>/<anime name>)
+        parse_page [callable] [default=None]: see get_subpage_info
+
+    Returns
+        info [dict]: additional anime information (keys: episode_info, stats, characters, staff)
     '''
-    # TODO: get picture
+    futures = [fetcher.submit(get_subpage_info, url, page, parse_page) for page in FULL_INFO_PAGES]
+
     info = {}
-    soup = utility.get_soup(url)
-
-    ### METADATA
-    # url
-    mal_url = soup.find("meta", property="og:url")['content']
-    info['url'] = mal_url
-    # mal character id
-    mal_id = url[url.find("/character/")+1:].split("/")[1]
-    info["mal_id"] = mal_id
-    # get character nickname(s)
-    name_h1 = soup.find('h1', class_="title-name")
-    if name_h1:
-        name_h1 = name_h1.find('strong').text
-        if name_h1:
-            nicknames = re.findall(r'"([^"]*)"', name_h1)
-        else:
-            nicknames = []
+    for future in futures:
+        info.update(future.result())
+    return info
+
+
+def get_subpage_info(url, page, parse_page=None):
+    '''
+    Gets the information from one subpage of a mal anime url (see FULL_INFO_PAGES).
+
+    Parameters:
+        url [string]: mal anime url (https://myanimelist.net/anime/<mal anime id>/<anime name>)
+        page [string]: subpage name (key of FULL_INFO_PAGES)
+        parse_page [callable] [default=None]: function (page, subpage url, html -> info) to parse the
+            subpage with, instead of parsing it in this thread (e.g. pipeline.ParsePool.parse)
+
+    Returns
+        info [dict]: information parsed from subpage, by info key
+    '''
+    parsers = FULL_INFO_PAGES[page]
+    subpage_url = "{}/{}".format(url, page)
+    if page == 'episode':
+        # follows the episode pagination, without prefetching as this runs on the shared executor
+        episodes = iter_anime_episodes(subpage_url, prefetch=False, parse_page=parse_page)
+        try:
+            # the first page is fetched by the first episode
+            first = next(episodes, None)
+        except Bs4Error:
+            # not every anime has an episode page (e.g. movies), errors of later pages fail the item
+            return {key: [] for key, parse in parsers}
+        return {'episode_info': ([first] if first is not None else []) + list(episodes)}
+
+    if parse_page is None:
+        soup = utility.get_soup(subpage_url, regions=PAGE_REGIONS[page])
     else:
-        nicknames = []
-    info['nicknames'] = nicknames
-
-    ### INFO PANEL (left-side of page)
-    info_panel = soup.find(id='content')
-    info_panel_text = info_panel.text.lower()
-    # get member faves
-    partial = info_panel_text[info_panel_text.find('member favorites'):]
-    member_faves = partial.split('\n')[0]
-    member_faves = member_faves.split(':')[1]
-    member_faves = int(re.sub(r'\D', '', member_faves))  # replace non-digits with ''
-    info['member_faves'] = member_faves
-
-    ### MAIN CONTENTS
-    # get name header (h2)
-    name_h2 = soup.find('h2', class_='normal_header')
-    jap_name = name_h2.find('small').text
-    jap_name = re.sub('[()]', '', jap_name)     # replace () with ''
-    name_h2 = utility.remove_children(name_h2)
-    eng_name = name_h2.text.strip()
-    info['eng_name'] = eng_name
-    info['jap_name'] = jap_name
-
-    # here comes the tricky part: height, birthday, weight
-    first_line_only = name_h2.nextSibling   # oh here comes danger; wth is this design
-    body_text = first_line_only.nextSibling
-    # print(body_text)
-    main_text = body_text.contents
-    main_text.insert(0, first_line_only)
-    # only keep elements that are NavigableString, not just return/new lines and has ":"
-    main_text = [e for e in main_text if type(e) is NavigableString and len(e.strip()) > 0 and ":" in e]
-    for e in main_text:
-        parts = e.split(':')
-        info_label = parts[0].strip().lower()
-        info_detail = parts[1].strip().lower()
-        # birthdate
-        if 'birth' in info_label: info['birthdate'] = info_detail
-        if 'height' in info_label: info['height'] = info_detail
+        webpage = utility.get_page(subpage_url)
+
+    if parse_page is not None:
+        return parse_page(page, subpage_url, utility.get_html(webpage))
+    return {key: parse(soup) for key, parse in parsers}
+
 
+def get_character_info(url):
+    '''
+    get character info (from anime mal url)
+
+    Same as character.get_character_info, with the birthdate and height of its details (lower case)
+    as fields of their own, as this function returned them.
+    '''
+    info = character.get_character_info(url)
+    for label, value in (info.get('details') or {}).items():
+        if 'birth' in label.lower():
+            info['birthdate'] = value.lower()
+        if 'height' in label.lower():
+            info['height'] = value.lower()
     return info
 
 
@@ -440,7 +711,14 @@ if __name__ == '__main__':
     # positional arguments
     ap.add_argument('input', help='mal ANIME url')
 
+    # optional arguments
+    ap.add_argument('--fields', help='only get these fields, comma separated (e.g. score,members,stats)')
+
     args = vars(ap.parse_args())
+    fields = [field.strip() for field in args['fields'].split(',') if field.strip()] if args['fields'] else None
+    unknown = sorted(set(fields or []) - set(ANIME_FIELDS))
+    if unknown:
+        ap.error('unknown fields: {} (fields: {})'.format(', '.join(unknown), ', '.join(ANIME_FIELDS)))
 
     # input validation
     if utility.get_mal_type(args['input']) is not 'anime':
@@ -448,8 +726,9 @@ if __name__ == '__main__':
         sys.stdout.write(RESET)
         sys.exit()
     try: 
-        data = get_anime_info(args['input'], full=False)
+        data = get_anime_info(args['input'], full=False, fields=fields)
 
+        timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S+08:00')
         output_filename = 'output_{}.json'.format(re.sub(r'\W', '', timestamp))
         utility.save_json(data, output_filename)
         print('{}information saved to file: {}'.format(GREEN, output_filename))
@@ -0,0 +1,360 @@
+'''
+Functions and CLI for scraping many mal anime/character urls in one run.
+
+Input is read from a file (or stdin), one mal url or mal id per line, and/or discovered from season
+pages, top anime pages or ranges of mal ids (see discovery.py). Each item is dispatched to
+its scraper by utility.get_mal_type and run on a bounded worker pool, with a global limit on
+requests per second. Finished items are recorded in a checkpoint file, so a crashed batch can be
+resumed without scraping them again. In incremental mode (see incremental.py), only the fields
+that changed since the last run are output.
+'''
+
+import re
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import utility
+import fetcher
+import metrics
+import anime
+import character
+from sink import JsonLinesSink
+from cache import ResponseCache
+import pipeline
+from pipeline import ParsePool
+from incremental import SnapshotStore, IncrementalScraper
+from timeseries import TimeSeriesStore
+from entity_store import EntityStore
+import discovery
+from discovery import NotFoundCache
+
+MAL_URL_FORMAT = 'https://myanimelist.net/{}/{}'
+PROGRESS_INTERVAL = 10      # seconds between progress reports
+
+### FUNCTIONS
+def read_items(lines, default_type='anime'):
+    '''
+    Reads batch items from lines of mal urls or mal ids (blank lines and lines starting with # are skipped).
+
+    Parameters:
+        lines [iterable]: lines of input (e.g. open file, sys.stdin)
+        default_type [string] [default='anime']: mal type of lines that are only an id ('anime' or 'character')
+
+    Returns
+        items [generator]: mal urls
+    '''
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.isdigit():
+            line = MAL_URL_FORMAT.format(default_type, line)
+        yield line
+
+
+def scrape(url, full=False):
+    '''
+    Scrapes a mal url with the scraper matching its type.
+
+    Parameters:
+        url [string]: mal anime or character url
+        full [bool] [default=False]: passed on to anime.get_anime_info
+
+    Returns
+        mal_type [string]: type of mal url ('anime' or 'character')
+        info [dict]: scraped information
+    '''
+    mal_type = utility.get_mal_type(url)
+    if mal_type == 'anime':
+        return mal_type, anime.get_anime_info(url, full=full)
+    if mal_type == 'character':
+        return mal_type, character.get_character_info(url)
+    raise ValueError('{} is not a mal anime or character url'.format(url))
+
+
+class Checkpoint:
+    '''
+    Append-only record of finished batch items (one json object per line).
+
+    Parameters:
+        path [string]: path of checkpoint file (created if it does not exist)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line can be cut short if the batch crashed while writing it
+                        continue
+                    if entry.get('ok'):
+                        self.done.add(entry['url'])
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, url, ok, error=None):
+        '''
+        Records a finished item.
+
+        Parameters:
+            url [string]: item url
+            ok [bool]: whether the item was scraped successfully
+            error [string] [default=None]: error message of failed item
+        '''
+        entry = {'url': url, 'ok': ok}
+        if error:
+            entry['error'] = error
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            if ok:
+                self.done.add(url)
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(urls, on_result, workers=4, full=False, checkpoint=None, progress=None, record_done=True, scraper=scrape,
+              priority=fetcher.BATCH):
+    '''
+    Scrapes mal urls on a bounded pool of worker threads.
+    A failing item is recorded (and reported to on_result) without stopping the batch.
+
+    Parameters:
+        urls [iterable]: mal anime/character urls
+        on_result [callable]: called with (url, mal_type, info, error) for every finished item,
+            info is None and error is the exception if the item failed
+        workers [int] [default=4]: number of worker threads
+        full [bool] [default=False]: passed on to anime.get_anime_info
+        checkpoint [Checkpoint] [default=None]: checkpoint to skip finished items with and record items in
+        progress [callable] [default=None]: called with (done, failed, skipped, elapsed seconds) every PROGRESS_INTERVAL seconds
+        record_done [bool] [default=True]: record items in checkpoint once on_result returns, set to False if
+            on_result records them itself (e.g. once the buffered output is written to disk)
+        scraper [callable] [default=scrape]: function (url, full -> mal_type, info) that scrapes an item
+            (e.g. ParsePool.scrape to parse pages on worker processes)
+        priority [int] [default=fetcher.BATCH]: priority of the requests of the batch, so that interactive
+            lookups sharing the fetcher go first (see fetcher.priority)
+
+    Returns
+        counts [dict]: number of items that were done, failed and skipped
+    '''
+    counts = {'done': 0, 'failed': 0, 'skipped': 0}
+    futures = {}
+    start = last_report = time.monotonic()
+
+    def scrape_item(url):
+        with fetcher.priority(priority):
+            return scraper(url, full)
+
+    def finish(future):
+        url = futures.pop(future)
+        try:
+            mal_type, info = future.result()
+        except Exception as e:
+            counts['failed'] += 1
+            if checkpoint:
+                checkpoint.record(url, False, '{}: {}'.format(type(e).__name__, e))
+            on_result(url, None, None, e)
+            return
+        counts['done'] += 1
+        on_result(url, mal_type, info, None)
+        if checkpoint and record_done:
+            checkpoint.record(url, True)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mal-batch') as executor:
+        for url in urls:
+            if checkpoint and url in checkpoint.done:
+                counts['skipped'] += 1
+                continue
+            # only keep a few items per worker queued, so that huge inputs are not loaded all at once
+            while len(futures) >= workers * 2:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future)
+            futures[executor.submit(scrape_item, url)] = url
+
+            now = time.monotonic()
+            if progress and now - last_report >= PROGRESS_INTERVAL:
+                progress(counts['done'], counts['failed'], counts['skipped'], now - start)
+                last_report = now
+
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                finish(future)
+
+    if progress:
+        progress(counts['done'], counts['failed'], counts['skipped'], time.monotonic() - start)
+    return counts
+
+
+if __name__ == '__main__':
+    # cmd line colours
+    RESET = '\033[0;0m'
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+
+    ap = argparse.ArgumentParser(description='scrape many mal anime/character urls or ids')
+
+    # positional arguments
+    ap.add_argument('input', nargs='?', help='file with one mal url or id per line ("-" to read from stdin), optional with --season, --top or --ids')
+
+    # optional arguments
+    ap.add_argument('--type', default='anime', choices=['anime', 'character'], help='mal type of lines that are only an id')
+    ap.add_argument('--full', action='store_true', help='get additional anime information (episodes, stats, characters, staff)')
+    ap.add_argument('--workers', type=int, default=4, help='number of worker threads')
+    ap.add_argument('--processes', type=int, default=0, help='parse pages on this many worker processes (0: parse in the worker threads)')
+    ap.add_argument('--rps', type=float, default=1.0, help='max requests per second, across all workers')
+    ap.add_argument('--endpoint-limits', default='', help='max requests in flight by page type, e.g. stats=1,characters=2')
+    ap.add_argument('--out', default='.', help='directory to save output files in')
+    ap.add_argument('--format', default='jsonl', choices=['jsonl', 'json'], help='jsonl: append records to rotating .jsonl files, json: one json file per record')
+    ap.add_argument('--compress', choices=['gzip', 'zstd'], help='compression of jsonl files')
+    ap.add_argument('--checkpoint', help='checkpoint file, finished items in it are skipped (resumes a crashed batch)')
+    ap.add_argument('--cache', help='response cache database, pages are served from it until they expire')
+    ap.add_argument('--offline', action='store_true', help='only use pages from --cache, never request myanimelist (e.g. to re-parse an old crawl)')
+    ap.add_argument('--timeseries', help='time-series store directory, the daily changing stats of every anime are added to it (see timeseries.py)')
+    ap.add_argument('--index', help='entity store database, every scraped item is added to it (see entity_store.py)')
+    ap.add_argument('--metrics-port', type=int, help='serve stage timings and counters as Prometheus text at http://localhost:<port>/metrics')
+    ap.add_argument('--metrics-interval', type=float, help='write a summary of stage timings and counters to stderr every this many seconds')
+    ap.add_argument('--profile-rate', type=float, default=0, help='share of items that are profiled with cProfile (e.g. 0.01)')
+    ap.add_argument('--profile-dir', default='profiles', help='directory to save profiles in')
+    ap.add_argument('--season', action='append', default=[], help='scrape the anime of a season, e.g. 2024/spring (can be given more than once)')
+    ap.add_argument('--top', type=int, help='scrape this many top anime (0: the whole list)')
+    ap.add_argument('--top-type', default='', choices=discovery.TOP_TYPES, help='top anime list of --top (all anime by score if not given)')
+    ap.add_argument('--ids', help='scrape ranges of mal anime ids, e.g. 1-60000 or 1-100,250')
+    ap.add_argument('--not-found', help='database of ids whose page is 404, they are skipped for {} days (see discovery.py)'.format(
+        int(discovery.NOT_FOUND_TTL // discovery.DAY)))
+    ap.add_argument('--incremental', help='snapshot database, only items that changed since their last snapshot are output (as field-level diffs)')
+
+    args = vars(ap.parse_args())
+
+    if args['offline'] and not args['cache']:
+        ap.error('--offline needs --cache')
+    if not args['input'] and not (args['season'] or args['top'] is not None or args['ids']):
+        ap.error('give an input file, or discover anime with --season, --top or --ids')
+    try:
+        seasons = [discovery.parse_season(season) for season in args['season']]
+        id_ranges = discovery.parse_id_ranges(args['ids'] or '')
+    except ValueError as e:
+        ap.error(str(e))
+    try:
+        endpoint_limits = {page_type: int(limit) for page_type, limit in
+                           (item.split('=') for item in args['endpoint_limits'].split(',') if item)}
+    except ValueError:
+        ap.error('--endpoint-limits should look like stats=1,characters=2')
+    if args['metrics_port'] or args['metrics_interval'] or args['profile_rate']:
+        metrics.enable(profile_rate=args['profile_rate'], profile_dir=args['profile_dir'])
+        if args['metrics_port']:
+            metrics.start_server(args['metrics_port'])
+        if args['metrics_interval']:
+            metrics.start_summary_log(args['metrics_interval'])
+    response_cache = ResponseCache(args['cache']) if args['cache'] else None
+    fetcher.set_fetcher(fetcher.Fetcher(rate_limit=args['rps'], max_concurrency=args['workers'],
+                                        endpoint_limits=endpoint_limits, cache=response_cache, offline=args['offline']))
+    os.makedirs(args['out'], exist_ok=True)
+    checkpoint = Checkpoint(args['checkpoint']) if args['checkpoint'] else None
+
+    # one sink per mal type, items are only checkpointed once their record is written to disk
+    sinks = {}
+    if args['format'] == 'jsonl':
+        on_flush = (lambda urls: [checkpoint.record(url, True) for url in urls]) if checkpoint else None
+        for mal_type in ['anime', 'character']:
+            sinks[mal_type] = JsonLinesSink(args['out'], prefix=mal_type, compression=args['compress'], on_flush=on_flush)
+
+    not_found = NotFoundCache(args['not_found']) if args['not_found'] else None
+    not_found_count = 0
+
+    def on_result(url, mal_type, info, error):
+        global not_found_count
+        if isinstance(error, utility.PageNotFound):
+            # e.g. unused ids of --ids, not an error of the scraper
+            not_found_count += 1
+            if not_found:
+                not_found.add(url)
+            return
+        if error is not None:
+            sys.stderr.write('{}ERROR: {}: {}{}\n'.format(RED, url, error, RESET))
+            return
+        if info is None:
+            # unchanged since the last snapshot (--incremental), nothing to write
+            if checkpoint and sinks:
+                checkpoint.record(url, True)
+            return
+        if sinks:
+            sinks[mal_type].write(info, key=url)
+        else:
+            output_filename = os.path.join(args['out'], '{}_{}.json'.format(mal_type, re.sub(r'\W', '', info['mal_id'])))
+            utility.save_json(info, output_filename)
+
+    def progress(done, failed, skipped, elapsed):
+        rate = (done + failed) / elapsed if elapsed else 0
+        sys.stderr.write('{} done, {} failed, {} skipped ({:.2f} items/s)\n'.format(done, failed, skipped, rate))
+
+    timeseries_store = TimeSeriesStore(args['timeseries']) if args['timeseries'] else None
+    entity_store = EntityStore(args['index']) if args['index'] else None
+
+    def on_snapshot(mal_type, info):
+        if timeseries_store and mal_type == 'anime':
+            timeseries_store.append(info['mal_id'], info)
+        if entity_store:
+            entity_store.write(mal_type, info)
+
+    parse_pool = ParsePool(args['processes']) if args['processes'] else None
+    scraper = parse_pool.scrape if parse_pool else scrape
+    snapshot_store = SnapshotStore(args['incremental']) if args['incremental'] else None
+    if snapshot_store:
+        scraper = IncrementalScraper(snapshot_store, parse_pool.parse if parse_pool else pipeline.parse_page,
+                                     on_snapshot=on_snapshot if timeseries_store or entity_store else None).scrape
+    elif timeseries_store or entity_store:
+        scrape_item = scraper
+
+        def scraper(url, full=False):
+            mal_type, info = scrape_item(url, full)
+            on_snapshot(mal_type, info)
+            return mal_type, info
+    source = None
+    if args['input']:
+        source = sys.stdin if args['input'] == '-' else open(args['input'], encoding='utf-8')
+    items = itertools.chain(read_items(source, args['type']) if source else [],
+                            discovery.discover(seasons, args['top'], args['top_type'], id_ranges))
+    if not_found:
+        items = not_found.filter(items)
+    try:
+        counts = run_batch(items, on_result, workers=args['workers'],
+                           full=args['full'], checkpoint=checkpoint, progress=progress, record_done=not sinks,
+                           scraper=scraper)
+        counts['failed'] -= not_found_count
+        colour = GREEN if counts['failed'] == 0 else RED
+        print('{}batch finished: {} done, {} failed, {} skipped, {} not found'.format(
+            colour, counts['done'], counts['failed'], counts['skipped'], not_found_count))
+        if not_found and not_found.skipped:
+            print('{} ids skipped, their page was 404 in the last {} days'.format(
+                not_found.skipped, int(not_found.ttl // discovery.DAY)))
+    finally:
+        if parse_pool:
+            parse_pool.close()
+        if snapshot_store:
+            snapshot_store.close()
+        if entity_store:
+            entity_store.close()
+        for output_sink in sinks.values():
+            output_sink.close()
+        if checkpoint:
+            checkpoint.close()
+        if not_found:
+            not_found.close()
+        if response_cache:
+            # writes the buffered access times of cache hits
+            response_cache.close()
+        if source is not None and source is not sys.stdin:
+            source.close()
+        sys.stdout.write(RESET)
@@ -0,0 +1,102 @@
+'''
+Micro-benchmark of the normalization of scraped records (normalize.py).
+
+Builds raw anime records like the side bar of anime pages gives them (number strings like '#1,234,567'
+with some 'Unknown', raw scores, repeating strings like 'TV'), and measures the time per record to
+normalize them: with the previous per-record parsing (re.sub and int of every value, as parse_anime_info
+did), one record at a time with normalize_record (as the scrapers do), and column by column with
+normalize_records, in python and, if numpy is installed, with the number columns parsed by numpy.
+
+Usage:
+    python benchmarks/bench_normalize.py [--records 200000]
+'''
+
+import os
+import re
+import sys
+import copy
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import normalize
+
+def previous_normalize(info):
+    # number parsing of anime.parse_anime_info before normalize.py
+    for field in ['episodes', 'popularity', 'members', 'favorites']:
+        values = re.sub(r'[#,]', '', info[field])
+        try:
+            values = int(values)
+        except ValueError:
+            if values.lower() == "unknown":
+                values = None
+        info[field] = values
+    score = {}
+    for v in info['score']:
+        try:
+            if float(v) <= 10:
+                score['score'] = float(v)
+            else:
+                score['scored_by'] = int(v)
+        except ValueError:
+            continue
+    info['score'] = score
+    info['ranked'] = None if info['ranked'].strip().lower() == "n/a" else int(re.sub(r'\D', '', info['ranked']))
+    for k, v in info.items():
+        if (type(v) is str and v.strip().lower() in ['unknown', 'n/a', 'none', 'add some', 'na']) or (type(v) is list and len(v)<1) or (type(v) is dict and not v):
+            info[k] = None
+    return info
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+
+    def number(high):
+        return 'Unknown' if rng.random() < 0.02 else '{:,}'.format(rng.randrange(high))
+
+    return [{
+        'episodes': number(100),
+        'popularity': '#' + number(20000),
+        'members': number(4000000),
+        'favorites': number(200000),
+        'ranked': 'N/A' if rng.random() < 0.1 else '#{:,}'.format(rng.randrange(1, 20000)),
+        'score': ['{:.2f}'.format(rng.uniform(5, 9)), number(2000000)],
+        'type': rng.choice(['TV', 'Movie', 'OVA', 'ONA', 'Special']),
+        'status': rng.choice(['Finished Airing', 'Currently Airing', 'Not yet aired']),
+        'rating': 'PG-13 - Teens 13 or older',
+        'genres': rng.sample(['Action', 'Comedy', 'Drama', 'Fantasy', 'Romance'], 2),
+    } for i in range(count)]
+
+def timed(func, records):
+    records = copy.deepcopy(records)
+    start = time.perf_counter()
+    func(records)
+    return (time.perf_counter() - start) / len(records) * 1e6
+
+def run(count=200000):
+    records = make_records(count)
+    # numpy is imported by the first long column, not timed
+    has_numpy = normalize._get_numpy() is not None
+
+    results = [
+        ('previous (per record)', timed(lambda records: [previous_normalize(info) for info in records], records)),
+        ('normalize_record', timed(lambda records: [normalize.normalize_record(info) for info in records], records)),
+    ]
+    if has_numpy:
+        results.append(('normalize_records (numpy)', timed(normalize.normalize_records, records)))
+    numpy, normalize.numpy = normalize.numpy, None
+    try:
+        results.append(('normalize_records (python)', timed(normalize.normalize_records, records)))
+    finally:
+        normalize.numpy = numpy
+
+    print('{} records{}'.format(count, '' if has_numpy else ' (numpy not installed)'))
+    for name, us_per_record in results:
+        print('{:<30} {:>8.2f} us/record'.format(name, us_per_record))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark the normalization of scraped records')
+    ap.add_argument('--records', type=int, default=200000, help='number of records normalized')
+    args = vars(ap.parse_args())
+    run(args['records'])
@@ -0,0 +1,118 @@
+'''
+Benchmark of the html parser backends on the fixture pages.
+
+For every fixture page and parser, measures pages per second on one core for parsing only and for
+parsing + running the page's parse functions (anime.parse_*, character.parse_character_info), the
+peak memory used while parsing, and checks that the parse functions give the same result as with
+html.parser. Each BeautifulSoup parser is also measured with partial parsing (only the regions in
+anime.PAGE_REGIONS / character.CHARACTER_PAGE_REGIONS are parsed).
+
+selectolax (lexbor) is measured for parsing only, as a reference for how fast a non-BeautifulSoup
+tree can be built; the parse functions need a BeautifulSoup tree.
+
+Usage:
+    python benchmarks/bench_parsers.py [--min-time 0.5]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import utility
+import anime
+import character
+import fixtures
+
+URL = 'https://myanimelist.net/anime/4898/Kuroshitsuji'
+CHARACTER_URL = 'https://myanimelist.net/character/1/Sebastian_Michaelis'
+
+# parse functions to run on each page type
+PARSE_STEPS = {
+    'anime': lambda soup: anime.parse_anime_info(soup, URL),
+    'episode': anime.parse_anime_episodes,
+    'stats': anime.parse_mal_stats,
+    'characters': lambda soup: (anime.parse_anime_characters(soup), anime.parse_anime_staff(soup)),
+    'character': lambda soup: character.parse_character_info(soup, CHARACTER_URL),
+}
+
+# regions scraped on each page type, for partial parsing
+REGIONS = dict(anime.PAGE_REGIONS, character=character.CHARACTER_PAGE_REGIONS)
+
+def get_backends():
+    '''
+    Returns the parser backends that are installed.
+
+    Returns
+        backends [dict]: parse function (html, page type -> tree) by backend name, and whether the parse steps can run on its tree
+    '''
+    backends = {}
+    for name in utility.PARSERS:
+        try:
+            utility.make_soup('', name)
+        except Exception:
+            continue
+        backends[name] = ((lambda html, page_type, name=name: utility.make_soup(html, name)), True)
+        backends[name + ' (partial)'] = (
+            (lambda html, page_type, name=name: utility.make_soup(html, name, REGIONS[page_type])), True)
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+        backends['selectolax (lexbor)'] = ((lambda html, page_type: LexborHTMLParser(html)), False)
+    except ImportError:
+        pass
+    return backends
+
+def pages_per_second(func, min_time):
+    '''
+    Returns how many times per second func runs (runs it for at least min_time seconds).
+    '''
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed
+
+def peak_memory(func):
+    '''
+    Returns the peak memory (in KB) allocated while func runs.
+    '''
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak // 1024
+
+def strip_timestamps(result):
+    if isinstance(result, dict):
+        return {k: v for k, v in result.items() if k != 'retrieved_on'}
+    return result
+
+def run(min_time=0.5):
+    backends = get_backends()
+    print('{:<16} {:>8}  {:<22} {:>10} {:>16} {:>10}  {}'.format(
+        'fixture', 'size', 'backend', 'parse/s', 'parse+extract/s', 'peak mem', 'same result'))
+    for name, (page_type, html) in fixtures.get_fixtures().items():
+        step = PARSE_STEPS[page_type]
+        expected = strip_timestamps(step(utility.make_soup(html, 'html.parser')))
+        for backend, (parse, runs_steps) in backends.items():
+            parse_rate = pages_per_second(lambda: parse(html, page_type), min_time)
+            memory = peak_memory(lambda: parse(html, page_type))
+            if runs_steps:
+                extract_rate = '{:.1f}'.format(pages_per_second(lambda: step(parse(html, page_type)), min_time))
+                same = 'yes' if strip_timestamps(step(parse(html, page_type))) == expected else 'NO'
+            else:
+                extract_rate, same = '-', '-'
+            print('{:<16} {:>7}K  {:<22} {:>10.1f} {:>16} {:>9}K  {}'.format(
+                name, len(html.encode('utf-8')) // 1024, backend, parse_rate, extract_rate, memory, same))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark html parser backends on the fixture pages')
+    ap.add_argument('--min-time', type=float, default=0.5, help='seconds to run each measurement for')
+    args = vars(ap.parse_args())
+    run(args['min_time'])
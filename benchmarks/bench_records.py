@@ -0,0 +1,74 @@
+'''
+Benchmark of records.py against the plain dicts returned by the scraping functions.
+
+Builds a catalogue of full anime information (parsed from the fixture pages) and measures the memory
+held by it as dicts and as records, and the time to serialize it (json and pickle, e.g. from the
+pipeline worker processes). Every anime of the fixture catalogue has the same voice actors, genres etc.,
+so the memory saved by interning is a best case; on a real catalogue it depends on how often they repeat.
+
+Usage:
+    python benchmarks/bench_records.py [--anime 50]
+'''
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import utility
+import anime
+import records
+import fixtures
+
+def get_full_info():
+    url = fixtures.ANIME_URL.format(21)
+    info = anime.parse_anime_info(utility.make_soup(fixtures.get_page('/anime/21/One_Piece')), url)
+    info['episode_info'] = anime.parse_anime_episodes(utility.make_soup(fixtures.get_page('/anime/21/One_Piece/episode')))
+    info['stats'] = anime.parse_mal_stats(utility.make_soup(fixtures.get_page('/anime/21/One_Piece/stats')))
+    characters = utility.make_soup(fixtures.get_page('/anime/21/One_Piece/characters'))
+    info['characters'] = anime.parse_anime_characters(characters)
+    info['staff'] = anime.parse_anime_staff(characters)
+    return info
+
+def memory(build):
+    tracemalloc.start()
+    catalogue = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return catalogue, size
+
+def timed(func, runs=5):
+    start = time.perf_counter()
+    for i in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1000
+
+def run(count=50):
+    # json round trips give every anime its own copies of the strings, as parsing separate pages does
+    data = json.dumps(get_full_info())
+    dicts, dicts_size = memory(lambda: [json.loads(data) for i in range(count)])
+    recs, records_size = memory(lambda: [records.Anime.from_dict(json.loads(data)) for i in range(count)])
+    assert [r.to_dict() for r in recs] == dicts
+
+    print('{} anime ({} characters, {} episodes each)'.format(count, len(dicts[0]['characters']), len(dicts[0]['episode_info'])))
+    print('{:<24} {:>12} {:>12}'.format('', 'dicts', 'records'))
+    print('{:<24} {:>11}K {:>11}K'.format('memory per anime', dicts_size // count // 1024, records_size // count // 1024))
+    print('{:<24} {:>10.1f}ms {:>10.1f}ms'.format('json', timed(lambda: [json.dumps(d, ensure_ascii=False) for d in dicts]),
+                                               timed(lambda: [r.to_json() for r in recs])))
+    print('{:<24} {:>10.1f}ms {:>10.1f}ms'.format('pickle dumps', timed(lambda: pickle.dumps(dicts, 5)),
+                                               timed(lambda: pickle.dumps(recs, 5))))
+    dicts_pickle, records_pickle = pickle.dumps(dicts, 5), pickle.dumps(recs, 5)
+    print('{:<24} {:>10.1f}ms {:>10.1f}ms'.format('pickle loads', timed(lambda: pickle.loads(dicts_pickle)),
+                                               timed(lambda: pickle.loads(records_pickle))))
+    print('{:<24} {:>11}K {:>11}K'.format('pickle size', len(dicts_pickle) // 1024, len(records_pickle) // 1024))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark records against plain dicts')
+    ap.add_argument('--anime', type=int, default=50, help='number of anime in the catalogue')
+    args = vars(ap.parse_args())
+    run(args['anime'])
@@ -0,0 +1,92 @@
+'''
+Micro-benchmark of mal url classification (utility.parse_mal_url / utility.parse_mal_urls).
+
+Builds a list of links like a crawl sees them (related anime, character and voice actor links, with
+most links repeating across anime, and some non-mal links), and measures the time per url to get the
+type and mal id of every link: with the previous implementation (get_mal_type compiling its patterns
+on every call, and mal ids split out of the url), with parse_mal_url uncached (cold) and cached,
+and with parse_mal_urls on the whole list.
+
+Usage:
+    python benchmarks/bench_router.py [--urls 100000] [--distinct 5000]
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import utility
+
+def previous_get_mal_type(url):
+    # utility.get_mal_type before parse_mal_url
+    mal_base_pattern = r'([https:\/\/]*myanimelist.net\/)'
+    types_pattern = {
+        'episode': r'anime\/.+\/episode\/\d+',
+        'anime': r'anime\/.+',
+        'character': r'character\/.+',
+        'people': r'people\/.+'
+    }
+    patt = re.compile(mal_base_pattern)
+    match = patt.match(url)
+    if not match:
+        return None
+    remaining = url[match.span()[1]:]
+    for mal_type, pattern in types_pattern.items():
+        patt = re.compile(pattern)
+        match = patt.match(remaining)
+        if match:
+            return mal_type
+    return None
+
+def previous_parse(url):
+    mal_type = previous_get_mal_type(url)
+    if mal_type is None:
+        return None, None
+    path = '/{}/'.format('anime' if mal_type == 'episode' else mal_type)
+    return mal_type, url[url.find(path)+1:].split('/')[1]
+
+def make_urls(count, distinct, seed=0):
+    rng = random.Random(seed)
+    formats = [
+        'https://myanimelist.net/anime/{0}/Anime_{0}',
+        'https://myanimelist.net/character/{0}/Character_{0}',
+        'https://myanimelist.net/people/{0}/Voice_Actor_{0}',
+        'https://myanimelist.net/manga/{0}/Manga_{0}',
+        'https://myanimelist.net/anime/{0}/Anime_{0}/episode/{1}',
+    ]
+    links = [rng.choice(formats).format(i, rng.randint(1, 24)) for i in range(distinct)]
+    return [rng.choice(links) for i in range(count)]
+
+def timed(func, urls):
+    start = time.perf_counter()
+    func(urls)
+    return (time.perf_counter() - start) / len(urls) * 1e6
+
+def run(count=100000, distinct=5000):
+    urls = make_urls(count, distinct)
+    # parse_mal_url uncached, i.e. the cost of the first time a url is seen
+    parse_uncached = utility.parse_mal_url.__wrapped__
+
+    results = [
+        ('previous get_mal_type + id', timed(lambda urls: [previous_parse(url) for url in urls], urls)),
+        ('parse_mal_url (cold)', timed(lambda urls: [parse_uncached(url) for url in urls], urls)),
+    ]
+    utility.parse_mal_url.cache_clear()
+    results.append(('parse_mal_url (cached)', timed(lambda urls: [utility.parse_mal_url(url) for url in urls], urls)))
+    results.append(('parse_mal_urls', timed(utility.parse_mal_urls, urls)))
+
+    print('{} urls ({} distinct)'.format(count, distinct))
+    for name, us_per_url in results:
+        print('{:<30} {:>8.2f} us/url'.format(name, us_per_url))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark mal url classification')
+    ap.add_argument('--urls', type=int, default=100000, help='number of urls classified')
+    ap.add_argument('--distinct', type=int, default=5000, help='number of distinct urls among them')
+    args = vars(ap.parse_args())
+    run(args['urls'], args['distinct'])
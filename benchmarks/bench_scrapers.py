@@ -0,0 +1,193 @@
+'''
+Offline benchmark of the public scraping functions.
+
+Serves the fixture pages from a local stand-in for myanimelist.net (benchmarks/server.py) and
+points the shared fetcher at it, so every run fetches and parses the same pages without the network.
+For every scraping function, measures the latency per call (median and p95), pages per second,
+the peak memory allocated during a call (tracemalloc) and the peak RSS of the process.
+
+Results can be saved as a baseline (benchmarks/baseline.json by default) and later runs are compared
+against it: the run fails (exit code 1) if the median latency or peak allocated memory of a function
+got worse by more than the tolerance. Baselines are machine specific, so save one on the machine
+the comparison runs on (no baseline is committed). A --baseline file that does not exist is an error
+(exit code 2), without --baseline a missing benchmarks/baseline.json is reported as not compared.
+
+Usage:
+    python benchmarks/bench_scrapers.py --save-baseline [--runs 20]
+    python benchmarks/bench_scrapers.py [--baseline benchmarks/baseline.json] [--tolerance 0.2]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import utility
+import fetcher
+import anime
+import character
+import server
+
+ANIME_URL = 'https://myanimelist.net/anime/4898/Kuroshitsuji'
+# served as a long-running series (see fixtures.LONG_SERIES_IDS)
+LONG_ANIME_URL = 'https://myanimelist.net/anime/21/One_Piece'
+CHARACTER_URL = 'https://myanimelist.net/character/1/Sebastian_Michaelis'
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# name: (scraping function, url)
+CASES = {
+    'get_anime_info': (anime.get_anime_info, ANIME_URL),
+    'get_anime_info (full)': (lambda url: anime.get_anime_info(url, full=True), ANIME_URL),
+    'get_anime_episodes': (anime.get_anime_episodes, ANIME_URL + '/episode'),
+    'get_anime_episodes (long)': (anime.get_anime_episodes, LONG_ANIME_URL + '/episode'),
+    'get_mal_stats': (anime.get_mal_stats, ANIME_URL + '/stats'),
+    'get_anime_characters': (anime.get_anime_characters, ANIME_URL + '/characters'),
+    'get_anime_characters (long)': (anime.get_anime_characters, LONG_ANIME_URL + '/characters'),
+    'get_anime_staff': (anime.get_anime_staff, ANIME_URL + '/characters'),
+    'get_anime_staff (long)': (anime.get_anime_staff, LONG_ANIME_URL + '/characters'),
+    'get_character_info': (character.get_character_info, CHARACTER_URL),
+}
+
+# measurements compared against the baseline (lower is better)
+COMPARED = ['median_ms', 'peak_alloc_kb']
+
+def measure(func, url, runs, session):
+    '''
+    Measures a scraping function.
+
+    Parameters:
+        func [function]: scraping function (url -> info)
+        url [string]: url to scrape
+        runs [int]: number of timed calls
+        session [requests.Session]: session of the fetcher (to count pages fetched)
+
+    Returns
+        result [dict]: median_ms, p95_ms, pages_per_second, peak_alloc_kb, peak_rss_kb
+    '''
+    pages = []
+    session.hooks['response'].append(lambda response, *args, **kwargs: pages.append(1))
+    try:
+        func(url)  # warm up
+        del pages[:]
+        latencies = []
+        for i in range(runs):
+            start = time.perf_counter()
+            func(url)
+            latencies.append(time.perf_counter() - start)
+        page_count = len(pages)
+    finally:
+        session.hooks['response'].pop()
+
+    tracemalloc.start()
+    func(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'median_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+        'pages_per_second': round(page_count / sum(latencies), 1),
+        'peak_alloc_kb': peak // 1024,
+        # ru_maxrss is in KB on linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def compare(results, baseline, tolerance):
+    '''
+    Compares results against a baseline.
+
+    Parameters:
+        results [dict]: measurements by case name
+        baseline [dict]: baseline measurements by case name
+        tolerance [float]: allowed relative increase (e.g. 0.2 for 20%)
+
+    Returns
+        regressions [list]: descriptions of measurements that got worse by more than the tolerance
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in COMPARED:
+            before, after = baseline[name][key], result[key]
+            if before and after > before * (1 + tolerance):
+                regressions.append('{}: {} {} -> {} (+{:.0%})'.format(name, key, before, after, after / before - 1))
+    return regressions
+
+def run(runs=20, cases=None):
+    '''
+    Runs the benchmark against the local stand-in server.
+
+    Parameters:
+        runs [int] [default=20]: number of timed calls per case
+        cases [list] [default=None]: names of cases to run (all if not given)
+
+    Returns
+        results [dict]: measurements by case name
+    '''
+    httpd, base_url = server.start_server()
+    bench_fetcher = fetcher.Fetcher(base_url=base_url)
+    previous = fetcher.set_fetcher(bench_fetcher)
+    try:
+        results = {}
+        print('{:<28} {:>10} {:>10} {:>10} {:>12} {:>12}'.format(
+            'function', 'median ms', 'p95 ms', 'pages/s', 'peak alloc', 'peak rss'))
+        for name, (func, url) in CASES.items():
+            if cases and name not in cases:
+                continue
+            result = measure(func, url, runs, bench_fetcher.session)
+            results[name] = result
+            print('{:<28} {:>10.2f} {:>10.2f} {:>10.1f} {:>11}K {:>11}K'.format(
+                name, result['median_ms'], result['p95_ms'], result['pages_per_second'],
+                result['peak_alloc_kb'], result['peak_rss_kb']))
+        return results
+    finally:
+        fetcher.set_fetcher(previous)
+        bench_fetcher.close()
+        httpd.shutdown()
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark the scraping functions against local fixture pages')
+    ap.add_argument('--runs', type=int, default=20, help='number of timed calls per function')
+    ap.add_argument('--case', action='append', choices=list(CASES), help='only run this case (can be repeated)')
+    ap.add_argument('--parser', choices=utility.PARSERS, help='html parser to use')
+    ap.add_argument('--partial', action='store_true', help='only parse the page regions that are scraped')
+    ap.add_argument('--baseline', help='baseline json file (exits with 1 on regressions against it) [default: {}]'.format(BASELINE))
+    ap.add_argument('--tolerance', type=float, default=0.2, help='allowed relative increase over the baseline')
+    ap.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+    args = vars(ap.parse_args())
+
+    baseline_given = args['baseline'] is not None
+    args['baseline'] = args['baseline'] or BASELINE
+    if baseline_given and not args['save_baseline'] and not os.path.exists(args['baseline']):
+        ap.error('baseline {} does not exist (save one with --save-baseline)'.format(args['baseline']))
+
+    if args['parser']:
+        utility.set_parser(args['parser'])
+    utility.set_partial_parsing(args['partial'])
+
+    results = run(args['runs'], args['case'])
+
+    if args['save_baseline']:
+        with open(args['baseline'], 'w') as f:
+            json.dump(results, f, indent=4)
+        print('saved baseline to {}'.format(args['baseline']))
+    elif os.path.exists(args['baseline']):
+        with open(args['baseline']) as f:
+            regressions = compare(results, json.load(f), args['tolerance'])
+        if regressions:
+            print('\nregressions against {}:'.format(args['baseline']))
+            for regression in regressions:
+                print('    ' + regression)
+            sys.exit(1)
+        print('\nno regressions against {}'.format(args['baseline']))
+    else:
+        sys.stderr.write('\nWARNING: no baseline at {}, results were NOT compared (save one with --save-baseline)\n'.format(
+            args['baseline']))
@@ -0,0 +1,90 @@
+'''
+Benchmark of the fetcher's scheduler against a stand-in server that throttles.
+
+Runs a batch crawl of anime pages against benchmarks/server.py with a rate limit, with the fetcher
+configured above that limit, while interactive lookups are made every --interactive-interval seconds.
+Reports the sustained throughput against the server's limit, how many requests were throttled, the
+rate the fetcher settled at, and the latency of batch items and interactive lookups.
+
+Usage:
+    python benchmarks/bench_throttle.py [--server-rate 20] [--rps 40] [--items 300] [--workers 8]
+'''
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fetcher
+import anime
+import batch
+import server
+
+def run(server_rate=20, rps=40, items=300, workers=8, interactive_interval=0.5):
+    httpd, base_url = server.start_server(rate_limit=server_rate)
+    bench_fetcher = fetcher.Fetcher(base_url=base_url, rate_limit=rps, max_concurrency=workers, retries=5)
+    previous = fetcher.set_fetcher(bench_fetcher)
+
+    batch_latencies = []
+    interactive_latencies = []
+    stop = threading.Event()
+
+    def scrape(url, full=False):
+        start = time.perf_counter()
+        result = batch.scrape(url, full)
+        batch_latencies.append(time.perf_counter() - start)
+        return result
+
+    def interactive():
+        while not stop.wait(interactive_interval):
+            start = time.perf_counter()
+            try:
+                anime.get_anime_info('https://myanimelist.net/anime/1/Cowboy_Bebop')
+            except Exception:
+                continue
+            interactive_latencies.append(time.perf_counter() - start)
+
+    failures = []
+    def on_result(url, mal_type, info, error):
+        if error is not None:
+            failures.append(url)
+
+    lookups = threading.Thread(target=interactive, daemon=True)
+    try:
+        lookups.start()
+        start = time.perf_counter()
+        urls = ['https://myanimelist.net/anime/{}/x'.format(1000 + i) for i in range(items)]
+        batch.run_batch(urls, on_result, workers=workers, scraper=scrape)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop.set()
+        lookups.join()
+        fetcher.set_fetcher(previous)
+        bench_fetcher.close()
+        httpd.shutdown()
+
+    throttle = httpd.RequestHandlerClass.throttle
+    print('server limit           {:>8.1f} requests/s'.format(server_rate))
+    print('fetcher rate limit     {:>8.1f} requests/s (settled at {:.1f})'.format(rps, bench_fetcher.rate_limiter.rate))
+    print('batch throughput       {:>8.1f} items/s ({} items, {} failed, {:.1f}s)'.format(
+        (items - len(failures)) / elapsed, items, len(failures), elapsed))
+    print('requests               {:>8} served, {} throttled'.format(throttle.allowed, throttle.throttled))
+    if batch_latencies:
+        print('batch latency          {:>8.0f} ms median'.format(statistics.median(batch_latencies) * 1000))
+    if interactive_latencies:
+        print('interactive latency    {:>8.0f} ms median ({} lookups)'.format(
+            statistics.median(interactive_latencies) * 1000, len(interactive_latencies)))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='benchmark the fetcher against a throttling stand-in server')
+    ap.add_argument('--server-rate', type=float, default=20, help='requests per second the server allows')
+    ap.add_argument('--rps', type=float, default=40, help='rate limit of the fetcher')
+    ap.add_argument('--items', type=int, default=300, help='number of anime pages to crawl')
+    ap.add_argument('--workers', type=int, default=8, help='number of batch worker threads')
+    ap.add_argument('--interactive-interval', type=float, default=0.5, help='seconds between interactive lookups')
+    args = vars(ap.parse_args())
+    run(args['server_rate'], args['rps'], args['items'], args['workers'], args['interactive_interval'])
@@ -0,0 +1,155 @@
+'''
+Offline checks of behaviour the benchmarks do not exercise (e.g. error paths), against the fixture pages
+served by benchmarks/server.py. Every check raises AssertionError if the behaviour is broken, the script
+exits with 1 if any check failed.
+
+Usage:
+    python benchmarks/checks.py [--check https_connect_timing] [--check ...]
+'''
+
+import os
+import ssl
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+import traceback
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fetcher
+import metrics
+import server
+import entity_store
+
+class Skipped(Exception):
+    pass
+
+def check_https_connect_timing():
+    # connect timing of https connections with metrics enabled (TimedHTTPSConnection)
+    if shutil.which('openssl') is None:
+        raise Skipped('needs the openssl command to make a certificate')
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+                        '-keyout', key, '-out', cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        httpd = server.make_server()
+        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    was_enabled = metrics.enabled
+    metrics.enable()
+    fetcher._connect_time.seconds = 0.0
+    pool = fetcher.TimedHTTPSConnectionPool('127.0.0.1', httpd.server_address[1], cert_reqs='CERT_NONE',
+                                            assert_hostname=False)
+    try:
+        response = pool.urlopen('GET', '/anime/1/Cowboy_Bebop')
+        assert response.status == 200, 'https request failed ({})'.format(response.status)
+        assert fetcher._connect_time.seconds > 0, 'connect time of the https connection was not recorded'
+    finally:
+        pool.close()
+        httpd.shutdown()
+        if not was_enabled:
+            metrics.disable()
+
+def check_throttle_recovery(server_rate=5, rps=20):
+    # the rate goes down when the server throttles (429 + Retry-After) and grows back once it stops
+    httpd, base_url = server.start_server(rate_limit=server_rate)
+    httpd.RequestHandlerClass.retry_after = 0.2
+    check_fetcher = fetcher.Fetcher(base_url=base_url, rate_limit=rps, max_concurrency=4, retries=5)
+    limiter = check_fetcher.rate_limiter
+    throttle = httpd.RequestHandlerClass.throttle
+    try:
+        for i in range(3 * server_rate):
+            check_fetcher.get('https://myanimelist.net/anime/1/Cowboy_Bebop')
+        assert throttle.throttled > 0, 'the server never throttled'
+        assert check_fetcher.scheduler.stats['throttled'] > 0, 'the fetcher did not see the throttling'
+        lowest = limiter.rate
+        assert lowest <= rps / 2, 'the rate was not lowered ({} requests/s)'.format(lowest)
+
+        throttle.rate = 10 ** 6
+        for i in range(40):
+            check_fetcher.get('https://myanimelist.net/anime/1/Cowboy_Bebop')
+        assert limiter.rate > lowest, 'the rate did not recover ({} requests/s)'.format(limiter.rate)
+        assert limiter.rate >= limiter.ceiling * 0.99, 'the rate did not grow back to its ceiling'
+    finally:
+        check_fetcher.close()
+        httpd.shutdown()
+
+def check_forbidden_not_throttled():
+    # a 403 without Retry-After is a denied request: returned at once, no retries, the rate is kept
+    class ForbiddenHandler(server.FixtureHandler):
+        def do_GET(self):
+            ForbiddenHandler.requests += 1
+            self.send_page(403, '<html><body>403 Forbidden</body></html>')
+    ForbiddenHandler.requests = 0
+
+    httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), ForbiddenHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    check_fetcher = fetcher.Fetcher(base_url='http://127.0.0.1:{}'.format(httpd.server_address[1]), rate_limit=20)
+    try:
+        response = check_fetcher.get('https://myanimelist.net/anime/1/Cowboy_Bebop')
+        assert response.status_code == 403
+        assert ForbiddenHandler.requests == 1, '403 was retried ({} requests)'.format(ForbiddenHandler.requests)
+        assert check_fetcher.rate_limiter.rate == 20, 'a 403 lowered the rate'
+    finally:
+        check_fetcher.close()
+        httpd.shutdown()
+
+def check_entity_store_duplicates():
+    # an anime written twice in one flush keeps one set of link rows, and a character / voice actor is found by
+    # any of its urls (with or without the name, http, www.)
+    spike = 'https://myanimelist.net/character/1/Spike_Spiegel'
+    va = 'https://myanimelist.net/people/11/Kouichi_Yamadera'
+    info = {'mal_id': '1', 'url': 'https://myanimelist.net/anime/1/Cowboy_Bebop', 'english': 'Cowboy Bebop',
+            'related': [], 'staff': [],
+            'characters': [{'url': spike, 'character': 'Spiegel, Spike', 'type': 'Main', 'va_url': va,
+                            'va': 'Yamadera, Kouichi', 'va_lang': 'Japanese'}]}
+    character = {'mal_id': '1', 'url': 'http://www.myanimelist.net/character/1', 'eng_name': 'Spike Spiegel'}
+    with tempfile.TemporaryDirectory() as directory:
+        with entity_store.EntityStore(os.path.join(directory, 'index.db')) as store:
+            store.write('anime', info)
+            store.write('anime', dict(info))
+            store.write('character', character)
+            store.flush()
+            for url in [va, 'http://www.myanimelist.net/people/11', 'https://myanimelist.net/people/11/']:
+                roles = store.get_va_anime(url)
+                assert len(roles) == 1, '{} roles of {} (expected 1)'.format(len(roles), url)
+            for url in [spike, 'https://myanimelist.net/character/1', 'http://myanimelist.net/character/1/Spike_Spiegel']:
+                anime = store.get_character_anime(url)
+                assert [a['mal_id'] for a in anime] == ['1'], 'anime of {}: {}'.format(url, anime)
+                assert store.get_character(url) == character, 'character {} not found'.format(url)
+
+CHECKS = {
+    'https_connect_timing': check_https_connect_timing,
+    'throttle_recovery': check_throttle_recovery,
+    'forbidden_not_throttled': check_forbidden_not_throttled,
+    'entity_store_duplicates': check_entity_store_duplicates,
+}
+
+def run(names=None):
+    failed = 0
+    for name in names or CHECKS:
+        try:
+            CHECKS[name]()
+        except Skipped as e:
+            print('{:<36} skipped ({})'.format(name, e))
+        except Exception:
+            failed += 1
+            print('{:<36} FAILED'.format(name))
+            traceback.print_exc()
+        else:
+            print('{:<36} ok'.format(name))
+    return failed
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='offline checks against the fixture pages')
+    ap.add_argument('--check', action='append', choices=list(CHECKS), help='only run this check (can be repeated)')
+    args = vars(ap.parse_args())
+    sys.exit(1 if run(args['check']) else 0)
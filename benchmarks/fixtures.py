@@ -0,0 +1,363 @@
+'''
+Fixture pages for the benchmarks.
+
+Builds html pages with the same markup that the scrapers in anime.py and character.py look for,
+in several sizes (e.g. a /characters page of a long-running series has hundreds of tables).
+
+Methods
+-------
+anime_page(mal_id -> int, related -> int): returns html of a mal anime page
+episode_page(episodes -> int, offset -> int, total -> int): returns html of a mal anime /episode page
+stats_page(): returns html of a mal anime /stats page
+characters_page(characters -> int, staff -> int): returns html of a mal anime /characters page
+character_page(): returns html of a mal character page
+season_page(year -> int, season -> string): returns html of a mal season page
+top_page(offset -> int): returns html of a mal top anime page
+get_fixtures(): returns all fixture pages by name
+get_page(path -> string, query -> string): returns html of the fixture page for a mal url path (used by benchmarks/server.py)
+record(url -> string): saves a real mal page to the recorded pages directory
+
+Recorded pages (benchmarks/pages/<url path>.html, saved with `python benchmarks/fixtures.py <mal url>...`)
+are served instead of the generated ones.
+
+Usage:
+    python benchmarks/fixtures.py <mal url> [<mal url> ...]
+'''
+
+import os
+import re
+import sys
+import argparse
+from urllib.parse import parse_qs
+
+MAL = 'https://myanimelist.net'
+ANIME_URL = MAL + '/anime/{}/Kuroshitsuji'
+PADDING = '<div class="ad"><script>var googletag = googletag || {{}}; googletag.cmd = [];</script>{}</div>\n'
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+# anime ids that are served as long-running series (many episodes, characters and staff)
+LONG_SERIES_IDS = [21]
+LONG_SERIES_EPISODES = 1100
+EPISODES_PER_PAGE = 100
+
+# anime ids that have a page (404 for others): up to MAX_ANIME_ID, and only even ids from SPARSE_IDS_FROM,
+# like the unused / removed ids of real mal
+MAX_ANIME_ID = 60000
+SPARSE_IDS_FROM = 50000
+SEASON_ANIME = 60
+TOP_ANIME = 120
+TOP_PAGE_SIZE = 50
+
+def anime_exists(mal_id):
+    return mal_id <= MAX_ANIME_ID and (mal_id < SPARSE_IDS_FROM or mal_id % 2 == 0)
+
+def _page(head, body, padding=20):
+    # real pages carry a lot of markup the scrapers never look at (menus, ads, scripts)
+    filler = ''.join(PADDING.format('<ul>' + '<li><a href="/x">menu item</a></li>' * 10 + '</ul>') for i in range(padding))
+    return '<!DOCTYPE html>\n<html><head>\n<meta charset="utf-8">\n{}</head>\n<body>\n{}<div id="contentWrapper">{}</div>\n{}</body></html>'.format(
+        head, filler, body, filler)
+
+def anime_page(mal_id=4898, related=2):
+    '''
+    Returns html of a mal anime page.
+
+    Parameters:
+        mal_id [int] [default=4898]: mal anime id
+        related [int] [default=2]: number of related anime rows
+
+    Returns
+        html [string]
+    '''
+    head = (
+        '<meta property="og:title" content="Kuroshitsuji">\n'
+        '<meta property="og:url" content="{}">\n'
+        '<meta property="og:description" content="Young Ciel Phantomhive is known as &quot;the Queen\'s Guard Dog.&quot; [Written by MAL Rewrite]">\n'
+    ).format(ANIME_URL.format(mal_id))
+    sidebar = [
+        ('Synonyms', ' Kuro Shitsuji, Kuroshitsuzi'),
+        ('Japanese', ' 黒執事'),
+        ('English', ' Black Butler'),
+        ('Type', ' <a href="{}/topanime.php?type=tv">TV</a>'.format(MAL)),
+        ('Episodes', ' 24'),
+        ('Status', ' Finished Airing'),
+        ('Aired', ' Oct 3, 2008 to Mar 27, 2009'),
+        ('Premiered', ' <a href="{}/anime/season/2008/fall">Fall 2008</a>'.format(MAL)),
+        ('Broadcast', ' Unknown'),
+        ('Producers', ' <a href="/anime/producer/17">Aniplex</a>, <a href="/anime/producer/61">Square Enix</a>'),
+        ('Licensors', ' <a href="/anime/producer/493">Aniplex of America</a>, <a href="/anime/producer/102">Funimation</a>'),
+        ('Studios', ' <a href="/anime/producer/56">A-1 Pictures</a>'),
+        ('Source', ' Manga'),
+        ('Genres', ' <a href="/anime/genre/1">Action</a>, <a href="/anime/genre/4">Comedy</a>, <a href="/anime/genre/6">Demons</a>'),
+        ('Duration', ' 24 min. per ep.'),
+        ('Rating', ' R - 17+ (violence &amp; profanity)'),
+        ('Score', ' <span itemprop="ratingValue">7.75</span><sup>1</sup> (scored by <span itemprop="ratingCount">448,815</span> users)'),
+        ('Ranked', ' #927<sup>2</sup><span class="statistics-info">based on the top anime page</span>'),
+        ('Popularity', ' #91'),
+        ('Members', ' 883,075'),
+        ('Favorites', ' 23,580'),
+    ]
+    leftside = ''.join('<div class="spaceit_pad"><span class="dark_text">{}:</span>{}</div>\n'.format(name, value)
+                       for name, value in sidebar)
+    rows = ''.join('<tr><td>{}:</td><td><a href="/anime/{}/Kuroshitsuji_{}">Kuroshitsuji {}</a></td></tr>\n'.format(
+        'Sequel' if i % 2 else 'Side story', 6707 + i, i, i) for i in range(related))
+    body = (
+        '<table><tr><td class="borderClass"><div class="leftside">\n<h2>Alternative Titles</h2>\n{}</div></td>\n'
+        '<td><div class="js-scrollfix-bottom-rel">\n<table class="anime_detail_related_anime">\n{}</table>\n'
+        '</div></td></tr></table>'
+    ).format(leftside, rows)
+    return _page(head, body)
+
+def episode_page(episodes=24, offset=0, mal_id=4898, total=None):
+    '''
+    Returns html of a mal anime /episode page.
+
+    Parameters:
+        episodes [int] [default=24]: number of episode rows
+        offset [int] [default=0]: number of the first episode - 1
+        mal_id [int] [default=4898]: mal anime id
+        total [int] [default=None]: total number of episodes, adds the pagination links of an episode list
+            split into pages of EPISODES_PER_PAGE episodes
+
+    Returns
+        html [string]
+    '''
+    url = ANIME_URL.format(mal_id)
+    pagination = ''
+    if total is not None:
+        pagination = '<div class="pagination ac">{}</div>\n'.format(''.join(
+            '<a href="{}/episode{}" class="link{}">{} - {}</a>'.format(
+                url, '?offset={}'.format(start) if start else '', ' current' if start == offset else '',
+                start + 1, min(start + EPISODES_PER_PAGE, total))
+            for start in range(0, total, EPISODES_PER_PAGE)))
+    rows = ''.join(
+        '<tr class="episode-list-data"><td class="episode-number nowrap">{0}</td>'
+        '<td class="episode-title"><a href="{1}/episode/{0}" class="fl-l fw-b">Episode {0} title</a><br>'
+        '<span class="di-ib">エピソード {0}</span></td>'
+        '<td class="episode-aired nowrap">Oct 3, 2008</td></tr>\n'.format(i, url)
+        for i in range(offset + 1, offset + episodes + 1))
+    return _page('', '{}<table class="episode_list">\n{}</table>'.format(pagination, rows))
+
+def stats_page():
+    '''
+    Returns html of a mal anime /stats page.
+
+    Returns
+        html [string]
+    '''
+    counts = [('Watching', '12,345'), ('Completed', '700,000'), ('On-Hold', '10,000'),
+              ('Dropped', '5,000'), ('Plan to Watch', '100,000'), ('Total', '827,345')]
+    divs = ''.join('<div class="spaceit_pad"><span class="dark_text">{}:</span> {}</div>\n'.format(name, value)
+                   for name, value in counts)
+    rows = ''.join('<tr><td class="score-label score-{0}">{0}</td><td><div class="updatesBar"></div>'
+                   '<span>&nbsp;{0}.0%</span> <small>({1} votes)</small></td></tr>\n'.format(i, i * 1013)
+                   for i in range(10, 0, -1))
+    return _page('', '<div id="content">\n{}<table class="score-stats">\n{}</table></div>'.format(divs, rows))
+
+def characters_page(characters=20, staff=10, mal_id=4898):
+    '''
+    Returns html of a mal anime /characters page.
+
+    Parameters:
+        characters [int] [default=20]: number of character tables (each with 2 voice actors)
+        staff [int] [default=10]: number of staff tables
+        mal_id [int] [default=4898]: mal anime id
+
+    Returns
+        html [string]
+    '''
+    va = ('<tr><td valign="top"><a href="{0}/people/{1}/Voice_Actor_{1}">Voice Actor {1}</a><br>'
+          '<small>{2}</small></td><td valign="top"><a href="{0}/people/{1}/Voice_Actor_{1}"><img></a></td></tr>')
+    # the tables follow each other without whitespace, as on mal (the scrapers walk the table siblings)
+    character_tables = ''.join(
+        '<table><tr><td><a href="{0}/character/{1}/Character_{1}"><img></a></td>'
+        '<td><a href="{0}/character/{1}/Character_{1}">Character {1}</a>'
+        '<div class="spaceit_pad"><small>{2}</small></div></td>'
+        '<td><table>{3}{4}</table></td></tr></table>'.format(
+            MAL, i, 'Main' if i < 3 else 'Supporting', va.format(MAL, 1000 + i, 'Japanese'), va.format(MAL, 2000 + i, 'English'))
+        for i in range(1, characters + 1))
+    staff_tables = ''.join(
+        '<table><tr><td><a href="{0}/people/{1}/Staff_{1}"><img></a></td>'
+        '<td><a href="{0}/people/{1}/Staff_{1}">Staff {1}</a><div class="spaceit_pad"><small>{2}</small></div></td>'
+        '</tr></table>'.format(MAL, 5000 + i, 'Director, Storyboard' if i == 0 else 'Key Animation')
+        for i in range(staff))
+    head = '<meta property="og:url" content="{}/characters">\n'.format(ANIME_URL.format(mal_id))
+    body = (
+        '<div id="content"><div class="js-scrollfix-bottom-rel">\n'
+        '<div class="normal_header"><h2>Characters &amp; Voice Actors<span class="floatRightHeader">more</span></h2></div>'
+        '{}<br>\n<div class="normal_header"><h2>Staff</h2></div>{}</div></div>'
+    ).format(character_tables, staff_tables)
+    return _page(head, body)
+
+def character_page(anime=3, voice_actors=4):
+    '''
+    Returns html of a mal character page.
+
+    Parameters:
+        anime [int] [default=3]: number of anime in the animeography (and manga in the mangaography)
+        voice_actors [int] [default=4]: number of voice actors
+
+    Returns
+        html [string]
+    '''
+    head = '<meta property="og:url" content="{}/character/1/Sebastian_Michaelis">\n'.format(MAL)
+    row = ('<tr><td width="25" class="borderClass" valign="top"><div class="picSurround"><a href="{0}/{1}/{2}/Kuroshitsuji_{2}" '
+           'class="hoverinfo_trigger"><img src="x.jpg"></a></div></td><td class="borderClass" valign="top">'
+           '<a href="{0}/{1}/{2}/Kuroshitsuji_{2}">Kuroshitsuji {2}</a><div class="spaceit_pad"><small>{3}</small></div></td></tr>\n')
+    animeography = ''.join(row.format(MAL, 'anime', 4898 + i, 'Main' if i == 0 else 'Supporting') for i in range(anime))
+    mangaography = ''.join(row.format(MAL, 'manga', 13492 + i, 'Main') for i in range(anime))
+    languages = ['Japanese', 'English', 'German', 'French']
+    voice_actors = ''.join(
+        '<table border="0" cellpadding="0" cellspacing="0" width="100%"><tr><td class="borderClass" valign="top" width="25">'
+        '<div class="picSurround"><a href="{0}/people/{1}/Voice_Actor_{1}"><img src="x.jpg"></a></div></td>'
+        '<td class="borderClass" valign="top"><a href="{0}/people/{1}/Voice_Actor_{1}">Actor, Voice {1}</a>'
+        '<div style="margin-top: 2px;"><small>{2}</small></div></td></tr></table>\n'.format(MAL, 8 + i, languages[i % len(languages)])
+        for i in range(voice_actors))
+    body = (
+        '<h1 class="title-name"><strong>Sebastian &quot;Sebas&quot; Michaelis</strong></h1>\n'
+        '<div id="content"><table><tr><td class="borderClass">\n'
+        '<div class="normal_header">Animeography</div><table border="0" cellpadding="0" cellspacing="0" width="100%">{}</table><br>\n'
+        '<div class="normal_header">Mangaography</div><table border="0" cellpadding="0" cellspacing="0" width="100%">{}</table><br>\n'
+        'Member Favorites: 12,345\n</td>'
+        '<td><div class="breadcrumb"><a href="/character.php">Characters</a></div>'
+        '<h2 class="normal_header">Sebastian Michaelis <span><small>(セバスチャン・ミカエリス)</small></span></h2>'
+        'Birthday: unknown<br>Height: 186 cm<br>The Phantomhive butler.<br><br>\n'
+        'A demon bound to Ciel by a contract. <span class="spoiler">He wants <b>Ciel\'s soul</b>.</span><br>\n'
+        '<div class="normal_header">Voice Actors</div>\n{}</td></tr></table></div>'
+    ).format(animeography, mangaography, voice_actors)
+    return _page(head, body)
+
+def season_page(year=2024, season='spring', anime=SEASON_ANIME):
+    '''
+    Returns html of a mal season page (anime ids 50000 + 2i, the first ones are also on the top anime pages).
+
+    Parameters:
+        year [int] [default=2024]: year of season
+        season [string] [default='spring']: season
+        anime [int] [default=SEASON_ANIME]: number of anime on the page
+
+    Returns
+        html [string]
+    '''
+    items = ''.join(
+        '<div class="js-anime-category-producer seasonal-anime js-seasonal-anime" data-id="{0}"><div>'
+        '<div class="title"><h2 class="h2_anime_title"><a href="{1}/anime/{0}/Anime_{0}" class="link-title">Anime {0}</a></h2></div>'
+        '<div class="properties"><span class="producer"><a href="/anime/producer/56/A-1_Pictures">A-1 Pictures</a></span>'
+        '<span class="genre"><a href="/anime/genre/1/Action">Action</a></span></div>'
+        '<div class="synopsis"><p>Synopsis of anime {0}.</p></div></div></div>\n'.format(SPARSE_IDS_FROM + 2 * i, MAL)
+        for i in range(anime))
+    body = '<div class="navi-seasonal"><a href="{}/anime/season/{}/{}">{} {}</a></div>\n{}'.format(
+        MAL, year, season, season.title(), year, items)
+    return _page('', body)
+
+def top_page(offset=0, total=TOP_ANIME):
+    '''
+    Returns html of a mal top anime page (TOP_PAGE_SIZE anime from offset, anime ids 50000 + 2i).
+
+    Parameters:
+        offset [int] [default=0]: rank of first anime on the page (limit parameter of the url)
+        total [int] [default=TOP_ANIME]: number of anime on all pages
+
+    Returns
+        html [string]
+    '''
+    rows = ''.join(
+        '<tr class="ranking-list"><td class="rank ac"><span>{0}</span></td><td class="title al va-t word-break">'
+        '<a class="hoverinfo_trigger fl-l ml12 mr8" href="{1}/anime/{2}/Anime_{2}"><img alt="Anime {2}"></a>'
+        '<div class="detail"><h3 class="anime_ranking_h3"><a href="{1}/anime/{2}/Anime_{2}">Anime {2}</a></h3></div></td>'
+        '<td class="score ac"><span>8.{0}</span></td></tr>\n'.format(rank + 1, MAL, SPARSE_IDS_FROM + 2 * rank)
+        for rank in range(offset, min(offset + TOP_PAGE_SIZE, total)))
+    return _page('', '<table class="top-ranking-table">{}</table>'.format(rows))
+
+def get_fixtures():
+    '''
+    Returns all fixture pages.
+
+    Returns
+        fixtures [dict]: (page type, html) by fixture name, page type is the name of the parse step to run on it
+    '''
+    return {
+        'anime': ('anime', anime_page()),
+        'anime_related': ('anime', anime_page(related=40)),
+        'episode': ('episode', episode_page()),
+        'episode_long': ('episode', episode_page(episodes=100, offset=100, total=1100)),
+        'stats': ('stats', stats_page()),
+        'characters': ('characters', characters_page()),
+        'characters_long': ('characters', characters_page(characters=250, staff=120)),
+        'character': ('character', character_page()),
+    }
+
+def get_page(path, query=''):
+    '''
+    Returns the html of the fixture page for a mal url path (recorded page if there is one).
+
+    Parameters:
+        path [string]: url path (e.g. /anime/4898/Kuroshitsuji/characters)
+        query [string] [default='']: url query (e.g. offset=100)
+
+    Returns
+        html [string]: html of page (None if no fixture page matches the path)
+    '''
+    recorded = os.path.join(PAGES_DIR, path.strip('/') + ('?' + query if query else '') + '.html')
+    if os.path.exists(recorded):
+        with open(recorded, encoding='utf-8') as f:
+            return f.read()
+
+    match = re.match(r'^/anime/season/(\d+)/(winter|spring|summer|fall)/?$', path)
+    if match:
+        return season_page(int(match.group(1)), match.group(2))
+    if path == '/topanime.php':
+        offset = int(parse_qs(query).get('limit', ['0'])[0])
+        return top_page(offset) if offset < TOP_ANIME else None
+
+    match = re.match(r'^/anime/(\d+)(/[^/]+)?(/episode|/stats|/characters)?/?$', path)
+    if match:
+        mal_id = int(match.group(1))
+        if not anime_exists(mal_id):
+            return None
+        long_series = mal_id in LONG_SERIES_IDS
+        subpage = match.group(3)
+        if subpage == '/episode':
+            if long_series:
+                offset = int(parse_qs(query).get('offset', ['0'])[0])
+                if offset % EPISODES_PER_PAGE or not 0 <= offset < LONG_SERIES_EPISODES:
+                    return None
+                episodes = min(EPISODES_PER_PAGE, LONG_SERIES_EPISODES - offset)
+                return episode_page(episodes, offset, mal_id, total=LONG_SERIES_EPISODES)
+            return episode_page(mal_id=mal_id)
+        if subpage == '/stats':
+            return stats_page()
+        if subpage == '/characters':
+            if long_series:
+                return characters_page(characters=250, staff=120, mal_id=mal_id)
+            return characters_page(mal_id=mal_id)
+        return anime_page(mal_id=mal_id, related=40 if long_series else 2)
+    if re.match(r'^/character/\d+(/[^/]+)?/?$', path):
+        return character_page()
+    return None
+
+def record(url):
+    '''
+    Saves a real mal page, so that it is served instead of the generated fixture page.
+
+    Parameters:
+        url [string]: mal url (e.g. https://myanimelist.net/anime/4898/Kuroshitsuji/stats)
+
+    Returns
+        path [string]: path of saved page
+    '''
+    import utility
+    webpage = utility.get_page(url)
+    path = os.path.join(PAGES_DIR, re.sub(r'^https?://[^/]+/', '', url).strip('/') + '.html')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(webpage.text)
+    return path
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    ap = argparse.ArgumentParser(description='record real mal pages to use as fixture pages')
+    ap.add_argument('urls', nargs='+', help='mal urls')
+    args = vars(ap.parse_args())
+    for url in args['urls']:
+        print(record(url))
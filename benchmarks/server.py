@@ -0,0 +1,121 @@
+'''
+Local stand-in for myanimelist.net that serves the fixture pages (see fixtures.get_page).
+
+Point a fetcher at it to scrape without the network:
+    fetcher.set_fetcher(fetcher.Fetcher(base_url=base_url))
+
+With a rate limit, it throttles like myanimelist.net: requests over the limit get a 429 response
+with a Retry-After header.
+
+Methods
+-------
+start_server(port -> int, rate_limit -> float): starts the server on a background thread
+
+Usage:
+    python benchmarks/server.py [--port 8000] [--rate-limit 10]
+'''
+
+import os
+import sys
+import argparse
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fixtures
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # keep-alive, like myanimelist.net, so that pooled connections get reused
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, with nagle on every response would wait for a delayed ack
+    disable_nagle_algorithm = True
+
+    # Throttle of the server (see make_server), None for no limit
+    throttle = None
+    retry_after = 1
+
+    def do_GET(self):
+        if self.throttle and not self.throttle.allow():
+            self.send_page(429, '<html><body>Too Many Requests</body></html>', {'Retry-After': str(self.retry_after)})
+            return
+        url = urlsplit(self.path)
+        html = fixtures.get_page(url.path, url.query)
+        if html is None:
+            self.send_page(404, '<html><body>404 Not Found</body></html>')
+        else:
+            self.send_page(200, html)
+
+    def send_page(self, status, html, headers=None):
+        body = html.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Throttle:
+    '''
+    Counts requests in one second windows, allowing at most rate per window.
+    '''
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowed = 0
+        self.throttled = 0
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window, self._count = window, 0
+            if self._count >= self.rate:
+                self.throttled += 1
+                return False
+            self._count += 1
+            self.allowed += 1
+            return True
+
+def make_server(port=0, rate_limit=None):
+    handler = type('Handler', (FixtureHandler,), {'throttle': Throttle(rate_limit) if rate_limit else None})
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+def start_server(port=0, rate_limit=None):
+    '''
+    Starts the server on a background thread.
+
+    Parameters:
+        port [int] [default=0]: port to listen on (any free port if 0)
+        rate_limit [float] [default=None]: requests per second allowed, requests over it get a 429
+            response (no limit if not given); counts are in server.RequestHandlerClass.throttle
+
+    Returns
+        server [ThreadingHTTPServer]: the server (stop with server.shutdown())
+        base_url [string]: url of the server (e.g. http://127.0.0.1:8000)
+    '''
+    server = make_server(port, rate_limit)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='serve the fixture pages as a local stand-in for myanimelist.net')
+    ap.add_argument('--port', type=int, default=8000, help='port to listen on')
+    ap.add_argument('--rate-limit', type=float, help='requests per second allowed, over it requests get a 429 response')
+    args = vars(ap.parse_args())
+    server = make_server(args['port'], args['rate_limit'])
+    print('serving fixture pages on http://127.0.0.1:{}'.format(args['port']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
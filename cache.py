@@ -0,0 +1,242 @@
+'''
+Persistent HTTP response cache used by fetcher.Fetcher.
+
+Responses are stored in a SQLite database, keyed by normalized mal url. Entries expire after a
+ttl that depends on the type of page (e.g. /stats changes daily, a character page rarely), and
+expired entries are revalidated with conditional requests (ETag / Last-Modified). The least
+recently used entries are evicted once the cache is over its size budget.
+
+Classes
+-------
+ResponseCache: SQLite backed response cache
+
+Methods
+-------
+normalize_url(url -> string): returns the cache key of a url
+get_page_type(url -> string): returns the type of mal page a url is (used to pick a ttl)
+'''
+
+import re
+import time
+import sqlite3
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# seconds that a cached page is used without revalidating it, by page type (see get_page_type)
+DEFAULT_TTLS = {
+    'stats': 6 * HOUR,
+    'episode': DAY,
+    'characters': 7 * DAY,
+    'anime': DAY,
+    'character': 7 * DAY,
+    'people': 7 * DAY,
+    'other': DAY
+}
+
+# cache hits after which their access times are written (they are also written by the next put)
+TOUCH_BATCH_SIZE = 100
+
+PAGE_TYPE_PATTERNS = [
+    # subpages of anime urls with or without the title (https://myanimelist.net/anime/<mal id>/stats)
+    ('stats', re.compile(r'^/anime/\d+(/[^/]*)?/stats$')),
+    ('episode', re.compile(r'^/anime/\d+(/[^/]*)?/episode$')),
+    ('characters', re.compile(r'^/anime/\d+(/[^/]*)?/characters$')),
+    ('anime', re.compile(r'^/anime/\d+(/[^/]*)?$')),
+    ('character', re.compile(r'^/character/\d+(/[^/]*)?$')),
+    ('people', re.compile(r'^/people/\d+(/[^/]*)?$'))
+]
+
+
+def normalize_url(url):
+    '''
+    Returns the cache key of a url: https, lowercase host without www., no fragment or trailing slash.
+
+    Parameters:
+        url [string]: url to normalize
+
+    Returns:
+        key [string]: normalized url
+    '''
+    parts = urlsplit(url if '://' in url else 'https://' + url)
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    scheme = 'https' if host == 'myanimelist.net' else parts.scheme.lower()
+    return urlunsplit((scheme, host, parts.path.rstrip('/'), parts.query, ''))
+
+
+def get_page_type(url):
+    '''
+    Returns the type of mal page a url is.
+
+    Parameters:
+        url [string]: url
+
+    Returns:
+        page_type [string]: one of the keys of DEFAULT_TTLS
+    '''
+    path = urlsplit(normalize_url(url)).path
+    for page_type, pattern in PAGE_TYPE_PATTERNS:
+        if pattern.match(path):
+            return page_type
+    return 'other'
+
+
+class CachedPage:
+    '''
+    A cached response.
+
+    Attributes:
+        url [string]: url of page
+        body [bytes]: response body
+        content_type [string]: Content-Type header of response
+        etag [string]: ETag header of response (None if there was none)
+        last_modified [string]: Last-Modified header of response (None if there was none)
+        fetched_at [float]: unix time the page was last fetched or revalidated
+        fresh [bool]: whether the page can be used without revalidating it
+    '''
+
+    def __init__(self, url, body, content_type, etag, last_modified, fetched_at, fresh):
+        self.url = url
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.fresh = fresh
+
+
+class ResponseCache:
+    '''
+    SQLite backed cache of successful (200) responses, shared by all threads that use it.
+
+    Parameters:
+        path [string]: path of SQLite database (created if it does not exist)
+        max_bytes [int] [default=1GB]: size budget of cached bodies, least recently used pages are evicted above it
+        ttls [dict] [default=None]: ttl in seconds by page type, overrides DEFAULT_TTLS
+    '''
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                page_type TEXT,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._db.commit()
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        # access times of cache hits not written yet, by key (a hit does not write to the database)
+        self._touched = {}
+        self._hits = 0
+
+    def get(self, url):
+        '''
+        Returns the cached page of a url (fresh or not).
+
+        Parameters:
+            url [string]: url of page
+
+        Returns:
+            page [CachedPage]: cached page (None if the url is not cached)
+        '''
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT page_type, content_type, etag, last_modified, body, fetched_at FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = now
+            self._hits += 1
+            if self._hits >= TOUCH_BATCH_SIZE:
+                self._write_touches()
+                self._db.commit()
+
+        page_type, content_type, etag, last_modified, body, fetched_at = row
+        fresh = now - fetched_at < self.ttls.get(page_type, self.ttls['other'])
+        return CachedPage(url, body, content_type, etag, last_modified, fetched_at, fresh)
+
+    def put(self, url, body, content_type=None, etag=None, last_modified=None):
+        '''
+        Caches a page, evicting least recently used pages if the cache goes over max_bytes.
+
+        Parameters:
+            url [string]: url of page
+            body [bytes]: response body
+            content_type [string] [default=None]: Content-Type header of response
+            etag [string] [default=None]: ETag header of response
+            last_modified [string] [default=None]: Last-Modified header of response
+        '''
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            self._write_touches()
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, get_page_type(key), content_type, etag, last_modified, body, len(body), now, now))
+            self._size += len(body) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def refresh(self, url):
+        '''
+        Marks a cached page as fetched now (e.g. after a 304 Not Modified response).
+
+        Parameters:
+            url [string]: url of page
+        '''
+        now = time.time()
+        key = normalize_url(url)
+        with self._lock:
+            self._touched.pop(key, None)
+            self._write_touches()
+            self._db.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._db.commit()
+            self._db.close()
+
+    def _write_touches(self):
+        # writes the buffered access times of cache hits (committed by the caller)
+        if self._touched:
+            self._db.executemany('UPDATE responses SET accessed_at = ? WHERE key = ?',
+                                 [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched = {}
+        self._hits = 0
+
+    def _evict(self):
+        # evict down to 90% of the budget, so that eviction does not run again on every put
+        target = self.max_bytes * 0.9
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
@@ -1,17 +1,43 @@
 '''
 Functions and CLI for code to get mal character information.
+
+get_character_info returns the names, nicknames, favorites, details (e.g. birthday, height),
+description, animeography, mangaography and voice actors of a character. get_character_infos gets
+many characters at once (e.g. the characters of a long-running series, anime.get_anime_characters),
+each character page once, on the shared executor (see fetcher.submit), so that the pages are fetched
+in parallel over the pooled connections, within the concurrency and rate limits of the fetcher.
 '''
 
+import sys
+
+if __name__ == '__main__':
+    # while a daemon is running (see daemon.py), the cli is run on it before requests / bs4 are imported
+    import client
+    if client.forward_cli('character', sys.argv[1:]):
+        sys.exit()
+
 import re
 from datetime import datetime
+from urllib.parse import urljoin
 import utility
-from utility import Bs4Error
+import fetcher
+import metrics
 from bs4 import NavigableString
 import argparse
-import sys
 
-dt = datetime.now()
-timestamp = dt.strftime('%Y-%m-%dT%H:%M:%S+08:00')
+# regions of a character page that parse_character_info uses,
+# only these are parsed if partial parsing is enabled (utility.set_partial_parsing)
+CHARACTER_PAGE_REGIONS = utility.page_regions(
+    ('meta', 'property', 'og:url'),
+    ('h1', 'class', 'title-name'),          # name with nicknames in quotes
+    ('div', 'id', 'content')
+)
+
+# sections of a character page (div.normal_header followed by tables with one row per item), by field
+CHARACTER_SECTIONS = {'animeography': 'Animeography', 'mangaography': 'Mangaography', 'voice_actors': 'Voice Actors'}
+MANGA_URL_PATTERN = re.compile(r'(?:https?://)?(?:www\.)?myanimelist\.net/manga/(\d+)', re.I)
+# "<label>: <value>" lines of the description (e.g. Birthday: June 26), other lines are the description
+DETAIL_PATTERN = re.compile(r'^([A-Za-z][\w \'()/.-]{0,30}):\s*(\S.*)$')
 
 def get_character_info(url, full=False):
     '''
@@ -25,12 +51,27 @@ def get_character_info(url, full=False):
         info [dict]: mal anime information
     '''
     # TODO change full option to dict option, as add on (so check if is boolean or dict)
+    with metrics.scraping(url):
+        soup = utility.get_soup(url, regions=CHARACTER_PAGE_REGIONS)
+        return parse_character_info(soup, url)
+
+@metrics.timed('extract.character')
+def parse_character_info(soup, url):
+    '''
+    Parses character information from a mal character page.
+
+    Parameters:
+        soup [bs4.BeautifulSoup]: soup of a mal character page
+        url [string]: mal character url (https://myanimelist.net/character/...)
+
+    Returns
+        info [dict]: mal character information
+    '''
     info = {}
-    soup = utility.get_soup(url)
     content = soup.find('div', {'id': 'content'})
     
     ## META INFO -START
-    mal_id = url[url.find('/character/')+1:].split('/')[1]
+    mal_id = utility.parse_mal_url(url).mal_id
     info['mal_id'] = mal_id
 
     url_tag = soup.find('meta', property="og:url")
@@ -42,14 +83,25 @@ def get_character_info(url, full=False):
 
     ### NAME -START
     eng_name_tag = content.find('h2', {'class':'normal_header'})    # 1st h2 header in content div
-    jap_name_tag = eng_name_tag.find('small')
+    # details and description are the text after the name header
+    details, description = parse_description(eng_name_tag)
+    jap_name_tag = eng_name_tag.find('small') if eng_name_tag else None
     if jap_name_tag:
         info['jap_name'] = re.sub(r'[\(\)]', '', jap_name_tag.text)
     if eng_name_tag:
         utility.remove_children(eng_name_tag)
-        info['eng_name'] = eng_name_tag.text
+        info['eng_name'] = eng_name_tag.text.strip()
+
+    # nicknames are in quotes in the title (e.g. Sebastian "Sebas" Michaelis)
+    title_tag = soup.find('h1', {'class': 'title-name'})
+    info['nicknames'] = re.findall(r'"([^"]*)"', title_tag.text) if title_tag else []
     ### NAME -END
 
+    ### DETAILS AND DESCRIPTION -START
+    info['details'] = details
+    info['description'] = description
+    ### DETAILS AND DESCRIPTION -END
+
     ### MEMBER FAVES -START
     search = re.search(r'Member Favorites: ([0-9]*\,*[0-9]*)\n', content.text)
     if search:
@@ -57,10 +109,163 @@ def get_character_info(url, full=False):
         info['member_faves'] = member_faves
     ### MEMBER FAVES -END
 
+    ### ANIMEOGRAPHY, MANGAOGRAPHY, VOICE ACTORS -START
+    headers = {header.text.strip(): header for header in content.find_all('div', {'class': 'normal_header'})}
+    for field, name in CHARACTER_SECTIONS.items():
+        rows = []
+        for row in section_rows(headers.get(name)):
+            item = parse_section_row(row, field)
+            if item:
+                rows.append(item)
+        info[field] = rows
+    ### ANIMEOGRAPHY, MANGAOGRAPHY, VOICE ACTORS -END
+
     ### POST-PROCESSING -START
-    info['retrieved_on'] = timestamp
+    info['retrieved_on'] = utility.get_timestamp()
     return info
 
+def parse_description(name_tag):
+    '''
+    Parses the details (e.g. birthday, height) and description of a character, the text after its name header.
+
+    Parameters:
+        name_tag [bs4.element.Tag]: name header of a mal character page (h2.normal_header)
+
+    Returns
+        details [dict]: "<label>: <value>" lines by label (e.g. {'Birthday': 'June 26'}), in page order
+        description [string]: the other lines (None if there are none)
+    '''
+    if name_tag is None:
+        return {}, None
+    parts = []
+    for sibling in name_tag.next_siblings:
+        if isinstance(sibling, NavigableString):
+            parts.append(str(sibling))
+        elif sibling.name == 'br':
+            parts.append('\n')
+        elif sibling.name == 'div' and 'normal_header' in (sibling.get('class') or []):
+            # next section (voice actors)
+            break
+        elif sibling.name not in ('script', 'table'):
+            parts.append(sibling.get_text())
+
+    details = {}
+    description = []
+    for line in ''.join(parts).split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        match = DETAIL_PATTERN.match(line)
+        if match and not description:
+            details[match.group(1).strip()] = match.group(2).strip()
+        else:
+            description.append(line)
+    return details, '\n'.join(description) or None
+
+def section_rows(header):
+    '''
+    Returns the rows of a section of a mal character page, the rows of the tables after its header.
+
+    Parameters:
+        header [bs4.element.Tag]: header of section (div.normal_header, e.g. Animeography), can be None
+
+    Returns
+        rows [list]: tr tags (empty if there is no header)
+    '''
+    rows = []
+    if header is None:
+        return rows
+    for sibling in header.next_siblings:
+        if isinstance(sibling, NavigableString):
+            continue
+        if sibling.name == 'table':
+            rows.extend(sibling.find_all('tr'))
+        elif sibling.name == 'br':
+            continue
+        else:
+            break
+    return rows
+
+def parse_section_row(row, field):
+    '''
+    Parses a row of the animeography, mangaography or voice actors of a mal character page.
+
+    Parameters:
+        row [bs4.element.Tag]: tr tag (see section_rows)
+        field [string]: one of CHARACTER_SECTIONS
+
+    Returns
+        item [dict]: title, url and type (role, e.g. Main) of anime / manga, va, va_url and va_lang of voice
+            actors (None if the row has no link of the section's type)
+    '''
+    for link in row.find_all('a', href=True):
+        name = link.text.strip()
+        if not name:
+            # picture link
+            continue
+        href = urljoin('https://myanimelist.net/', link['href'])
+        small = row.find('small')
+        role = small.text.strip() if small else None
+        if field == 'voice_actors':
+            mal_url = utility.parse_mal_url(href)
+            if mal_url.type == 'people':
+                return {'va': name, 'va_url': mal_url.url, 'va_lang': role}
+        elif field == 'animeography':
+            mal_url = utility.parse_mal_url(href)
+            if mal_url.type == 'anime' and mal_url.mal_id:
+                return {'title': name, 'url': mal_url.url, 'type': role}
+        elif MANGA_URL_PATTERN.match(href):
+            return {'title': name, 'url': href, 'type': role}
+    return None
+
+def get_character_infos(urls, return_exceptions=False):
+    '''
+    Gets character information of many mal character urls at once, in parallel on the shared executor
+    (see fetcher.submit, at most fetcher.EXECUTOR_WORKERS at a time, within the limits of the fetcher).
+    Every character is only fetched once, however many urls it has in urls (e.g. the rows of
+    anime.get_anime_characters, a row per voice actor of a character).
+
+    Parameters:
+        urls [iterable]: mal character urls
+        return_exceptions [bool] [default=False]: return the exception of a character that failed in place of
+            its information, instead of raising it
+
+    Returns
+        infos [list]: mal character information of every url, in the order of urls
+    '''
+    urls = list(urls)
+    futures = {}
+    for url in urls:
+        key = utility.parse_mal_url(url).url or url
+        if key not in futures:
+            futures[key] = fetcher.submit(get_character_info, url)
+
+    results = {}
+    try:
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[key] = e
+    finally:
+        for future in futures.values():
+            future.cancel()
+    return [results[utility.parse_mal_url(url).url or url] for url in urls]
+
+async def aget_character_info(url, full=False):
+    '''
+    Async variant of get_character_info, runs it on a worker thread so the event loop is not blocked.
+
+    Parameters:
+        url [string]: mal character url (https://myanimelist.net/character/...)
+
+    Returns
+        info [dict]: mal character information
+    '''
+    return await fetcher.run_async(get_character_info, url, full=full)
+
 if __name__ == '__main__':
     # cmd line colours
     RESET = '\033[0;0m'
@@ -83,6 +288,7 @@ if __name__ == '__main__':
     try: 
         data = get_character_info(args['input'])
 
+        timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S+08:00')
         output_filename = 'output_{}.json'.format(re.sub(r'\W', '', timestamp))
         utility.save_json(data, output_filename)
         print('{}information saved to file: {}'.format(GREEN, output_filename))
@@ -0,0 +1,219 @@
+'''
+Thin client of the scraping daemon (daemon.py). Only uses a few standard library modules (a plain
+socket instead of http.client, which imports the email package and ssl), so that importing it costs
+a few milliseconds instead of the ~250ms of the requests / bs4 imports of the scrapers.
+
+anime.py and character.py call forward_cli before importing anything else: while a daemon is
+running their cli is run on it, otherwise (or with MAL_DAEMON=off) they scrape in process as before.
+
+    client.get_anime_info('https://myanimelist.net/anime/4898/Kuroshitsuji', fields=['score'])
+
+Classes
+-------
+DaemonNotRunning: raised if no daemon is listening at the daemon address
+DaemonError: raised if the daemon answers with an error
+
+Methods
+-------
+get_address(): returns the (host, port) of the daemon (None if forwarding is turned off)
+is_running(): returns whether a daemon is running
+get_anime_info(url -> string, full -> bool, fields -> list): anime.get_anime_info on the daemon
+get_character_info(url -> string): character.get_character_info on the daemon
+forward_cli(command -> string, argv -> list): runs the cli of anime.py / character.py on the daemon
+'''
+
+import os
+import re
+import sys
+import json
+import socket
+from urllib.parse import urlencode
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8477
+# seconds to wait for a connection (a local daemon accepts at once) and for a scraped item
+CONNECT_TIMEOUT = 1
+READ_TIMEOUT = 300
+
+
+class DaemonNotRunning(ConnectionError):
+    pass
+
+
+class DaemonError(Exception):
+    '''
+    Error of a call on the daemon.
+
+    Attributes:
+        status [int]: http status of the response (400: invalid url, 404: page not found, 502: other errors)
+        error [string]: type of the exception raised in the daemon (e.g. 'PageNotFound')
+    '''
+
+    def __init__(self, status, error, message):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+
+
+def get_address():
+    '''
+    Returns the address of the daemon, from the MAL_DAEMON environment variable (<host>:<port>, or
+    off to never forward), DEFAULT_HOST:DEFAULT_PORT if it is not set.
+
+    Returns:
+        address [tuple]: host [string], port [int] (None if forwarding is turned off)
+    '''
+    address = os.environ.get('MAL_DAEMON', '').strip()
+    if address.lower() in ('off', '0', 'no'):
+        return None
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        return DEFAULT_HOST, DEFAULT_PORT
+    return host or DEFAULT_HOST, int(port)
+
+
+def request(path, params=None, address=None):
+    '''
+    Makes a call on the daemon.
+
+    Parameters:
+        path [string]: endpoint (e.g. '/anime')
+        params [dict] [default=None]: query parameters
+        address [tuple] [default=None]: (host, port) of the daemon (get_address() if not given)
+
+    Returns:
+        data [dict]: json response
+    '''
+    host, port = address or get_address() or (DEFAULT_HOST, DEFAULT_PORT)
+    try:
+        sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    except OSError as e:
+        raise DaemonNotRunning('no daemon at {}:{} ({})'.format(host, port, e))
+    with sock:
+        sock.settimeout(READ_TIMEOUT)
+        target = path + ('?' + urlencode(params) if params else '')
+        sock.sendall('GET {} HTTP/1.1\r\nHost: {}:{}\r\nConnection: close\r\n\r\n'.format(target, host, port).encode('ascii'))
+        chunks = []
+        chunk = sock.recv(65536)
+        while chunk:
+            chunks.append(chunk)
+            chunk = sock.recv(65536)
+
+    head, _, body = b''.join(chunks).partition(b'\r\n\r\n')
+    status_line = head.split(b'\r\n', 1)[0].split()
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/') or not status_line[1].isdigit():
+        raise ValueError('{}:{} is not a daemon (no http response)'.format(host, port))
+    status = int(status_line[1])
+    data = json.loads(body.decode('utf-8'))
+    if status != 200:
+        raise DaemonError(status, data.get('error'), data.get('message'))
+    return data
+
+
+def is_running():
+    '''
+    Returns whether a daemon is running at the daemon address.
+    '''
+    if get_address() is None:
+        return False
+    try:
+        request('/health')
+    except (DaemonNotRunning, DaemonError, ValueError):
+        return False
+    return True
+
+
+def get_anime_info(url, full=False, fields=None):
+    '''
+    Gets anime information from mal anime url, on the daemon (see anime.get_anime_info).
+
+    Parameters:
+        url [string]: mal anime url (https://myanimelist.net/anime/...)
+        full [bool] [default=False]: indicate whether to get additional information (episodes, mal statistics)
+        fields [list] [default=None]: only get these fields
+
+    Returns
+        info [dict]: mal anime information
+    '''
+    params = {'url': url}
+    if full:
+        params['full'] = 1
+    if fields:
+        params['fields'] = ','.join(fields)
+    return request('/anime', params)
+
+
+def get_character_info(url):
+    '''
+    Gets character information from mal character url, on the daemon (see character.get_character_info).
+
+    Parameters:
+        url [string]: mal character url (https://myanimelist.net/character/...)
+
+    Returns
+        info [dict]: mal character information
+    '''
+    return request('/character', {'url': url})
+
+
+def forward_cli(command, argv):
+    '''
+    Runs the cli of anime.py or character.py on the daemon: the information is got by the daemon, and
+    saved to output_<timestamp>.json in the current directory with utility.save_json, as the cli does.
+    Nothing is done if no daemon is running, argv has options the client does not know (e.g. --help) or
+    the daemon rejects the arguments (400), the cli then runs in process.
+
+    Parameters:
+        command [string]: 'anime' or 'character'
+        argv [list]: arguments of the cli (sys.argv[1:])
+
+    Returns
+        forwarded [bool]: whether the cli was run on the daemon
+    '''
+    # cmd line colours
+    RESET = '\033[0;0m'
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+
+    if get_address() is None:
+        return False
+    positional, options = [], {}
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if command == 'anime' and (arg == '--fields' and args or arg.startswith('--fields=')):
+            options['fields'] = arg.partition('=')[2] if '=' in arg else args.pop(0)
+        elif arg.startswith('-'):
+            return False
+        else:
+            positional.append(arg)
+    if len(positional) != 1:
+        return False
+
+    try:
+        if command == 'anime':
+            fields = [field.strip() for field in options.get('fields', '').split(',') if field.strip()] or None
+            data = get_anime_info(positional[0], fields=fields)
+        else:
+            data = get_character_info(positional[0])
+    except DaemonNotRunning:
+        return False
+    except DaemonError as e:
+        if e.status == 400:
+            # invalid arguments (url, fields), reported by the cli as without a daemon
+            return False
+        print('{}ERROR: {}'.format(RED, str(e)))
+        sys.stdout.write(RESET)
+        return True
+    except (ValueError, OSError) as e:
+        print('{}ERROR: {}'.format(RED, str(e)))
+        sys.stdout.write(RESET)
+        return True
+
+    # imported once the information is got, utility imports requests / bs4
+    import utility
+    output_filename = 'output_{}.json'.format(re.sub(r'\W', '', utility.get_timestamp()))
+    utility.save_json(data, output_filename)
+    print('{}information saved to file: {}'.format(GREEN, output_filename))
+    sys.stdout.write(RESET)
+    return True
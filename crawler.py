@@ -0,0 +1,264 @@
+'''
+Graph crawl of mal anime: starts from seed urls and follows their related anime (and optionally their
+character and voice actor links), breadth first, fetching every entity once.
+
+Links are classified with utility.parse_mal_url and deduplicated by entity (mal type and mal id), so
+an anime reached from many others (e.g. the first season of a long franchise) is only fetched once,
+whatever its url looks like (with or without the title, http or www.). The crawl goes one depth at a
+time, each depth is scraped concurrently with batch.run_batch, and stops at max_depth or once budget
+entities were fetched.
+
+Classes
+-------
+Crawler: breadth-first crawl of the links between mal entities
+
+Methods
+-------
+entity_key(url -> tuple): returns the (mal type, mal id) of a mal url
+
+Usage:
+    python crawler.py <file_of_seed_urls_or_ids> [--depth 2] [--budget 500] [--follow related,characters] [--out <dir>]
+'''
+
+import sys
+import argparse
+import functools
+import utility
+import fetcher
+import metrics
+import anime
+import batch
+from cache import ResponseCache
+from sink import JsonLinesSink
+from entity_store import EntityStore
+
+# link types that can be followed: related anime, characters of an anime, voice actors of its characters
+LINK_TYPES = ['related', 'characters', 'voice_actors']
+
+# mal types that have a scraper (see batch.scrape), links to other types (e.g. voice actors) are not fetched
+SCRAPED_TYPES = ['anime', 'character']
+ENTITY_TYPES = ['anime', 'character', 'people']
+
+
+def entity_key(url):
+    '''
+    Returns the entity a mal url is of, the same for every url of it (e.g. with or without the title).
+
+    Parameters:
+        url [string]: mal url
+
+    Returns
+        key [tuple]: mal type and mal id (None if the url is not of a mal anime, character or person)
+    '''
+    mal_url = utility.parse_mal_url(url or '')
+    return (mal_url.type, mal_url.mal_id) if mal_url.type in ENTITY_TYPES and mal_url.mal_id else None
+
+
+def get_links(info, follow):
+    '''
+    Returns the links of a scraped anime.
+
+    Parameters:
+        info [dict]: scraped anime information
+        follow [list]: link types to return (see LINK_TYPES)
+
+    Returns
+        links [list]: (link type, url) tuples
+    '''
+    links = []
+    if 'related' in follow:
+        related_links = [related.get('link') or '' for related in info.get('related') or []]
+        for link, mal_url in zip(related_links, utility.parse_mal_urls(related_links)):
+            if mal_url.type == 'anime':
+                links.append(('related', link))
+    for row in info.get('characters') or []:
+        if 'characters' in follow and row.get('url'):
+            links.append(('characters', row['url']))
+        if 'voice_actors' in follow and row.get('va_url'):
+            links.append(('voice_actors', row['va_url']))
+    return links
+
+
+class Crawler:
+    '''
+    Breadth-first crawl of the links between mal entities.
+
+    Parameters:
+        follow [list] [default=['related']]: link types to follow (see LINK_TYPES); voice actor links are
+            returned as edges, but voice actors are not fetched (there is no scraper for people pages)
+        max_depth [int] [default=2]: number of links followed from the seeds (0: only fetch the seeds)
+        budget [int] [default=None]: max number of entities fetched (no limit if not given)
+        workers [int] [default=4]: number of worker threads per depth (see batch.run_batch)
+        full [bool] [default=False]: passed on to anime.get_anime_info
+        scraper [callable] [default=batch.scrape]: function (url, full -> mal_type, info) that scrapes an entity
+        priority [int] [default=fetcher.BATCH]: priority of the requests of the crawl (see fetcher.priority)
+    '''
+
+    def __init__(self, follow=('related',), max_depth=2, budget=None, workers=4, full=False, scraper=batch.scrape,
+                 priority=fetcher.BATCH):
+        unknown = set(follow) - set(LINK_TYPES)
+        if unknown:
+            raise ValueError('unknown link types {}, should be some of {}'.format(sorted(unknown), LINK_TYPES))
+        self.follow = list(follow)
+        self.max_depth = max_depth
+        self.budget = budget
+        self.workers = workers
+        self.full = full
+        self.scraper = scraper
+        self.priority = priority
+        self.visited = {}   # entity key: canonical url it is fetched by
+
+    def scrape(self, url, full=False):
+        '''
+        Scrapes an entity, with the characters of anime if character or voice actor links are followed.
+        Has the same signature as batch.scrape.
+        '''
+        mal_type, info = self.scraper(url, full)
+        if mal_type == 'anime' and 'characters' not in info and {'characters', 'voice_actors'} & set(self.follow):
+            info.update(anime.replace_unavailable(anime.get_subpage_info(info['url'], 'characters')))
+        return mal_type, info
+
+    def crawl(self, seeds, on_result, on_edge=None, progress=None):
+        '''
+        Crawls from seed urls.
+
+        Parameters:
+            seeds [iterable]: mal anime/character urls to start from
+            on_result [callable]: called with (url, mal_type, info, error) for every fetched entity (see batch.run_batch)
+            on_edge [callable] [default=None]: called with (from url, link type, to url) for every followed link,
+                also for links to entities that were already fetched
+            progress [callable] [default=None]: called with (depth, done, failed, skipped, elapsed seconds) of the
+                depth being crawled, every batch.PROGRESS_INTERVAL seconds and once the depth is done
+
+        Returns
+            counts [dict]: number of entities fetched (done), failed, links to entities already seen (duplicate),
+                links not followed because of budget / max_depth (over_budget, over_depth)
+        '''
+        counts = {'done': 0, 'failed': 0, 'duplicate': 0, 'over_budget': 0, 'over_depth': 0}
+        frontier = []
+        for url in seeds:
+            self._visit(url, frontier, counts)
+
+        depth = 0
+        while frontier:
+            next_frontier = []
+
+            def on_depth_result(url, mal_type, info, error):
+                on_result(url, mal_type, info, error)
+                if info is None or mal_type != 'anime':
+                    return
+                for link_type, link in get_links(info, self.follow):
+                    key = entity_key(link)
+                    if key is None:
+                        continue
+                    if on_edge:
+                        on_edge(url, link_type, self.visited.get(key, utility.parse_mal_url(link).url))
+                    if key in self.visited:
+                        counts['duplicate'] += 1
+                    elif depth >= self.max_depth:
+                        counts['over_depth'] += 1
+                    elif key[0] in SCRAPED_TYPES:
+                        self._visit(link, next_frontier, counts)
+
+            level_counts = batch.run_batch(frontier, on_depth_result, workers=self.workers, full=self.full,
+                                           progress=functools.partial(progress, depth) if progress else None,
+                                           scraper=self.scrape, priority=self.priority)
+            counts['done'] += level_counts['done']
+            counts['failed'] += level_counts['failed']
+            frontier = next_frontier
+            depth += 1
+        return counts
+
+    def _visit(self, url, frontier, counts):
+        # adds an entity to the frontier, unless it was seen before or the budget is used up
+        key = entity_key(url)
+        if key is None or key in self.visited:
+            return
+        if self.budget is not None and len(self.visited) >= self.budget:
+            counts['over_budget'] += 1
+            return
+        self.visited[key] = utility.parse_mal_url(url).url
+        frontier.append(self.visited[key])
+
+
+if __name__ == '__main__':
+    # cmd line colours
+    RESET = '\033[0;0m'
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+
+    ap = argparse.ArgumentParser(description='crawl mal anime by following their related anime, breadth first')
+
+    # positional arguments
+    ap.add_argument('input', help='file with one seed mal url or id per line ("-" to read from stdin)')
+
+    # optional arguments
+    ap.add_argument('--type', default='anime', choices=['anime', 'character'], help='mal type of lines that are only an id')
+    ap.add_argument('--follow', default='related', help='link types to follow, some of {}'.format(','.join(LINK_TYPES)))
+    ap.add_argument('--depth', type=int, default=2, help='number of links followed from the seeds')
+    ap.add_argument('--budget', type=int, help='max number of entities fetched')
+    ap.add_argument('--full', action='store_true', help='get additional anime information (episodes, stats, characters, staff)')
+    ap.add_argument('--workers', type=int, default=4, help='number of worker threads')
+    ap.add_argument('--rps', type=float, default=1.0, help='max requests per second, across all workers')
+    ap.add_argument('--out', default='.', help='directory to save output files in')
+    ap.add_argument('--compress', choices=['gzip', 'zstd'], help='compression of jsonl files')
+    ap.add_argument('--cache', help='response cache database, pages are served from it until they expire')
+    ap.add_argument('--index', help='entity store database, every fetched entity is added to it (see entity_store.py)')
+    ap.add_argument('--metrics-port', type=int, help='serve stage timings and counters as Prometheus text at http://localhost:<port>/metrics')
+    ap.add_argument('--metrics-interval', type=float, help='write a summary of stage timings and counters to stderr every this many seconds')
+    ap.add_argument('--profile-rate', type=float, default=0, help='share of items that are profiled with cProfile (e.g. 0.01)')
+    ap.add_argument('--profile-dir', default='profiles', help='directory to save profiles in')
+
+    args = vars(ap.parse_args())
+
+    try:
+        crawler = Crawler([link_type for link_type in args['follow'].split(',') if link_type], max_depth=args['depth'],
+                          budget=args['budget'], workers=args['workers'], full=args['full'])
+    except ValueError as e:
+        ap.error(str(e))
+    if args['metrics_port'] or args['metrics_interval'] or args['profile_rate']:
+        metrics.enable(profile_rate=args['profile_rate'], profile_dir=args['profile_dir'])
+        if args['metrics_port']:
+            metrics.start_server(args['metrics_port'])
+        if args['metrics_interval']:
+            metrics.start_summary_log(args['metrics_interval'])
+    response_cache = ResponseCache(args['cache']) if args['cache'] else None
+    fetcher.set_fetcher(fetcher.Fetcher(rate_limit=args['rps'], max_concurrency=args['workers'], cache=response_cache))
+
+    # records by mal type, and the followed links in edges-<datetime>-<n>.jsonl
+    sinks = {prefix: JsonLinesSink(args['out'], prefix=prefix, compression=args['compress'])
+             for prefix in ['anime', 'character', 'edges']}
+    entity_store = EntityStore(args['index']) if args['index'] else None
+
+    def on_result(url, mal_type, info, error):
+        if error is not None:
+            sys.stderr.write('{}ERROR: {}: {}{}\n'.format(RED, url, error, RESET))
+            return
+        sinks[mal_type].write(info)
+        if entity_store:
+            entity_store.write(mal_type, info)
+
+    def on_edge(from_url, link_type, to_url):
+        sinks['edges'].write({'from': from_url, 'type': link_type, 'to': to_url})
+
+    def progress(depth, done, failed, skipped, elapsed):
+        rate = (done + failed) / elapsed if elapsed else 0
+        sys.stderr.write('depth {}: {} done, {} failed ({:.2f} items/s)\n'.format(depth, done, failed, rate))
+
+    source = sys.stdin if args['input'] == '-' else open(args['input'], encoding='utf-8')
+    try:
+        counts = crawler.crawl(batch.read_items(source, args['type']), on_result, on_edge, progress)
+        colour = GREEN if counts['failed'] == 0 else RED
+        print('{}crawl finished: {} done, {} failed, {} duplicate links, {} links over budget, {} over depth'.format(
+            colour, counts['done'], counts['failed'], counts['duplicate'], counts['over_budget'], counts['over_depth']))
+    finally:
+        for output_sink in sinks.values():
+            output_sink.close()
+        if entity_store:
+            entity_store.close()
+        if response_cache:
+            # writes the buffered access times of cache hits
+            response_cache.close()
+        if source is not sys.stdin:
+            source.close()
+        sys.stdout.write(RESET)
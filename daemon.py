@@ -0,0 +1,168 @@
+'''
+Daemon keeping the scrapers loaded between cli calls: a local HTTP service wrapping
+anime.get_anime_info and character.get_character_info.
+
+Every `python anime.py <url>` starts an interpreter and imports requests and bs4 before it fetches
+anything. While a daemon is running, anime.py and character.py forward to it (see client.py) before
+importing them, and the daemon keeps the pooled keep-alive connections to myanimelist, the response
+cache, the html parser and the url caches warm between calls, so a call mostly costs the fetch.
+
+Endpoints (json responses, errors are {"error": <exception type>, "message": <message>}):
+    GET /anime?url=<mal anime url>[&full=1][&fields=score,members]
+    GET /character?url=<mal character url>
+    GET /health
+
+Error status codes: 400 (not a mal url of the endpoint's type, unknown parameters or fields, see
+anime.ANIME_FIELDS), 404 (page not found on myanimelist), 502 (any other error of the scraper).
+
+Classes
+-------
+DaemonHandler: request handler of the daemon
+
+Methods
+-------
+make_server(host -> string, port -> int): returns the daemon server (not started)
+
+Usage:
+    python daemon.py [--port 8477] [--cache <file>] [--rps 1] [--parser lxml] [--partial]
+'''
+
+import os
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import utility
+import fetcher
+import anime
+import character
+import client
+from cache import ResponseCache
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    # keep-alive, so that a client making many calls (client.get_anime_info) reuses its connection
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # query parameters of every endpoint
+    PARAMETERS = {'/anime': ['url', 'full', 'fields'], '/character': ['url'], '/health': []}
+
+    started = time.time()
+    counts = {'requests': 0, 'errors': 0}
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        routes = {'/anime': self.get_anime, '/character': self.get_character, '/health': self.get_health}
+        route = routes.get(url.path.rstrip('/'))
+        if route is None:
+            self.send_json(404, {'error': 'NotFound', 'message': 'no endpoint {}'.format(url.path)})
+            return
+        unknown = sorted(set(params) - set(self.PARAMETERS[url.path.rstrip('/')]))
+        if unknown:
+            self.send_json(400, {'error': 'ValueError', 'message': 'unknown parameters: {} (parameters of {}: {})'.format(
+                ', '.join(unknown), url.path, ', '.join(self.PARAMETERS[url.path.rstrip('/')]) or 'none')})
+            return
+        with self._lock:
+            self.counts['requests'] += 1
+        try:
+            status, data = route(params)
+        except utility.PageNotFound as e:
+            status, data = 404, self.error(e)
+        except Exception as e:
+            status, data = 502, self.error(e)
+        self.send_json(status, data)
+
+    def get_anime(self, params):
+        url = params.get('url', '')
+        if utility.get_mal_type(url) != 'anime':
+            return 400, {'error': 'ValueError', 'message': 'given url ({}) is not a valid mal anime url'.format(url)}
+        if params.get('full', '0') not in ('0', '1', 'true', 'false'):
+            return 400, {'error': 'ValueError', 'message': 'full must be 1 or 0 (true or false)'}
+        fields = [field.strip() for field in params['fields'].split(',') if field.strip()] if params.get('fields') else None
+        unknown = sorted(set(fields or []) - set(anime.ANIME_FIELDS))
+        if unknown:
+            return 400, {'error': 'ValueError', 'message': 'unknown fields: {} (fields: {})'.format(
+                ', '.join(unknown), ', '.join(anime.ANIME_FIELDS))}
+        return 200, anime.get_anime_info(url, full=params.get('full') in ('1', 'true'), fields=fields)
+
+    def get_character(self, params):
+        url = params.get('url', '')
+        if utility.get_mal_type(url) != 'character':
+            return 400, {'error': 'ValueError', 'message': 'given url ({}) is not a valid mal character url'.format(url)}
+        return 200, character.get_character_info(url)
+
+    def get_health(self, params):
+        with self._lock:
+            counts = dict(self.counts)
+        return 200, dict(counts, pid=os.getpid(), uptime=time.time() - self.started)
+
+    def error(self, e):
+        with self._lock:
+            self.counts['errors'] += 1
+        return {'error': type(e).__name__, 'message': str(e)}
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=client.DEFAULT_HOST, port=client.DEFAULT_PORT):
+    '''
+    Returns the daemon server, bound to host and port (server.serve_forever() starts it).
+
+    Parameters:
+        host [string] [default=client.DEFAULT_HOST]: address to listen on (only local clients by default)
+        port [int] [default=client.DEFAULT_PORT]: port to listen on
+
+    Returns
+        server [http.server.ThreadingHTTPServer]
+    '''
+    server = ThreadingHTTPServer((host, port), DaemonHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    # cmd line colours
+    RESET = '\033[0;0m'
+    GREEN = '\033[0;32m'
+
+    ap = argparse.ArgumentParser(description='keep the scrapers loaded, anime.py and character.py forward to it while it runs')
+    ap.add_argument('--host', default=client.DEFAULT_HOST, help='address to listen on')
+    ap.add_argument('--port', type=int, default=client.DEFAULT_PORT, help='port to listen on (clients find it with the MAL_DAEMON environment variable, e.g. 127.0.0.1:8477)')
+    ap.add_argument('--workers', type=int, default=4, help='max requests to myanimelist in flight')
+    ap.add_argument('--rps', type=float, default=1.0, help='max requests per second to myanimelist, across all calls')
+    ap.add_argument('--cache', help='response cache database, pages are served from it until they expire')
+    ap.add_argument('--parser', default=utility.default_parser, choices=utility.PARSERS, help='html parser')
+    ap.add_argument('--partial', action='store_true', help='only parse the regions of pages that are scraped')
+
+    args = vars(ap.parse_args())
+
+    utility.set_parser(args['parser'])
+    utility.set_partial_parsing(args['partial'])
+    response_cache = ResponseCache(args['cache']) if args['cache'] else None
+    fetcher.set_fetcher(fetcher.Fetcher(rate_limit=args['rps'], max_concurrency=args['workers'], cache=response_cache))
+
+    server = make_server(args['host'], args['port'])
+    print('{}daemon listening on http://{}:{}{}'.format(GREEN, args['host'], args['port'], RESET))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        fetcher.get_fetcher().close()
+        if response_cache:
+            response_cache.close()
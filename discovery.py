@@ -0,0 +1,331 @@
+'''
+Discovery of the mal anime to scrape, so that whole seasons, top lists or id ranges can be refreshed
+without a list of urls.
+
+Anime are listed from season pages (https://myanimelist.net/anime/season/<year>/<season>) and top
+anime pages (https://myanimelist.net/topanime.php, 50 per page, fetched one page at a time), or made
+from ranges of mal ids (https://myanimelist.net/anime/<mal id>, mal serves anime pages at urls
+without the title too). Anime are yielded as soon as the page listing them is parsed, so batch.run_batch
+starts scraping them while the next pages are fetched, and every anime is only yielded once.
+
+Most ids of a range were never used (or the anime was removed), their pages are 404 (utility.PageNotFound).
+They cost one request each (subpages of urls without a title are only requested once the anime page
+was found), and are remembered in a NotFoundCache so that the next refreshes skip them
+without any request, until they are checked again after NOT_FOUND_TTL.
+
+    not_found = NotFoundCache('not_found.db')
+    urls = discover(seasons=[(2024, 'spring')], id_ranges=[(1, 60000)], not_found=not_found)
+    batch.run_batch(urls, on_result)      # on_result adds urls that raised utility.PageNotFound to not_found
+
+Classes
+-------
+NotFoundCache: SQLite backed record of mal ids whose pages are 404
+
+Methods
+-------
+get_season_urls(year -> int, season -> string): returns the anime urls of a season page
+iter_top_urls(limit -> int, top_type -> string): yields anime urls of the top anime pages, best first
+iter_id_urls(start -> int, end -> int): yields anime urls of a range of mal ids
+discover(seasons -> list, top -> int, id_ranges -> list, not_found -> NotFoundCache): yields the anime urls of all sources
+parse_season(season -> string): returns (year, season) of a string like 2024/spring
+parse_id_ranges(ranges -> string): returns (start, end) ranges of a string like 1-100,250
+'''
+
+import time
+import sqlite3
+import threading
+import itertools
+from urllib.parse import urljoin
+import utility
+
+MAL_BASE_URL = 'https://myanimelist.net/'
+SEASON_URL_FORMAT = 'https://myanimelist.net/anime/season/{}/{}'
+TOP_URL_FORMAT = 'https://myanimelist.net/topanime.php?limit={}'
+ANIME_URL_FORMAT = 'https://myanimelist.net/anime/{}'
+
+SEASONS = ['winter', 'spring', 'summer', 'fall']
+# lists of the top anime pages ('': all anime, by score)
+TOP_TYPES = ['', 'airing', 'upcoming', 'tv', 'movie', 'ova', 'ona', 'special', 'bypopularity', 'favorite']
+TOP_PAGE_SIZE = 50
+
+# tags that each hold one anime of a listing page (only these are parsed if partial parsing is enabled)
+SEASON_ANIME = ('div', 'class', 'seasonal-anime')
+TOP_ANIME = ('tr', 'class', 'ranking-list')
+
+# seconds an id is skipped for after its page was 404 (ids are given to new anime)
+DAY = 24 * 60 * 60
+NOT_FOUND_TTL = 30 * DAY
+# number of urls checked against the NotFoundCache per query
+CHECK_BATCH_SIZE = 100
+
+
+### FUNCTIONS
+def parse_anime_links(soup, region):
+    '''
+    Returns the anime urls of a listing page, the first anime link of every region tag.
+
+    Parameters:
+        soup [bs4.BeautifulSoup]: soup of a listing page (e.g. season or top anime page)
+        region [tuple]: (tag name, attribute name, attribute value) of the tags that each hold one anime
+
+    Returns
+        urls [list]: canonical anime urls, in page order (without duplicates)
+    '''
+    tag, attr, value = region
+    urls = []
+    for item in soup.find_all(tag, attrs={attr: value}):
+        hrefs = [urljoin(MAL_BASE_URL, link['href']) for link in item.find_all('a', href=True)]
+        # links to producers, genres etc. of the anime have no mal id
+        for mal_url in utility.parse_mal_urls(hrefs):
+            if mal_url.type == 'anime' and mal_url.mal_id:
+                if mal_url.url not in urls:
+                    urls.append(mal_url.url)
+                break
+    return urls
+
+
+def get_season_urls(year, season):
+    '''
+    Returns the anime of a season (incl. continuing anime and the ONAs, OVAs, movies and specials of the season).
+
+    Parameters:
+        year [int]: year of season (e.g. 2024)
+        season [string]: one of SEASONS
+
+    Returns
+        urls [list]: canonical anime urls, in page order
+    '''
+    if season not in SEASONS:
+        raise ValueError('season must be one of {}'.format(SEASONS))
+    soup = utility.get_soup(SEASON_URL_FORMAT.format(year, season), regions=utility.page_regions(SEASON_ANIME))
+    return parse_anime_links(soup, SEASON_ANIME)
+
+
+def iter_top_urls(limit=None, top_type=''):
+    '''
+    Yields the anime of the top anime pages, best first. Pages are fetched one at a time, as the
+    anime of the previous page are used up.
+
+    Parameters:
+        limit [int] [default=None]: number of anime to yield (the whole list if not given)
+        top_type [string] [default='']: one of TOP_TYPES ('': all anime, by score)
+
+    Returns
+        urls [generator]: canonical anime urls
+    '''
+    if top_type not in TOP_TYPES:
+        raise ValueError('top_type must be one of {}'.format(TOP_TYPES))
+    count = 0
+    for offset in itertools.count(0, TOP_PAGE_SIZE):
+        url = TOP_URL_FORMAT.format(offset) + ('&type={}'.format(top_type) if top_type else '')
+        try:
+            soup = utility.get_soup(url, regions=utility.page_regions(TOP_ANIME))
+        except utility.PageNotFound:
+            # past the end of the list
+            return
+        urls = parse_anime_links(soup, TOP_ANIME)
+        for url in urls:
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield url
+        if len(urls) < TOP_PAGE_SIZE:
+            return
+
+
+def iter_id_urls(start, end):
+    '''
+    Yields the anime urls of a range of mal ids (urls without a title, most ids of a range are not
+    used, see NotFoundCache).
+
+    Parameters:
+        start [int]: first mal id
+        end [int]: last mal id (included)
+
+    Returns
+        urls [generator]: anime urls (https://myanimelist.net/anime/<mal id>)
+    '''
+    for mal_id in range(start, end + 1):
+        yield ANIME_URL_FORMAT.format(mal_id)
+
+
+def discover(seasons=(), top=None, top_type='', id_ranges=(), not_found=None):
+    '''
+    Yields the anime of seasons, the top anime pages and ranges of mal ids, each anime only once
+    (by mal id) and without those that are in not_found.
+
+    Parameters:
+        seasons [list] [default=()]: (year, season) of season pages (see get_season_urls)
+        top [int] [default=None]: number of top anime (see iter_top_urls), none if not given (0: all)
+        top_type [string] [default='']: top anime list (see TOP_TYPES)
+        id_ranges [list] [default=()]: (start, end) of mal id ranges, both included (see iter_id_urls)
+        not_found [NotFoundCache] [default=None]: ids to skip (see NotFoundCache.filter)
+
+    Returns
+        urls [generator]: anime urls
+    '''
+    sources = [_season_urls(year, season) for year, season in seasons]
+    if top is not None:
+        sources.append(iter_top_urls(top or None, top_type))
+    sources.extend(iter_id_urls(start, end) for start, end in id_ranges)
+
+    def unique(urls):
+        seen = set()
+        for url in urls:
+            mal_id = utility.parse_mal_url(url).mal_id
+            if mal_id not in seen:
+                seen.add(mal_id)
+                yield url
+
+    urls = unique(itertools.chain.from_iterable(sources))
+    return not_found.filter(urls) if not_found is not None else urls
+
+
+def _season_urls(year, season):
+    # season page is only fetched once its anime are needed
+    yield from get_season_urls(year, season)
+
+
+def parse_season(season):
+    '''
+    Returns the year and season of a string like 2024/spring.
+
+    Parameters:
+        season [string]: <year>/<season>
+
+    Returns
+        season [tuple]: year [int], season [string] (one of SEASONS)
+    '''
+    year, _, name = season.partition('/')
+    name = name.strip().lower()
+    if not year.strip().isdigit() or name not in SEASONS:
+        raise ValueError('{} should look like 2024/spring (season one of {})'.format(season, SEASONS))
+    return int(year), name
+
+
+def parse_id_ranges(ranges):
+    '''
+    Returns the mal id ranges of a string like 1-100,250,300-400.
+
+    Parameters:
+        ranges [string]: comma separated ids and <first id>-<last id> ranges
+
+    Returns
+        ranges [list]: (start, end) tuples, both included
+    '''
+    parsed = []
+    for item in ranges.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition('-')
+        end = end or start
+        if not start.strip().isdigit() or not end.strip().isdigit() or int(start) > int(end):
+            raise ValueError('{} should look like 1-100,250 (ids or ranges of ids)'.format(ranges))
+        parsed.append((int(start), int(end)))
+    return parsed
+
+
+### CLASSES
+class NotFoundCache:
+    '''
+    SQLite backed record of mal ids whose pages are 404, shared by all threads that use it.
+    Ids are skipped until they are older than ttl, then they are checked again (new anime get unused ids).
+
+    Parameters:
+        path [string]: path of SQLite database (created if it does not exist)
+        ttl [float] [default=NOT_FOUND_TTL]: seconds an id is skipped for after its page was 404
+
+    Attributes:
+        skipped [int]: number of urls filter left out
+    '''
+
+    def __init__(self, path, ttl=NOT_FOUND_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS not_found (
+                mal_type TEXT,
+                mal_id INTEGER,
+                checked_at REAL,
+                PRIMARY KEY (mal_type, mal_id)
+            )''')
+        self._db.commit()
+
+    def add(self, url):
+        '''
+        Records that the page of a mal url is 404.
+
+        Parameters:
+            url [string]: mal anime / character url
+        '''
+        mal_url = utility.parse_mal_url(url)
+        if mal_url.mal_id is None:
+            return
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO not_found VALUES (?, ?, ?)',
+                             (mal_url.type, int(mal_url.mal_id), time.time()))
+            self._db.commit()
+
+    def remove(self, url):
+        '''
+        Forgets a mal url (e.g. once its page was found).
+
+        Parameters:
+            url [string]: mal anime / character url
+        '''
+        mal_url = utility.parse_mal_url(url)
+        if mal_url.mal_id is None:
+            return
+        with self._lock:
+            self._db.execute('DELETE FROM not_found WHERE mal_type = ? AND mal_id = ?',
+                             (mal_url.type, int(mal_url.mal_id)))
+            self._db.commit()
+
+    def __contains__(self, url):
+        return not self._missing([url])
+
+    def filter(self, urls, batch_size=CHECK_BATCH_SIZE):
+        '''
+        Yields the urls that are not known to be 404, checking batch_size urls per query.
+
+        Parameters:
+            urls [iterable]: mal urls
+            batch_size [int] [default=CHECK_BATCH_SIZE]: number of urls read ahead and checked at once
+
+        Returns
+            urls [generator]: urls that are not in the cache (or whose entry is older than ttl)
+        '''
+        urls = iter(urls)
+        while True:
+            chunk = list(itertools.islice(urls, batch_size))
+            if not chunk:
+                return
+            missing = self._missing(chunk)
+            self.skipped += len(chunk) - len(missing)
+            yield from missing
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _missing(self, urls):
+        # urls (of one batch) that are not known to be 404
+        keys = [utility.parse_mal_url(url) for url in urls]
+        ids = {}
+        for mal_url in keys:
+            if mal_url.mal_id is not None:
+                ids.setdefault(mal_url.type, []).append(int(mal_url.mal_id))
+        found = set()
+        with self._lock:
+            for mal_type, mal_ids in ids.items():
+                rows = self._db.execute(
+                    'SELECT mal_id FROM not_found WHERE mal_type = ? AND checked_at > ? AND mal_id IN ({})'.format(
+                        ', '.join('?' * len(mal_ids))),
+                    [mal_type, time.time() - self.ttl] + mal_ids).fetchall()
+                found.update((mal_type, str(row[0])) for row in rows)
+        return [url for url, mal_url in zip(urls, keys) if (mal_url.type, mal_url.mal_id) not in found]
@@ -0,0 +1,417 @@
+'''
+Local relational index of scraped mal entities, for lookups and graph queries without scanning output files.
+
+Scraped anime and characters are upserted into a SQLite database: anime by mal_id, characters and
+people (voice actors, staff) by url, and the rows that link them, i.e. the related anime of an anime
+(get_anime_info), its character / voice actor rows (get_anime_characters) and its staff rows
+(get_anime_staff). The link tables are indexed on mal_id, character url, voice actor url and staff
+url, so that e.g. all anime of a voice actor or the franchise of an anime (the closure of related
+anime, a recursive query) are found with index lookups. Urls are stored canonical (utility.parse_mal_url),
+and characters and people are looked up by the mal id of their url, so any url of a page (with or without
+its name) finds its rows. Items are buffered and upserted in bulk,
+one transaction per batch_size items, and an item written again replaces its link rows.
+
+    store = EntityStore('index.db')
+    store.write('anime', anime.get_anime_info(url, full=True))
+    store.flush()
+    store.get_va_anime('https://myanimelist.net/people/11/Kouichi_Yamadera')
+    store.get_franchise('1')
+
+Classes
+-------
+EntityStore: SQLite index of anime, characters, people and their links
+
+Usage:
+    python entity_store.py <db> anime <mal_id>
+    python entity_store.py <db> va <voice actor url>
+    python entity_store.py <db> character <character url>
+    python entity_store.py <db> staff <staff url>
+    python entity_store.py <db> franchise <mal_id> [--all-types]
+'''
+
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import utility
+
+# related types that are not followed by get_franchise by default (they link to other franchises)
+FRANCHISE_EXCLUDED_TYPES = ['character', 'other']
+# sections of anime info that are stored as link rows
+LINK_SECTIONS = ['related', 'characters', 'staff']
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS anime (
+        mal_id TEXT PRIMARY KEY,
+        url TEXT,
+        title TEXT,
+        info TEXT,
+        updated_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS characters (
+        url TEXT PRIMARY KEY,
+        mal_id TEXT,
+        name TEXT,
+        info TEXT,
+        updated_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS people (
+        url TEXT PRIMARY KEY,
+        mal_id TEXT,
+        name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS related (
+        anime_id TEXT,
+        related_type TEXT,
+        link TEXT,
+        related_id TEXT,
+        title TEXT
+    );
+    CREATE TABLE IF NOT EXISTS anime_characters (
+        anime_id TEXT,
+        character_url TEXT,
+        type TEXT,
+        va_url TEXT,
+        va_lang TEXT
+    );
+    CREATE TABLE IF NOT EXISTS anime_staff (
+        anime_id TEXT,
+        staff_url TEXT,
+        roles TEXT
+    );
+    CREATE INDEX IF NOT EXISTS characters_mal_id ON characters (mal_id);
+    CREATE INDEX IF NOT EXISTS people_mal_id ON people (mal_id);
+    CREATE INDEX IF NOT EXISTS related_anime_id ON related (anime_id);
+    CREATE INDEX IF NOT EXISTS related_related_id ON related (related_id);
+    CREATE INDEX IF NOT EXISTS anime_characters_anime_id ON anime_characters (anime_id);
+    CREATE INDEX IF NOT EXISTS anime_characters_character_url ON anime_characters (character_url);
+    CREATE INDEX IF NOT EXISTS anime_characters_va_url ON anime_characters (va_url);
+    CREATE INDEX IF NOT EXISTS anime_staff_anime_id ON anime_staff (anime_id);
+    CREATE INDEX IF NOT EXISTS anime_staff_staff_url ON anime_staff (staff_url);
+'''
+
+
+def get_anime_id(url):
+    '''
+    Returns the mal id of an anime url (None if it is not an anime url, e.g. a related manga).
+    '''
+    mal_url = utility.parse_mal_url(url or '')
+    return mal_url.mal_id if mal_url.type == 'anime' else None
+
+
+def get_title(info):
+    '''
+    Returns the title of an anime info dict: its english title, or the title in its url.
+    '''
+    if info.get('english'):
+        return info['english']
+    slug = (info.get('url') or '').split('/anime/', 1)[-1].split('/')
+    return slug[1].replace('_', ' ') if len(slug) > 1 and slug[1] else None
+
+
+def canonical_url(url):
+    '''
+    Returns the canonical url of a mal url (see utility.parse_mal_url), so that the urls of a page
+    (e.g. with http or www.) are stored and looked up as one url. Other urls are returned unchanged.
+    '''
+    if not url:
+        return url
+    return utility.parse_mal_url(url).url or url
+
+
+def _url_match(column, table, url):
+    # sql condition and parameters matching the urls of a character / person in a link table column by its
+    # mal id, so that urls with and without the name of the page (stored as they were linked) find the same rows
+    mal_url = utility.parse_mal_url(url or '')
+    if mal_url.mal_id is None:
+        return '{} = ?'.format(column), (url,)
+    return '{} IN (SELECT url FROM {} WHERE mal_id = ?)'.format(column, table), (mal_url.mal_id,)
+
+
+def _people_row(url, name):
+    return (url, utility.parse_mal_url(url).mal_id, name)
+
+
+class EntityStore:
+    '''
+    SQLite index of scraped anime, characters, people and their links, shared by all threads that use it.
+
+    Parameters:
+        path [string]: path of SQLite database (created if it does not exist)
+        batch_size [int] [default=100]: number of buffered items that are upserted in one transaction
+    '''
+
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def write(self, mal_type, info):
+        '''
+        Buffers a scraped item, the buffer is upserted once batch_size items are buffered (or on flush / close).
+
+        Parameters:
+            mal_type [string]: type of item ('anime' or 'character', other types are ignored)
+            info [dict]: scraped information (anime.get_anime_info, character.get_character_info)
+        '''
+        if mal_type not in ['anime', 'character']:
+            return
+        with self._lock:
+            self._buffer.append((mal_type, info))
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def write_many(self, items):
+        '''
+        Upserts many scraped items in one transaction.
+
+        Parameters:
+            items [iterable]: (mal_type, info) tuples
+        '''
+        with self._lock:
+            self._buffer.extend(item for item in items if item[0] in ['anime', 'character'])
+            self._flush()
+
+    def flush(self):
+        '''
+        Upserts the buffered items.
+        '''
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_anime(self, mal_id):
+        '''
+        Returns the stored information of an anime (None if it was not scraped).
+        '''
+        row = self._query('SELECT info FROM anime WHERE mal_id = ?', (str(mal_id),))
+        return json.loads(row[0][0]) if row and row[0][0] else None
+
+    def get_character(self, url):
+        '''
+        Returns the stored information of a character (None if it was not scraped).
+        '''
+        condition, params = _url_match('url', 'characters', url)
+        row = self._query('SELECT info FROM characters WHERE {} AND info IS NOT NULL '
+                          'ORDER BY updated_at DESC LIMIT 1'.format(condition), params)
+        return json.loads(row[0][0]) if row and row[0][0] else None
+
+    def get_va_anime(self, va_url):
+        '''
+        Returns the anime a voice actor has roles in.
+
+        Parameters:
+            va_url [string]: mal people url of voice actor
+
+        Returns
+            anime [list]: dicts with the mal_id, title, character, character_url and type (main / supporting)
+                of every role of the voice actor
+        '''
+        condition, params = _url_match('ac.va_url', 'people', va_url)
+        rows = self._query('''
+            SELECT ac.anime_id, a.title, c.name, ac.character_url, ac.type
+            FROM anime_characters ac
+            LEFT JOIN anime a ON a.mal_id = ac.anime_id
+            LEFT JOIN characters c ON c.url = ac.character_url
+            WHERE {}
+            ORDER BY CAST(ac.anime_id AS INTEGER)'''.format(condition), params)
+        return [dict(zip(['mal_id', 'title', 'character', 'character_url', 'type'], row)) for row in rows]
+
+    def get_character_anime(self, character_url):
+        '''
+        Returns the anime a character appears in.
+
+        Parameters:
+            character_url [string]: mal character url
+
+        Returns
+            anime [list]: dicts with the mal_id, title and type (main / supporting) of the character in each anime
+        '''
+        condition, params = _url_match('ac.character_url', 'characters', character_url)
+        rows = self._query('''
+            SELECT DISTINCT ac.anime_id, a.title, ac.type
+            FROM anime_characters ac
+            LEFT JOIN anime a ON a.mal_id = ac.anime_id
+            WHERE {}
+            ORDER BY CAST(ac.anime_id AS INTEGER)'''.format(condition), params)
+        return [dict(zip(['mal_id', 'title', 'type'], row)) for row in rows]
+
+    def get_staff_anime(self, staff_url):
+        '''
+        Returns the anime a staff member worked on.
+
+        Parameters:
+            staff_url [string]: mal people url of staff member
+
+        Returns
+            anime [list]: dicts with the mal_id, title and roles of the staff member in each anime
+        '''
+        condition, params = _url_match('s.staff_url', 'people', staff_url)
+        rows = self._query('''
+            SELECT s.anime_id, a.title, s.roles
+            FROM anime_staff s
+            LEFT JOIN anime a ON a.mal_id = s.anime_id
+            WHERE {}
+            ORDER BY CAST(s.anime_id AS INTEGER)'''.format(condition), params)
+        return [{'mal_id': mal_id, 'title': title, 'roles': json.loads(roles)} for mal_id, title, roles in rows]
+
+    def get_franchise(self, mal_id, excluded_types=FRANCHISE_EXCLUDED_TYPES):
+        '''
+        Returns the franchise of an anime: all anime linked to it through related anime, in either direction.
+        Related anime that were not scraped themselves are included (with the title of the related link),
+        but their own related anime are only known once they are scraped.
+
+        Parameters:
+            mal_id [string]: mal id of anime
+            excluded_types [list] [default=FRANCHISE_EXCLUDED_TYPES]: related types that are not followed
+
+        Returns
+            anime [list]: dicts with the mal_id and title of the anime in the franchise (incl. the anime itself)
+        '''
+        excluded_types = list(excluded_types or [])
+        exclude = 'AND related_type NOT IN ({})'.format(', '.join('?' * len(excluded_types))) if excluded_types else ''
+        rows = self._query('''
+            WITH RECURSIVE
+                edges(a, b) AS (
+                    SELECT anime_id, related_id FROM related WHERE related_id IS NOT NULL {exclude}
+                    UNION ALL
+                    SELECT related_id, anime_id FROM related WHERE related_id IS NOT NULL {exclude}
+                ),
+                franchise(mal_id) AS (
+                    VALUES (?)
+                    UNION
+                    SELECT edges.b FROM edges JOIN franchise ON edges.a = franchise.mal_id
+                )
+            SELECT f.mal_id, COALESCE(a.title, (SELECT title FROM related WHERE related_id = f.mal_id LIMIT 1))
+            FROM franchise f
+            LEFT JOIN anime a ON a.mal_id = f.mal_id
+            ORDER BY CAST(f.mal_id AS INTEGER)'''.format(exclude=exclude),
+            excluded_types + excluded_types + [str(mal_id)])
+        return [{'mal_id': row[0], 'title': row[1]} for row in rows]
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _flush(self):
+        # upserts the buffer in one transaction, the link rows of an anime are replaced by section
+        # (a section missing from the info, e.g. characters without full=True, keeps its stored rows)
+        if not self._buffer:
+            return
+        now = time.time()
+        # an item written several times before a flush (e.g. a duplicate input line) is upserted once,
+        # with its last write, and the link sections it had in its latest write that has them
+        anime_items, character_items = {}, {}
+        for mal_type, info in self._buffer:
+            if mal_type == 'character':
+                if info.get('url'):
+                    character_items.pop(canonical_url(info['url']), None)
+                    character_items[canonical_url(info['url'])] = info
+                continue
+            mal_id = str(info['mal_id'])
+            sections = anime_items.pop(mal_id, (None, {}))[1]
+            sections.update((section, info[section]) for section in LINK_SECTIONS if section in info)
+            anime_items[mal_id] = (info, sections)
+
+        # characters and people are deduplicated by url, they repeat across the anime of a flush
+        anime_rows, character_rows, people_rows = [], {}, {}
+        related_rows, role_rows, staff_rows = [], [], []
+        replaced = {'related': [], 'anime_characters': [], 'anime_staff': []}
+
+        for url, info in character_items.items():
+            character_rows[url] = (url, str(info['mal_id']), (info.get('eng_name') or '').strip() or None,
+                                   json.dumps(info, ensure_ascii=False), now)
+
+        for mal_id, (info, sections) in anime_items.items():
+            anime_rows.append((mal_id, info.get('url'), get_title(info), json.dumps(info, ensure_ascii=False), now))
+            if 'related' in sections:
+                replaced['related'].append((mal_id,))
+                for related in sections['related'] or []:
+                    related_rows.append((mal_id, related.get('related_type'), related.get('link'),
+                                         get_anime_id(related.get('link')), related.get('title')))
+            if isinstance(sections.get('characters'), list):
+                replaced['anime_characters'].append((mal_id,))
+                for row in sections['characters']:
+                    character_url, va_url = canonical_url(row.get('url')), canonical_url(row.get('va_url'))
+                    role_rows.append((mal_id, character_url, row.get('type'), va_url, row.get('va_lang')))
+                    if character_url and character_url not in character_rows:
+                        character_rows[character_url] = _people_row(character_url, row.get('character')) + (None, None)
+                    if va_url and va_url not in people_rows:
+                        people_rows[va_url] = _people_row(va_url, row.get('va'))
+            if isinstance(sections.get('staff'), list):
+                replaced['anime_staff'].append((mal_id,))
+                for row in sections['staff']:
+                    staff_url = canonical_url(row.get('staffUrl'))
+                    staff_rows.append((mal_id, staff_url, json.dumps(row.get('roles') or [], ensure_ascii=False)))
+                    if staff_url and staff_url not in people_rows:
+                        people_rows[staff_url] = _people_row(staff_url, row.get('staff'))
+
+        with self._db:
+            self._db.executemany('''
+                INSERT INTO anime VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (mal_id) DO UPDATE SET url = excluded.url, title = excluded.title,
+                    info = excluded.info, updated_at = excluded.updated_at''', anime_rows)
+            # character rows of anime only have the name, scraped characters also their information
+            self._db.executemany('''
+                INSERT INTO characters VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    mal_id = COALESCE(excluded.mal_id, mal_id), name = COALESCE(excluded.name, name),
+                    info = COALESCE(excluded.info, info), updated_at = COALESCE(excluded.updated_at, updated_at)''',
+                character_rows.values())
+            self._db.executemany('''
+                INSERT INTO people VALUES (?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET name = COALESCE(excluded.name, name)''', people_rows.values())
+            for table, anime_ids in replaced.items():
+                self._db.executemany('DELETE FROM {} WHERE anime_id = ?'.format(table), anime_ids)
+            self._db.executemany('INSERT INTO related VALUES (?, ?, ?, ?, ?)', related_rows)
+            self._db.executemany('INSERT INTO anime_characters VALUES (?, ?, ?, ?, ?)', role_rows)
+            self._db.executemany('INSERT INTO anime_staff VALUES (?, ?, ?)', staff_rows)
+        self._buffer = []
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='query a local index of scraped mal entities')
+    ap.add_argument('db', help='path of entity store database')
+    commands = ap.add_subparsers(dest='command', required=True)
+    commands.add_parser('anime', help='stored information of an anime').add_argument('mal_id')
+    commands.add_parser('va', help='anime of a voice actor').add_argument('url', help='mal people url')
+    commands.add_parser('character', help='anime of a character').add_argument('url', help='mal character url')
+    commands.add_parser('staff', help='anime of a staff member').add_argument('url', help='mal people url')
+    franchise_ap = commands.add_parser('franchise', help='anime linked to an anime through related anime')
+    franchise_ap.add_argument('mal_id')
+    franchise_ap.add_argument('--all-types', action='store_true',
+                              help='also follow {} relations'.format(' and '.join(FRANCHISE_EXCLUDED_TYPES)))
+
+    args = vars(ap.parse_args())
+    store = EntityStore(args['db'])
+    try:
+        if args['command'] == 'anime':
+            result = store.get_anime(args['mal_id'])
+        elif args['command'] == 'va':
+            result = store.get_va_anime(args['url'])
+        elif args['command'] == 'character':
+            result = store.get_character_anime(args['url'])
+        elif args['command'] == 'staff':
+            result = store.get_staff_anime(args['url'])
+        else:
+            result = store.get_franchise(args['mal_id'], [] if args['all_types'] else FRANCHISE_EXCLUDED_TYPES)
+        print(json.dumps(result, ensure_ascii=False, indent=4))
+    finally:
+        store.close()
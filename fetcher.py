@@ -0,0 +1,602 @@
+'''
+HTTP fetching layer used by the mal scraping functions.
+
+All page requests (anime.py, character.py) go through a shared Fetcher so that connections to
+myanimelist.net are pooled and kept alive instead of being set up again for every page.
+
+Requests are started by a Scheduler: interactive lookups go ahead of batch crawl items (see priority),
+concurrency can be capped per type of page, and the request rate backs off when myanimelist
+throttles (429/503, or 403 with a Retry-After header) and recovers once it stops.
+
+Classes
+-------
+Fetcher: pooled, keep-alive requests.Session wrapper with timeouts and retries
+RateLimiter: adaptive token bucket limiting requests per second
+Scheduler: starts waiting requests in priority order within the concurrency and rate limits
+
+Methods
+-------
+get_fetcher(): returns the shared Fetcher instance
+set_fetcher(fetcher -> Fetcher): replaces the shared Fetcher instance, returns the previous one
+priority(level -> int): context manager setting the priority of the requests made in it
+get_executor(): returns the shared thread pool that subpages are fetched on
+submit(func, *args, **kwargs): runs a function on the shared thread pool, in the current context
+run_async(func, *args, **kwargs): awaits a blocking scraping function without blocking the event loop
+'''
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from cache import get_page_type
+import metrics
+
+# brotli is optional, urllib3 only decodes "br" responses if it is installed
+try:
+    import brotli
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+MAL_BASE_URL = 'https://myanimelist.net'
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (compatible; myanimelist-scraper; +https://github.com/kaili-chen/myanimelist)'
+# throttling responses, all requests slow down on them (a 403 only with a Retry-After header, see is_throttled,
+# without it the request is denied and returned as is)
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = THROTTLE_STATUSES + (500, 502, 504)
+MAX_RETRY_AFTER = 300
+# share of the configured rate that the rate / its ceiling grow by on every successful request
+RATE_RECOVERY = 0.05
+RATE_CEILING_RECOVERY = 0.001
+EXECUTOR_WORKERS = 8
+
+# request priorities, lower goes first
+INTERACTIVE = 0
+BATCH = 10
+current_priority = contextvars.ContextVar('current_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level):
+    '''
+    Sets the priority of the requests made in this context (incl. subpages fetched on the shared
+    executor with submit, and async calls with run_async).
+
+    Parameters:
+        level [int]: priority (lower goes first), e.g. INTERACTIVE or BATCH
+    '''
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_throttled(response):
+    '''
+    Returns whether a response is myanimelist throttling (429 or 503, or 403 with a Retry-After header).
+    '''
+    return response.status_code in THROTTLE_STATUSES or (response.status_code == 403 and 'Retry-After' in response.headers)
+
+
+def get_retry_after(response):
+    '''
+    Returns the seconds to wait given by the Retry-After header of a response (None if it has none).
+    '''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+class RateLimiter:
+    '''
+    Adaptive token bucket rate limiter, shared by all threads that use it.
+
+    The rate is halved when the server throttles (see throttled) and grows back additively with every
+    successful request (see succeeded), up to a ceiling: the rate it was throttled at minus 10%. The
+    ceiling itself creeps back towards the configured rate, so a transient throttle is not held forever,
+    but the limiter settles just below the server's limit instead of cycling in and out of bans.
+
+    Parameters:
+        rate [float]: max requests allowed per second
+        burst [int] [default=1]: number of requests that can be made at once after being idle
+        min_rate [float] [default=None]: rate is never lowered below this (rate / 20 if not given)
+    '''
+
+    def __init__(self, rate, burst=1, min_rate=None):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 20
+        self.rate = self.ceiling = self.max_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        '''
+        Takes a token if one is available.
+
+        Returns:
+            wait [float]: 0 if a request is allowed now, else seconds until the next token
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        '''
+        Blocks until a request is allowed.
+        '''
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def throttled(self):
+        '''
+        Lowers the rate after the server throttled a request (see is_throttled).
+        '''
+        with self._lock:
+            self.ceiling = max(self.min_rate, self.rate * 0.9)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def succeeded(self):
+        '''
+        Raises the rate back towards the ceiling after a successful request.
+        '''
+        with self._lock:
+            self.ceiling = min(self.max_rate, self.ceiling + self.max_rate * RATE_CEILING_RECOVERY)
+            self.rate = min(self.ceiling, self.rate + self.max_rate * RATE_RECOVERY)
+
+
+class Scheduler:
+    '''
+    Decides which waiting request is sent next, shared by all threads of a Fetcher.
+
+    Requests are started in priority order (lower first, see priority), once a slot is free (max_concurrency
+    in total, and per type of page in endpoint_limits) and the rate limiter allows it. When the server
+    throttles, all requests are paused until its Retry-After has passed.
+
+    Parameters:
+        max_concurrency [int]: max requests in flight at once
+        rate_limiter [RateLimiter] [default=None]: limiter of requests per second (no limit if not given)
+        endpoint_limits [dict] [default=None]: max requests in flight by page type (see cache.get_page_type),
+            e.g. {'stats': 1, 'characters': 2}
+    '''
+
+    def __init__(self, max_concurrency, rate_limiter=None, endpoint_limits=None):
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.paused_until = 0
+        self.stats = {'requests': 0, 'throttled': 0}
+        self._active = {}
+        self._active_total = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def slot(self, endpoint, priority=None):
+        '''
+        Waits for the turn of a request and holds its slot while it runs.
+
+        Parameters:
+            endpoint [string]: type of page requested (see cache.get_page_type)
+            priority [int] [default=None]: priority of request (priority of the current context if not given)
+        '''
+        self.acquire(endpoint, priority)
+        try:
+            yield
+        finally:
+            self.release(endpoint)
+
+    def acquire(self, endpoint, priority=None):
+        '''
+        Blocks until it is the turn of a request (see slot).
+        '''
+        if priority is None:
+            priority = current_priority.get()
+        entry = (priority, next(self._order), endpoint)
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._next_request() is entry:
+                        wait = self.paused_until - time.monotonic()
+                        if wait <= 0:
+                            wait = self.rate_limiter.try_acquire() if self.rate_limiter else 0
+                            if not wait:
+                                break
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            self._active[endpoint] = self._active.get(endpoint, 0) + 1
+            self._active_total += 1
+            self.stats['requests'] += 1
+            # the next request in line may be one that can start now
+            self._cond.notify_all()
+
+    def release(self, endpoint):
+        with self._cond:
+            self._active[endpoint] -= 1
+            self._active_total -= 1
+            self._cond.notify_all()
+
+    def throttled(self, retry_after=None):
+        '''
+        Slows down after the server throttled a request: pauses all requests for retry_after seconds
+        and lowers the rate of the rate limiter.
+
+        Parameters:
+            retry_after [float] [default=None]: seconds to pause for (e.g. from the Retry-After header)
+        '''
+        with self._cond:
+            self.stats['throttled'] += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            if self.rate_limiter:
+                self.rate_limiter.throttled()
+            self._cond.notify_all()
+
+    def succeeded(self):
+        if self.rate_limiter:
+            self.rate_limiter.succeeded()
+
+    def _next_request(self):
+        # the first waiting request, in priority order, that has a free slot
+        if self._active_total >= self.max_concurrency:
+            return None
+        for entry in sorted(self._waiting):
+            limit = self.endpoint_limits.get(entry[2])
+            if limit is None or self._active.get(entry[2], 0) < limit:
+                return entry
+        return None
+
+
+### CONNECTION TIMING
+# time spent connecting (DNS, TCP, TLS) by the request in flight on this thread, see metrics
+_connect_time = threading.local()
+
+class TimedConnectionMixin:
+    # records the connect time of an urllib3 connection (put before the connection class)
+    def connect(self):
+        if not metrics.enabled:
+            return super().connect()
+        start = metrics.now()
+        try:
+            super().connect()
+        finally:
+            _connect_time.seconds = getattr(_connect_time, 'seconds', 0.0) + metrics.now() - start
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    '''
+    HTTPAdapter whose connections record how long connecting took (see metrics).
+    '''
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+class Fetcher:
+    '''
+    Wraps a requests.Session with a bounded connection pool, keep-alive, compression
+    negotiation, timeouts and retries with exponential backoff on 429/5xx responses.
+    Throttling responses (see is_throttled) also pause and slow down all requests (see Scheduler).
+
+    Parameters:
+        base_url [string] [default=None]: if given, myanimelist.net urls are rewritten to this host
+            (e.g. http://127.0.0.1:8000 to point the scrapers at a local stand-in server)
+        pool_connections [int] [default=4]: number of per-host connection pools to keep
+        pool_maxsize [int] [default=8]: max open connections per host
+        timeout [float or tuple] [default=(5, 30)]: (connect, read) timeout in seconds
+        retries [int] [default=3]: number of retries on connection errors, 5xx and throttling responses
+        backoff_factor [float] [default=0.5]: retries sleep for backoff_factor * 2^(retry - 1) seconds
+            (or for as long as the Retry-After header of a throttling response says)
+        user_agent [string] [default=None]: User-Agent header (DEFAULT_USER_AGENT if not given)
+        session [requests.Session] [default=None]: session to use instead of creating one
+        max_concurrency [int] [default=4]: max requests in flight at once, shared by everything
+            that uses this fetcher (e.g. the subpages of all records being scraped)
+        rate_limit [float] [default=None]: max requests per second (no limit if not given), lowered
+            while myanimelist throttles
+        endpoint_limits [dict] [default=None]: max requests in flight by page type (see Scheduler)
+        cache [cache.ResponseCache] [default=None]: cache to serve pages from and store pages in
+        offline [bool] [default=False]: only serve pages from cache, pages that are not cached get a 504 response
+    '''
+
+    def __init__(self, base_url=None, pool_connections=4, pool_maxsize=8, timeout=(5, 30),
+                 retries=3, backoff_factor=0.5, user_agent=None, session=None, max_concurrency=4,
+                 rate_limit=None, endpoint_limits=None, cache=None, offline=False):
+        if offline and cache is None:
+            raise ValueError('offline fetcher needs a cache')
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.cache = cache
+        self.offline = offline
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.scheduler = Scheduler(max_concurrency, self.rate_limiter, endpoint_limits)
+
+        self.session = session if session is not None else requests.Session()
+        # retries on status codes are done in _request, so that they go through the scheduler
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=0,
+            backoff_factor=backoff_factor,
+            raise_on_status=False
+        )
+        # pool_block caps the number of connections per host instead of opening extra throwaway ones
+        adapter = TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=retry, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent or DEFAULT_USER_AGENT,
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Connection': 'keep-alive'
+        })
+
+    def resolve(self, url):
+        '''
+        Returns the url that will actually be requested (applies base_url rewriting).
+
+        Parameters:
+            url [string]: url to resolve
+
+        Returns:
+            url [string]: resolved url
+        '''
+        if self.base_url:
+            for prefix in (MAL_BASE_URL, 'http://myanimelist.net', 'https://www.myanimelist.net'):
+                if url.startswith(prefix):
+                    return self.base_url + url[len(prefix):]
+        return url
+
+    def get(self, url, **kwargs):
+        '''
+        Gets a page, from the cache if it is cached and fresh, else through the pooled session.
+        Cached pages that are not fresh are revalidated with a conditional request.
+
+        Parameters:
+            url [string]: url to get
+            **kwargs: passed on to requests.Session.get
+
+        Returns:
+            response [requests.Response]: response (response.from_cache is True if it was served from the cache)
+        '''
+        if self.cache is None:
+            return self._request(url, **kwargs)
+
+        cached = self.cache.get(url)
+        if cached is not None and (cached.fresh or self.offline):
+            metrics.count('cache_hits')
+            return self._cached_response(cached)
+        if self.offline:
+            # same as a only-if-cached request that misses the cache
+            return self._cached_response(None, url)
+
+        if cached is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+            kwargs['headers'] = headers
+
+        response = self._request(url, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(url)
+            metrics.count('cache_hits')
+            return self._cached_response(cached)
+        if response.status_code == 200:
+            self.cache.put(url, response.content, response.headers.get('Content-Type'),
+                           response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
+
+    def _cached_response(self, cached, url=None):
+        response = requests.Response()
+        if cached is None:
+            response.status_code = 504
+            response.reason = 'Not Cached'
+            response.url = url
+            response._content = b''
+        else:
+            response.status_code = 200
+            response.reason = 'OK'
+            response.url = cached.url
+            response._content = cached.body
+            if cached.content_type:
+                response.headers = CaseInsensitiveDict({'Content-Type': cached.content_type})
+                response.encoding = get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def _request(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = get_page_type(url)
+        for retry in range(self.retries + 1):
+            with self.scheduler.slot(endpoint):
+                if metrics.enabled:
+                    response = self._timed_get(url, **kwargs)
+                else:
+                    response = self.session.get(self.resolve(url), **kwargs)
+            response.from_cache = False
+            throttled = is_throttled(response)
+            if response.status_code not in RETRY_STATUSES and not throttled:
+                self.scheduler.succeeded()
+                return response
+
+            backoff = self.backoff_factor * (2 ** retry)
+            metrics.count('retries' if retry < self.retries else 'errors')
+            if throttled:
+                metrics.count('throttled')
+                # everyone waits, not only this request
+                self.scheduler.throttled(get_retry_after(response) or backoff)
+            elif retry < self.retries:
+                time.sleep(backoff)
+        return response
+
+    def _timed_get(self, url, **kwargs):
+        # records the connect, ttfb and download stages of a request and its bytes (see metrics)
+        _connect_time.seconds = 0.0
+        start = metrics.now()
+        try:
+            response = self.session.get(self.resolve(url), **kwargs)
+        except requests.RequestException:
+            metrics.count('errors')
+            raise
+        total = metrics.now() - start
+        connect = _connect_time.seconds
+        # elapsed is the time until the response headers were parsed, the body is read after it
+        headers = min(response.elapsed.total_seconds(), total)
+        if connect:
+            metrics.observe('connect', connect, url)
+        metrics.observe('ttfb', max(headers - connect, 0.0), url)
+        metrics.observe('download', total - headers, url)
+        metrics.count('requests')
+        metrics.count('bytes', len(response.content))
+        try:
+            metrics.count('wire_bytes', response.raw.tell())
+        except (AttributeError, ValueError):
+            pass
+        # retries of connection errors, done by urllib3
+        history = getattr(getattr(response.raw, 'retries', None), 'history', None)
+        if history:
+            metrics.count('retries', len(history))
+        return response
+
+    def close(self):
+        '''
+        Closes all pooled connections.
+        '''
+        self.session.close()
+
+
+### SHARED FETCHER
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    '''
+    Returns the shared Fetcher instance (created with default settings on first use).
+
+    Returns:
+        fetcher [Fetcher]
+    '''
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = Fetcher()
+    return _fetcher
+
+def set_fetcher(fetcher):
+    '''
+    Replaces the shared Fetcher instance used by utility.get_soup.
+
+    Parameters:
+        fetcher [Fetcher]: fetcher to use from now on (None resets to a default Fetcher on next use)
+
+    Returns:
+        previous [Fetcher]: the fetcher that was replaced (None if none had been created yet)
+    '''
+    global _fetcher
+    with _fetcher_lock:
+        previous = _fetcher
+        _fetcher = fetcher
+    return previous
+
+
+### SHARED EXECUTOR
+_executor = None
+_executor_lock = threading.Lock()
+
+def submit(func, *args, **kwargs):
+    '''
+    Runs a function on the shared thread pool, in a copy of the current context (so that e.g. the
+    priority of the caller applies to the requests made by func).
+
+    Parameters:
+        func [callable]: function to run, should not wait on other tasks of the pool
+        *args, **kwargs: passed on to func
+
+    Returns:
+        future [concurrent.futures.Future]: future of the result of func
+    '''
+    return get_executor().submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+def get_executor():
+    '''
+    Returns the shared thread pool used to fetch pages concurrently (e.g. the subpages of an anime).
+    Tasks submitted to it should not wait on other tasks of the pool.
+
+    Returns:
+        executor [concurrent.futures.ThreadPoolExecutor]
+    '''
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix='mal-fetch')
+    return _executor
+
+async def run_async(func, *args, **kwargs):
+    '''
+    Runs a blocking scraping function on the event loop's default executor and awaits its result.
+
+    Parameters:
+        func [callable]: function to run (e.g. anime.get_anime_info)
+        *args, **kwargs: passed on to func
+
+    Returns:
+        result: return value of func
+    '''
+    loop = asyncio.get_running_loop()
+    # run in a copy of the current context, so that e.g. priority applies in func
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
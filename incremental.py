@@ -0,0 +1,262 @@
+'''
+Incremental re-crawling: change detection and field-level diffs against previous snapshots.
+
+A SnapshotStore keeps, for every page fetched, a hash of its content and what was parsed from it,
+and for every scraped item (by mal type and mal id) the last snapshot of its information. When an
+item is scraped again, pages whose content hash did not change are not parsed again (the stored
+result is used), items whose pages all did not change are skipped, and for the other items only
+the fields that changed since the last snapshot are emitted (e.g. members, score.scored_by, stats.watching).
+
+Page content is hashed after removing the parts of a page that change on every request
+(scripts, comments, csrf tokens), see page_hash.
+
+Classes
+-------
+SnapshotStore: SQLite store of page hashes, parsed pages and item snapshots
+IncrementalScraper: scrapes mal urls, returning only what changed since the last snapshot
+
+Methods
+-------
+page_hash(html -> string): returns the content hash of a page
+diff(old -> dict, new -> dict): returns the field-level differences between two snapshots
+'''
+
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import utility
+import anime
+import pipeline
+from cache import normalize_url
+
+# parts of a page that change on every request without the page content changing
+VOLATILE_PATTERNS = [
+    re.compile(r'<script\b.*?</script>', re.S | re.I),
+    re.compile(r'<!--.*?-->', re.S),
+    re.compile(r'<meta name="csrf_token"[^>]*>', re.I),
+    re.compile(r'<input[^>]*name="csrf_token"[^>]*>', re.I),
+    re.compile(r'\s+'),
+]
+# the same patterns for pages given as bytes (see utility.get_html)
+VOLATILE_BYTES_PATTERNS = [re.compile(pattern.pattern.encode('ascii'), pattern.flags & ~re.UNICODE)
+                           for pattern in VOLATILE_PATTERNS]
+
+# fields that are not compared between snapshots
+IGNORED_FIELDS = ['retrieved_on']
+
+
+def page_hash(html):
+    '''
+    Returns the content hash of a page, ignoring the parts that change on every request (VOLATILE_PATTERNS).
+
+    Parameters:
+        html [bytes or string]: html of page (bytes are hashed as they are, without decoding them)
+
+    Returns
+        hash [string]: sha1 hex digest
+    '''
+    if isinstance(html, bytes):
+        for pattern in VOLATILE_BYTES_PATTERNS:
+            html = pattern.sub(b' ', html)
+        return hashlib.sha1(html).hexdigest()
+    for pattern in VOLATILE_PATTERNS:
+        html = pattern.sub(' ', html)
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+
+def diff(old, new, prefix=''):
+    '''
+    Returns the field-level differences between two snapshots of an item.
+    Nested dicts (e.g. score, stats) are compared field by field, other values (incl. lists) as a whole.
+
+    Parameters:
+        old [dict]: previous snapshot
+        new [dict]: new snapshot
+        prefix [string] [default='']: prefix of field names (for nested dicts)
+
+    Returns
+        changes [list]: dicts with the (dotted) field name and its old and new value
+            (None if the field was added or removed)
+    '''
+    changes = []
+    for key in sorted(set(old) | set(new), key=str):
+        if not prefix and key in IGNORED_FIELDS:
+            continue
+        field = prefix + str(key)
+        before, after = old.get(key), new.get(key)
+        if isinstance(before, dict) and isinstance(after, dict):
+            changes.extend(diff(before, after, field + '.'))
+        elif before != after:
+            changes.append({'field': field, 'old': before, 'new': after})
+    return changes
+
+
+class SnapshotStore:
+    '''
+    SQLite store of page hashes, parsed pages and item snapshots, shared by all threads that use it.
+
+    Parameters:
+        path [string]: path of SQLite database (created if it does not exist)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                hash TEXT,
+                parsed TEXT,
+                checked_at REAL
+            )''')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                mal_type TEXT,
+                mal_id TEXT,
+                info TEXT,
+                updated_at REAL,
+                PRIMARY KEY (mal_type, mal_id)
+            )''')
+        self._db.commit()
+
+    def get_page(self, url, content_hash):
+        '''
+        Returns what was parsed from a page, if the page had the same content hash when it was parsed.
+
+        Parameters:
+            url [string]: url of page
+            content_hash [string]: current content hash of page (see page_hash)
+
+        Returns
+            found [bool]: whether the page is unchanged
+            parsed [object]: stored result of parsing the page (None if the page changed)
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT hash, parsed FROM pages WHERE key = ?', (normalize_url(url),)).fetchone()
+        if row is None or row[0] != content_hash:
+            return False, None
+        return True, json.loads(row[1])
+
+    def put_page(self, url, content_hash, parsed):
+        '''
+        Stores the content hash of a page and what was parsed from it.
+        '''
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                             (normalize_url(url), content_hash, json.dumps(parsed), time.time()))
+            self._db.commit()
+
+    def get_snapshot(self, mal_type, mal_id):
+        '''
+        Returns the last snapshot of an item (None if it was never scraped).
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT info FROM snapshots WHERE mal_type = ? AND mal_id = ?',
+                                   (mal_type, str(mal_id))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_snapshot(self, mal_type, mal_id, info, pages=None):
+        '''
+        Stores the snapshot of an item, replacing the previous one, and the pages it was scraped from in the
+        same transaction (so that a page is only known as unchanged once the snapshot of its changes is stored).
+
+        Parameters:
+            mal_type [string]: type of item ('anime' or 'character')
+            mal_id [string]: mal id of item
+            info [dict]: snapshot of item
+            pages [dict] [default=None]: content hash and parsed result (tuples) of the changed pages, by url
+        '''
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                                 [(normalize_url(url), content_hash, json.dumps(parsed), now)
+                                  for url, (content_hash, parsed) in (pages or {}).items()])
+            self._db.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)',
+                             (mal_type, str(mal_id), json.dumps(info), now))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IncrementalScraper:
+    '''
+    Scrapes mal anime/character urls, skipping pages and items that did not change since they were last scraped.
+
+    Parameters:
+        store [SnapshotStore]: store of previous snapshots
+        parse_page [callable] [default=pipeline.parse_page]: function (page type, url, html -> info) that parses
+            changed pages (e.g. pipeline.ParsePool.parse to parse them on worker processes)
+        on_snapshot [callable] [default=None]: called with (mal_type, info) with the full information of every
+            scraped item, changed or not (e.g. to feed a timeseries.TimeSeriesStore), before the snapshot is
+            stored: if it raises, nothing is stored and it is called again when the item is scraped again
+
+    on_snapshot is called at least once per item, not exactly once: if storing the snapshot fails after it
+    returned (or the process stops in between), the item is scraped and passed to on_snapshot again on the
+    next run. Consumers should be idempotent, i.e. keep one value per item and period rather than count calls
+    (as timeseries.TimeSeriesStore.series and delta read the last value of an anime per day).
+    '''
+
+    def __init__(self, store, parse_page=pipeline.parse_page, on_snapshot=None):
+        self.store = store
+        self.parse_page = parse_page
+        self.on_snapshot = on_snapshot
+
+    def scrape(self, url, full=False):
+        '''
+        Scrapes a mal anime or character url and compares it with its last snapshot.
+        Has the same signature as batch.scrape, so that it can be used as the scraper of batch.run_batch.
+
+        Parameters:
+            url [string]: mal anime or character url
+            full [bool] [default=False]: get additional anime information (episodes, stats, characters, staff)
+
+        Returns
+            mal_type [string]: type of mal url ('anime' or 'character')
+            changes [dict]: mal_id, url, retrieved_on, new (whether the item had no snapshot yet) and
+                changes (see diff) of the item; None if none of its pages changed
+        '''
+        mal_type = utility.get_mal_type(url)
+        if mal_type not in ['anime', 'character']:
+            raise ValueError('{} is not a mal anime or character url'.format(url))
+
+        # changed pages are stored with the snapshot, once the whole item is scraped
+        changed_pages = {}
+
+        def parse_page(page_type, page_url, html):
+            content_hash = page_hash(html)
+            found, parsed = self.store.get_page(page_url, content_hash)
+            if not found:
+                parsed = self.parse_page(page_type, page_url, html)
+                changed_pages[page_url] = (content_hash, parsed)
+            return parsed
+
+        info = parse_page(mal_type, url, utility.get_html(utility.get_page(url)))
+        if full and mal_type == 'anime':
+            info.update(anime.replace_unavailable(anime.get_full_info(info['url'], parse_page=parse_page)))
+
+        if self.on_snapshot:
+            self.on_snapshot(mal_type, info)
+
+        previous = self.store.get_snapshot(mal_type, info['mal_id'])
+        if not changed_pages and previous is not None:
+            return mal_type, None
+
+        # round trip through json, so that the snapshot compares equal to the stored one (e.g. tuples become lists)
+        info = json.loads(json.dumps(info))
+        changes = diff(previous or {}, info)
+        self.store.put_snapshot(mal_type, info['mal_id'], info, pages=changed_pages)
+        if not changes and previous is not None:
+            return mal_type, None
+        return mal_type, {
+            'mal_id': info['mal_id'],
+            'url': info.get('url', url),
+            'retrieved_on': utility.get_timestamp(),
+            'new': previous is None,
+            'changes': changes
+        }
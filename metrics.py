@@ -0,0 +1,343 @@
+'''
+Instrumentation of the scraping hot path: per-url and per-stage timings, counters and sampled profiles.
+
+Off by default (every call below is a cheap no-op until enable is called). Once enabled, the stages
+of every page are timed:
+
+    connect             DNS lookup and TCP / TLS connect, for requests that open a new connection
+    ttfb                request sent until the response headers are received (without connect)
+    download            response headers until the whole body is read
+    parse               html parsed into a soup (utility.make_soup)
+    extract.<section>   extraction of one section of a page (e.g. extract.sidebar, the dark_text loop
+                        of anime.parse_anime_info, extract.remove_children, extract.episode_row per row)
+
+and counted: requests, bytes (decoded body), wire_bytes (as received, compressed), retries,
+throttled responses, cache hits and errors. Timings are aggregated per stage (count, sum, max and a
+histogram) and can be read with summary, exposed as Prometheus text (prometheus, start_server),
+logged periodically (start_summary_log) or passed to hooks as they happen, with the url of the item
+being scraped (anime / character url, also for its subpages) or of the page being fetched.
+
+A share of scraped items can be profiled (cProfile, or pyinstrument if installed), one profile file
+per item. Parsing on pipeline worker processes is not instrumented.
+
+    metrics.enable(profile_rate=0.01, profile_dir='profiles')
+    metrics.add_hook(lambda url, stage, seconds: ...)
+    metrics.start_server(9100)          # http://localhost:9100/metrics
+
+Methods
+-------
+enable(profile_rate -> float, profile_dir -> string, profiler -> string): turns instrumentation on
+disable(): turns instrumentation off
+observe(stage -> string, seconds -> float, url -> string): records the time of a stage
+observe_since(stage -> string, start -> float): records the time of a stage started at start (see now)
+count(name -> string, value -> int): adds to a counter
+add_hook(hook -> callable): calls hook with (url, stage, seconds) for every timed stage
+scraping(url -> string): context manager for the scraping of an item (url of its stages, sampled profiling)
+summary(): returns the aggregated timings and counters
+prometheus(): returns the aggregated timings and counters as Prometheus text
+start_server(port -> int): serves prometheus() at /metrics
+start_summary_log(interval -> float): writes a summary to stderr every interval seconds
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import bisect
+import functools
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# pyinstrument is optional, only needed for profiler='pyinstrument'
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# upper bounds (seconds) of the histogram buckets of stage timings
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNTERS = ['requests', 'bytes', 'wire_bytes', 'retries', 'throttled', 'cache_hits', 'errors', 'items']
+PROFILERS = ['cprofile', 'pyinstrument']
+
+now = time.perf_counter
+
+# url of the item being scraped, set by scraping
+current_url = contextvars.ContextVar('current_url', default=None)
+
+enabled = False
+_lock = threading.Lock()
+_stages = {}
+_counters = dict.fromkeys(COUNTERS, 0)
+_hooks = []
+_profile = {'rate': 0, 'dir': None, 'profiler': 'cprofile'}
+
+
+class _Stage:
+    # aggregated timings of a stage
+    __slots__ = ('count', 'sum', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def enable(profile_rate=0, profile_dir='profiles', profiler='cprofile'):
+    '''
+    Turns instrumentation on.
+
+    Parameters:
+        profile_rate [float] [default=0]: share of scraped items that are profiled (0: none, 1: all)
+        profile_dir [string] [default='profiles']: directory profiles are saved in (<datetime>-<item>.prof,
+            or .html for pyinstrument)
+        profiler [string] [default='cprofile']: 'cprofile' or 'pyinstrument' (needs the pyinstrument package)
+    '''
+    global enabled
+    if profiler not in PROFILERS:
+        raise ValueError('profiler must be one of {}'.format(PROFILERS))
+    if profiler == 'pyinstrument' and pyinstrument is None:
+        raise ImportError('pyinstrument profiles need the pyinstrument package (pip install pyinstrument)')
+    _profile.update(rate=profile_rate, dir=profile_dir, profiler=profiler)
+    enabled = True
+
+
+def disable():
+    '''
+    Turns instrumentation off (aggregated timings and counters are kept).
+    '''
+    global enabled
+    enabled = False
+
+
+def reset():
+    '''
+    Clears the aggregated timings and counters.
+    '''
+    with _lock:
+        _stages.clear()
+        for name in _counters:
+            _counters[name] = 0
+
+
+def observe(stage, seconds, url=None):
+    '''
+    Records the time of a stage.
+
+    Parameters:
+        stage [string]: name of stage (e.g. 'ttfb', 'extract.sidebar')
+        seconds [float]: time the stage took
+        url [string] [default=None]: url the stage is of (url of the item being scraped if not given)
+    '''
+    if not enabled:
+        return
+    with _lock:
+        aggregate = _stages.get(stage)
+        if aggregate is None:
+            aggregate = _stages[stage] = _Stage()
+        aggregate.add(seconds)
+    for hook in _hooks:
+        hook(url or current_url.get(), stage, seconds)
+
+
+def observe_since(stage, start):
+    '''
+    Records the time of a stage that started at start (a now() value).
+    '''
+    if enabled:
+        observe(stage, now() - start)
+
+
+def count(name, value=1):
+    '''
+    Adds to a counter (see COUNTERS, other names are added as new counters).
+    '''
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def timed(stage):
+    '''
+    Decorator that records the time of every call of a function as a stage.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = now()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, now() - start)
+        return wrapper
+    return decorator
+
+
+def add_hook(hook):
+    '''
+    Calls hook with (url, stage, seconds) for every timed stage, on the thread the stage ran on.
+    '''
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+@contextlib.contextmanager
+def scraping(url):
+    '''
+    Context manager for the scraping of an item: stages in it (also on the shared executor, see
+    fetcher.submit) are of url, and the item is profiled if it is sampled (see enable).
+    '''
+    if not enabled:
+        yield
+        return
+    token = current_url.set(url)
+    profiler = _start_profile() if _profile['rate'] and random.random() < _profile['rate'] else None
+    try:
+        yield
+    except Exception:
+        count('errors')
+        raise
+    finally:
+        count('items')
+        current_url.reset(token)
+        if profiler is not None:
+            _save_profile(profiler, url)
+
+
+def summary():
+    '''
+    Returns the aggregated timings and counters.
+
+    Returns
+        summary [dict]: stages (count, total and mean seconds, max seconds by stage) and counters
+    '''
+    with _lock:
+        stages = {stage: {'count': aggregate.count, 'total': aggregate.sum, 'mean': aggregate.sum / aggregate.count,
+                          'max': aggregate.max}
+                  for stage, aggregate in sorted(_stages.items())}
+        return {'stages': stages, 'counters': dict(_counters)}
+
+
+def prometheus():
+    '''
+    Returns the aggregated timings (as histograms) and counters in the Prometheus text format.
+    '''
+    lines = ['# HELP mal_stage_seconds time taken by a stage of scraping a page',
+             '# TYPE mal_stage_seconds histogram']
+    with _lock:
+        for stage, aggregate in sorted(_stages.items()):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), aggregate.buckets):
+                cumulative += bucket
+                lines.append('mal_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, cumulative))
+            lines.append('mal_stage_seconds_sum{{stage="{}"}} {}'.format(stage, aggregate.sum))
+            lines.append('mal_stage_seconds_count{{stage="{}"}} {}'.format(stage, aggregate.count))
+        for name, value in sorted(_counters.items()):
+            lines.append('# TYPE mal_{}_total counter'.format(name))
+            lines.append('mal_{}_total {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, host=''):
+    '''
+    Serves the Prometheus text at http://<host>:<port>/metrics, on a daemon thread.
+
+    Returns
+        server [http.server.ThreadingHTTPServer]: server (server.shutdown() stops it)
+    '''
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mal-metrics', daemon=True).start()
+    return server
+
+
+def format_summary():
+    '''
+    Returns the summary as lines of text.
+    '''
+    current = summary()
+    lines = ['{:<28} {:>8} {:>10} {:>10}'.format('stage', 'count', 'mean ms', 'max ms')]
+    for stage, stats in current['stages'].items():
+        lines.append('{:<28} {:>8} {:>10.1f} {:>10.1f}'.format(stage, stats['count'], stats['mean'] * 1000,
+                                                             stats['max'] * 1000))
+    lines.append(', '.join('{} {}'.format(name, value) for name, value in current['counters'].items()))
+    return '\n'.join(lines)
+
+
+def start_summary_log(interval=60, stream=None):
+    '''
+    Writes the summary to stream (stderr if not given) every interval seconds, on a daemon thread.
+
+    Returns
+        stop [threading.Event]: set it to stop logging
+    '''
+    stop = threading.Event()
+
+    def log():
+        while not stop.wait(interval):
+            (stream or sys.stderr).write(format_summary() + '\n')
+
+    threading.Thread(target=log, name='mal-metrics-log', daemon=True).start()
+    return stop
+
+
+def _start_profile():
+    # profiles the calling thread only, subpages fetched on the shared executor are not in the profile
+    if _profile['profiler'] == 'pyinstrument':
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is active on this thread (e.g. a nested profiled item)
+        return None
+    return profiler
+
+
+def _save_profile(profiler, url):
+    os.makedirs(_profile['dir'], exist_ok=True)
+    name = '{}-{}'.format(datetime.now().strftime('%Y%m%dT%H%M%S%f'), re.sub(r'\W+', '_', url.split('://')[-1]).strip('_'))
+    path = os.path.join(_profile['dir'], name[:150])
+    if _profile['profiler'] == 'pyinstrument':
+        profiler.stop()
+        with open(path + '.html', 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')
@@ -0,0 +1,281 @@
+'''
+Normalization of scraped records, column by column over many records at once.
+
+The scrapers (anime.parse_anime_info) normalize every record they return with normalize_record, and
+stored records (e.g. a JSON Lines dump written by batch.py) can be normalized again offline with
+normalize_records, e.g. after a rule changed, with the same rules:
+
+    numbers     episodes, members, favorites, popularity and ranked are ints ('#927', '883,075' -> 927, 883075),
+                None if they are not a number (e.g. 'Unknown')
+    score       {'score': float, 'scored_by': int}, from the ratingValue / ratingCount of the page, or from raw
+                values by their form: a score has a decimal point (7.75), a number of votes has none (8, 448,815)
+    strings     stripped, None if they mean unavailable ('Unknown', 'N/A', 'None', 'add some', 'NA')
+    lists       string items stripped, empty lists None (empty dicts too)
+
+Rules run over columns (the values of a field in all records): number columns are parsed vectorized if
+numpy is installed (as a matrix of character codes, without a python call per value), and repeated strings
+(e.g. 'TV', 'Finished Airing') are only normalized once. Values that are already
+normalized are kept, so records can be normalized any number of times.
+
+Methods
+-------
+normalize_records(records -> list): normalizes records in place (all rules), returns them
+normalize_record(record -> dict): normalizes one record in place, returns it
+replace_unavailable(records -> list): only applies the strings and lists rules
+parse_ints(values -> list): returns the ints of a column of numbers / number strings
+split_score(value): returns the score and number of votes of a raw or normalized score
+
+Usage:
+    python normalize.py <file.jsonl[.gz|.zst]> [<file> ...] [--out <dir>] [--prefix anime] [--compress gzip]
+'''
+
+import sys
+import math
+import argparse
+import itertools
+from sink import JsonLinesSink, read_json_lines
+
+# numpy is optional, number columns are parsed in python without it. It is imported by the first column long
+# enough to be parsed with it (see _get_numpy), so that the scrapers (one record at a time) do not import it
+numpy = None
+_numpy_checked = False
+
+UNAVAILABLE_VALUES = frozenset(['unknown', 'n/a', 'none', 'add some', 'na'])
+INT_FIELDS = ['episodes', 'members', 'favorites', 'popularity', 'ranked']
+SCORE_FIELD = 'score'
+
+# characters of number strings that are not digits: '#' of ranks, thousands separators and white space
+NUMBER_NOISE = '#,\xa0' + ''.join(map(chr, range(33)))
+_remove_noise = str.maketrans('', '', NUMBER_NOISE)
+_noise_codes = [ord(c) for c in NUMBER_NOISE]
+# number columns shorter than this are parsed in python (building the arrays costs more than it saves)
+NUMPY_MIN_VALUES = 256
+# longest digit string parsed as an int (int64)
+MAX_DIGITS = 18
+
+# records normalized at once by the cli
+CHUNK_SIZE = 10000
+
+
+### RULES
+def parse_ints(values):
+    '''
+    Returns the ints of a column: ints are kept, strings of digits (with '#', thousands separators and
+    white space) are parsed, everything else is None.
+
+    Parameters:
+        values [list]: values of a number field (e.g. the members of many records)
+
+    Returns
+        ints [list]: int or None for every value
+    '''
+    strings = [value for value in values if value.__class__ is str]
+    if len(strings) < NUMPY_MIN_VALUES or _get_numpy() is None:
+        parse = _parse_ints_python
+    else:
+        parse = _parse_ints_numpy
+    if len(strings) == len(values):
+        # raw column (all values scraped)
+        return parse(strings)
+
+    result = [None] * len(values)
+    positions = []
+    for i, value in enumerate(values):
+        if value.__class__ is int:
+            result[i] = value
+        elif isinstance(value, str):
+            positions.append(i)
+        elif isinstance(value, float) and value.is_integer():
+            result[i] = int(value)
+    for i, value in zip(positions, parse(strings)):
+        result[i] = value
+    return result
+
+
+def _get_numpy():
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_checked = True
+    return numpy
+
+
+def _parse_ints_python(strings):
+    return [int(digits) if digits.isascii() and digits.isdigit() and len(digits) <= MAX_DIGITS else None
+            for digits in [value.translate(_remove_noise) for value in strings]]
+
+
+def _parse_ints_numpy(strings):
+    # fixed width unicode array viewed as a (values x characters) matrix of character codes (0 padded)
+    array = numpy.array(strings)
+    if array.dtype.itemsize == 0:
+        return [None] * len(strings)
+    codes = array.view(numpy.uint32).reshape(len(strings), array.dtype.itemsize // 4)
+    digit = (codes >= 48) & (codes <= 57)
+    noise = (codes == 0) | numpy.isin(codes, _noise_codes)
+    digit_count = digit.sum(axis=1)
+    valid = (digit | noise).all(axis=1) & (digit_count > 0) & (digit_count <= MAX_DIGITS)
+
+    numbers = numpy.zeros(len(strings), numpy.int64)
+    for column in range(codes.shape[1]):
+        is_digit = digit[:, column]
+        numbers = numpy.where(is_digit, numbers * 10 + (codes[:, column].astype(numpy.int64) - 48), numbers)
+    parsed = numbers.tolist()
+    for i in numpy.flatnonzero(~valid).tolist():
+        parsed[i] = None
+    return parsed
+
+
+def parse_floats(values):
+    '''
+    Returns the floats of a column: numbers are kept, number strings are parsed, everything else is None.
+    '''
+    memo = {}
+    parsed = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            parsed.append(None if isinstance(value, float) and math.isnan(value) else float(value))
+            continue
+        number = memo.get(value, memo) if isinstance(value, str) else None
+        if number is memo:
+            try:
+                number = float(value.translate(_remove_noise))
+            except ValueError:
+                number = None
+            if number is not None and math.isnan(number):
+                number = None
+            memo[value] = number
+        parsed.append(number)
+    return parsed
+
+
+def split_score(value):
+    '''
+    Returns the score and the number of votes of a score (not parsed yet).
+
+    Parameters:
+        value: normalized score ({'score': 7.75, 'scored_by': 448815}), dict of the ratingValue / ratingCount
+            of the page, or raw values (list of strings or one string), a score has a decimal point, a number of
+            votes has none (so a score of 8 votes is not taken for a score of 8)
+
+    Returns
+        score: score (None if there is none)
+        scored_by: number of votes (None if there are none)
+    '''
+    if isinstance(value, dict):
+        return value.get('score'), value.get('scored_by')
+    if value is None:
+        return None, None
+    score = scored_by = None
+    for item in ([value] if isinstance(value, (str, int, float)) else value):
+        if isinstance(item, float) or (isinstance(item, str) and '.' in item):
+            score = item if score is None else score
+        elif scored_by is None:
+            scored_by = item
+    return score, scored_by
+
+
+def replace_unavailable(records):
+    '''
+    Strips strings (also in lists), and replaces values that indicate unavailability ("Unknown", "N/A", empty
+    lists etc.) with None, column by column (changes the input records).
+
+    Parameters:
+        records [list]: scraped information dicts
+
+    Returns
+        records [list]: the input records
+    '''
+    memo = {}
+    for record in records:
+        for field, value in record.items():
+            if value.__class__ is str:
+                normalized = memo.get(value, memo)
+                if normalized is memo:
+                    stripped = value.strip()
+                    normalized = memo[value] = None if stripped.lower() in UNAVAILABLE_VALUES else stripped
+                record[field] = normalized
+            elif value.__class__ is list:
+                if not value:
+                    record[field] = None
+                elif value[0].__class__ is str:
+                    record[field] = [item.strip() if item.__class__ is str else item for item in value]
+            elif value.__class__ is dict and not value:
+                record[field] = None
+    return records
+
+
+def normalize_records(records):
+    '''
+    Normalizes records column by column with all rules (see the module docstring), changes the input records.
+
+    Parameters:
+        records [list]: scraped anime information dicts (raw or already normalized), other records (e.g.
+            characters) only get the strings and lists rules
+
+    Returns
+        records [list]: the input records
+    '''
+    for field in INT_FIELDS:
+        present = [record for record in records if field in record]
+        if present:
+            for record, value in zip(present, parse_ints([record[field] for record in present])):
+                record[field] = value
+
+    present = [record for record in records if SCORE_FIELD in record]
+    if present:
+        scores, votes = zip(*[split_score(record[SCORE_FIELD]) for record in present])
+        for record, score, scored_by in zip(present, parse_floats(scores), parse_ints(votes)):
+            value = {}
+            # only what the page has (no score or no votes yet)
+            if score is not None:
+                value['score'] = score
+            if scored_by is not None:
+                value['scored_by'] = scored_by
+            record[SCORE_FIELD] = value
+
+    return replace_unavailable(records)
+
+
+def normalize_record(record):
+    '''
+    Normalizes one record with all rules (see normalize_records), changes the input record.
+
+    Parameters:
+        record [dict]: scraped anime information
+
+    Returns
+        record [dict]: the input record
+    '''
+    return normalize_records([record])[0]
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='normalize stored mal records (jsonl dumps) again, column by column')
+
+    # positional arguments
+    ap.add_argument('input', nargs='+', help='.jsonl files (.jsonl.gz / .jsonl.zst if compressed) of records')
+
+    # optional arguments
+    ap.add_argument('--out', default='normalized', help='directory to save the normalized records in')
+    ap.add_argument('--prefix', default='anime', help='filename prefix of the output files')
+    ap.add_argument('--compress', choices=['gzip', 'zstd'], help='compression of output files')
+    ap.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='records normalized at once')
+
+    args = vars(ap.parse_args())
+
+    count = 0
+    records = itertools.chain.from_iterable(read_json_lines(path) for path in args['input'])
+    with JsonLinesSink(args['out'], prefix=args['prefix'], compression=args['compress']) as output_sink:
+        while True:
+            chunk = list(itertools.islice(records, args['chunk']))
+            if not chunk:
+                break
+            for record in normalize_records(chunk):
+                output_sink.write(record)
+            count += len(chunk)
+            sys.stderr.write('{} records normalized\n'.format(count))
+    print('{} records normalized into {}'.format(count, args['out']))
@@ -0,0 +1,111 @@
+'''
+Process pool parsing stage, decoupled from fetching.
+
+Parsing pages with BeautifulSoup is cpu-bound and holds the GIL, so adding fetch threads alone
+leaves one core parsing while the others idle. With a ParsePool, threads only fetch pages and
+hand the raw html to worker processes, which run the parse functions of anime.py / character.py
+and send back plain dicts, so parsing scales with the number of cores.
+
+Classes
+-------
+ParsePool: pool of worker processes that parse pages
+
+Methods
+-------
+parse_page(page_type -> string, url -> string, html -> string): parses a page (runs in the worker processes)
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import utility
+import anime
+import character
+
+### WORKER FUNCTIONS
+def init_worker(parser, partial_parsing):
+    '''
+    Applies the parser settings of the parent process to a worker process.
+    '''
+    utility.set_parser(parser)
+    utility.set_partial_parsing(partial_parsing)
+
+def parse_page(page_type, url, html):
+    '''
+    Parses a page with the parse functions for its type.
+
+    Parameters:
+        page_type [string]: 'anime', 'character', 'episode_page' (one page of an episode list, see
+            anime.iter_anime_episodes) or a subpage of anime.FULL_INFO_PAGES ('episode', 'stats', 'characters')
+        url [string]: url of page
+        html [bytes or string]: html of page (see utility.get_html)
+
+    Returns
+        info [dict]: parsed information (for subpages, by info key of anime.FULL_INFO_PAGES;
+            for 'episode_page', a tuple of episodes and next page url)
+    '''
+    if page_type == 'character':
+        regions = character.CHARACTER_PAGE_REGIONS
+    elif page_type == 'episode_page':
+        regions = anime.PAGE_REGIONS['episode']
+    else:
+        regions = anime.PAGE_REGIONS[page_type]
+    soup = utility.make_soup(html, regions=regions if utility.partial_parsing else None)
+
+    if page_type == 'episode_page':
+        return anime.parse_episode_page(soup)
+    if page_type == 'anime':
+        return anime.parse_anime_info(soup, url)
+    if page_type == 'character':
+        return character.parse_character_info(soup, url)
+    return {key: parse(soup) for key, parse in anime.FULL_INFO_PAGES[page_type]}
+
+
+class ParsePool:
+    '''
+    Pool of worker processes that parse pages, for threads that fetch pages to hand them to.
+
+    Parameters:
+        processes [int] [default=None]: number of worker processes (number of cores if not given)
+    '''
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, initializer=init_worker,
+                                            initargs=(utility.default_parser, utility.partial_parsing))
+
+    def parse(self, page_type, url, html):
+        '''
+        Parses a page on a worker process and waits for the result (see parse_page).
+        '''
+        return self.executor.submit(parse_page, page_type, url, html).result()
+
+    def scrape(self, url, full=False):
+        '''
+        Scrapes a mal anime or character url: fetches the page(s) in this thread and parses them on the pool.
+        Gives the same result as anime.get_anime_info / character.get_character_info.
+
+        Parameters:
+            url [string]: mal anime or character url
+            full [bool] [default=False]: get additional anime information (episodes, stats, characters, staff)
+
+        Returns
+            mal_type [string]: type of mal url ('anime' or 'character')
+            info [dict]: scraped information
+        '''
+        mal_type = utility.get_mal_type(url)
+        if mal_type not in ['anime', 'character']:
+            raise ValueError('{} is not a mal anime or character url'.format(url))
+
+        info = self.parse(mal_type, url, utility.get_html(utility.get_page(url)))
+        if full and mal_type == 'anime':
+            info.update(anime.replace_unavailable(anime.get_full_info(info['url'], parse_page=self.parse)))
+        return mal_type, info
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,284 @@
+'''
+Compact typed records of scraped mal information.
+
+The scraping functions return plain dicts, with the same key strings repeated in every row (e.g. each
+character / voice actor row of an anime), which adds up when a whole catalogue is held in memory.
+Records keep their fields in __slots__ instead of a per-object dict, store lists as tuples, and intern
+the strings that repeat across records (e.g. va_lang, character type, staff roles, genres), so that
+all records share one copy of them. to_dict / to_json give back the dicts the scraping functions return.
+
+    info = records.Anime.from_dict(anime.get_anime_info(url, full=True))
+    info.characters[0].va_lang      # 'Japanese'
+    info.to_dict() == anime_info    # True
+
+Classes
+-------
+Record: base class of records
+Anime: mal anime information (anime.get_anime_info)
+Episode: episode of an anime (anime.get_anime_episodes)
+CharacterRole: character of an anime with one of its voice actors (anime.get_anime_characters)
+StaffMember: staff member of an anime (anime.get_anime_staff)
+RelatedAnime: related anime of an anime
+Character: mal character information (character.get_character_info)
+Appearance: anime / manga of a character (animeography / mangaography of character.get_character_info)
+VoiceActor: voice actor of a character (voice_actors of character.get_character_info)
+'''
+
+import sys
+import json
+import operator
+
+
+def intern_value(value):
+    '''
+    Returns a string interned (or a list of strings as a tuple of interned strings), other values as they are.
+    '''
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(sys.intern(v) if isinstance(v, str) else v for v in value)
+    return value
+
+
+class _Unset:
+    # marks fields that are not set when a record is pickled, pickled by reference so it stays a singleton
+    def __reduce__(self):
+        return 'UNSET'
+
+    def __repr__(self):
+        return 'UNSET'
+
+UNSET = _Unset()
+
+class Record:
+    '''
+    Base class of records. Subclasses list their fields in __slots__; fields that are not set
+    (e.g. sections missing from a page) take no space and are left out of to_dict.
+
+    Class attributes:
+        INTERNED [tuple]: fields whose strings (or lists of strings) are interned
+        NESTED [dict]: record class of the items of list fields (or of dict fields)
+        FLAT [bool]: whether all fields are scalars (no lists, records or extra), to_dict takes a shortcut for them
+    '''
+    __slots__ = ()
+    INTERNED = ()
+    NESTED = {}
+    FLAT = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = [name for klass in reversed(cls.__mro__) for name in klass.__dict__.get('__slots__', ())]
+        cls._fields = tuple(name for name in slots if name != 'extra')
+        cls._field_set = frozenset(cls._fields)
+        cls._has_extra = 'extra' in slots
+        cls._get_fields = operator.attrgetter(*cls._fields)
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            self._set(name, value)
+
+    @classmethod
+    def from_dict(cls, info):
+        '''
+        Returns the record of a dict returned by a scraping function.
+
+        Parameters:
+            info [dict]: scraped information
+
+        Returns
+            record [Record]
+        '''
+        record = cls.__new__(cls)
+        for name, value in info.items():
+            record._set(name, value)
+        return record
+
+    def to_dict(self):
+        '''
+        Returns the record as the dict the scraping functions return.
+
+        Returns
+            info [dict]
+        '''
+        try:
+            values = self._get_fields(self)
+        except AttributeError:
+            values = tuple(getattr(self, name, UNSET) for name in self._fields)
+        else:
+            if self.FLAT:
+                return dict(zip(self._fields, values))
+        info = {}
+        for name, value in zip(self._fields, values):
+            if value is UNSET:
+                continue
+            if value.__class__ is tuple or isinstance(value, Record):
+                value = self._export(value)
+            info[name] = value
+        if self._has_extra:
+            for name, value in (getattr(self, 'extra', None) or {}).items():
+                info[name] = self._export(value)
+        return info
+
+    def to_json(self, **kwargs):
+        '''
+        Returns the record as json (same as json.dumps of to_dict with ensure_ascii=False).
+
+        Parameters:
+            **kwargs: passed on to json.dumps (ensure_ascii=False if not given)
+
+        Returns
+            json [string]
+        '''
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def _set(self, name, value):
+        nested = self.NESTED.get(name)
+        if nested is not None:
+            if isinstance(value, list):
+                value = tuple(nested.from_dict(v) if isinstance(v, dict) else v for v in value)
+            elif isinstance(value, dict):
+                value = nested.from_dict(value)
+        elif name in self.INTERNED:
+            value = intern_value(value)
+        elif isinstance(value, list):
+            value = tuple(value)
+
+        if name in self._field_set:
+            object.__setattr__(self, name, value)
+        elif self._has_extra:
+            # sections that have no field of their own (e.g. new sidebar sections on mal)
+            if getattr(self, 'extra', None) is None:
+                object.__setattr__(self, 'extra', {})
+            self.extra[name] = value
+        else:
+            raise TypeError('{} has no field {}'.format(type(self).__name__, name))
+
+    @classmethod
+    def _export(cls, value):
+        if isinstance(value, Record):
+            return value.to_dict()
+        if isinstance(value, tuple):
+            return [cls._export(v) for v in value]
+        return value
+
+    def _values(self):
+        try:
+            return self._get_fields(self)
+        except AttributeError:
+            return tuple(getattr(self, name, UNSET) for name in self._fields)
+
+    def __reduce__(self):
+        # field values without their names, smaller and faster to pickle (e.g. from pipeline worker processes),
+        # nested records are reduced to their field values too
+        values = self._values()
+        if self.NESTED:
+            values = list(values)
+            for i, name in enumerate(self._fields):
+                if name in self.NESTED and values[i].__class__ is tuple:
+                    values[i] = tuple([v._values() if isinstance(v, Record) else v for v in values[i]])
+            values = tuple(values)
+        return (self._restore, (values, getattr(self, 'extra', None) if self._has_extra else None))
+
+    @classmethod
+    def _restore(cls, values, extra=None):
+        record = cls.__new__(cls)
+        for name, value in zip(cls._fields, values):
+            if value is UNSET:
+                continue
+            nested = cls.NESTED.get(name)
+            if nested is not None and value.__class__ is tuple:
+                value = tuple([nested._restore(v) if v.__class__ is tuple else v for v in value])
+            object.__setattr__(record, name, value)
+        if extra:
+            object.__setattr__(record, 'extra', extra)
+        return record
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self._fields
+                           if hasattr(self, name))
+        return '{}({})'.format(type(self).__name__, fields)
+
+
+class Episode(Record):
+    '''
+    Episode of an anime (item of anime.get_anime_episodes).
+    '''
+    __slots__ = ('ep_num', 'eng_title', 'jap_title', 'aired', 'url')
+    FLAT = True
+
+
+class CharacterRole(Record):
+    '''
+    Character of an anime with one of its voice actors (item of anime.get_anime_characters).
+    '''
+    __slots__ = ('character', 'url', 'type', 'va', 'va_lang', 'va_url')
+    # a character has a row for each of its voice actors, and a voice actor one for each of their characters
+    INTERNED = ('character', 'url', 'type', 'va', 'va_lang', 'va_url')
+    FLAT = True
+
+
+class StaffMember(Record):
+    '''
+    Staff member of an anime (item of anime.get_anime_staff).
+    '''
+    __slots__ = ('staff', 'staffUrl', 'roles')
+    INTERNED = ('roles',)
+
+
+class RelatedAnime(Record):
+    '''
+    Related anime of an anime (item of the related field of anime.get_anime_info).
+    '''
+    __slots__ = ('related_type', 'link', 'title')
+    INTERNED = ('related_type',)
+    FLAT = True
+
+
+class Anime(Record):
+    '''
+    Mal anime information (anime.get_anime_info). Sidebar sections without a field are kept in extra.
+    '''
+    __slots__ = (
+        'mal_id', 'url', 'synopsis', 'english', 'japanese', 'synonyms',
+        'type', 'episodes', 'status', 'aired', 'premiered', 'broadcast', 'producers', 'licensors',
+        'studios', 'source', 'genres', 'duration', 'rating',
+        'score', 'ranked', 'popularity', 'members', 'favorites', 'related', 'retrieved_on',
+        'episode_info', 'stats', 'characters', 'staff', 'extra'
+    )
+    INTERNED = ('type', 'status', 'premiered', 'broadcast', 'producers', 'licensors', 'studios', 'source',
+                'genres', 'duration', 'rating')
+    NESTED = {'related': RelatedAnime, 'episode_info': Episode, 'characters': CharacterRole, 'staff': StaffMember}
+
+
+class Appearance(Record):
+    '''
+    Anime / manga of a character, with its role in it (item of the animeography / mangaography of
+    character.get_character_info).
+    '''
+    __slots__ = ('title', 'url', 'type')
+    INTERNED = ('title', 'url', 'type')
+    FLAT = True
+
+
+class VoiceActor(Record):
+    '''
+    Voice actor of a character (item of the voice_actors of character.get_character_info).
+    '''
+    __slots__ = ('va', 'va_url', 'va_lang')
+    INTERNED = ('va', 'va_url', 'va_lang')
+    FLAT = True
+
+
+class Character(Record):
+    '''
+    Mal character information (character.get_character_info). Fields without a slot are kept in extra.
+    '''
+    __slots__ = ('mal_id', 'url', 'eng_name', 'jap_name', 'nicknames', 'details', 'description', 'member_faves',
+                 'animeography', 'mangaography', 'voice_actors', 'retrieved_on', 'extra')
+    NESTED = {'animeography': Appearance, 'mangaography': Appearance, 'voice_actors': VoiceActor}
@@ -0,0 +1,214 @@
+'''
+Streaming output for scraped records.
+
+Records are appended to JSON Lines files (one compact json object per line), optionally gzip or
+zstd compressed, instead of one pretty-printed json file per record (utility.save_json).
+
+Classes
+-------
+JsonLinesSink: appends records to rotating, atomically renamed .jsonl files
+
+Methods
+-------
+read_json_lines(path -> string): yields the records of a .jsonl file (.jsonl.gz / .jsonl.zst if compressed)
+'''
+
+import io
+import os
+import gzip
+import json
+import time
+import threading
+from datetime import datetime
+
+# zstandard is optional, only needed for compression='zstd'
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {None: '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+
+def read_json_lines(path):
+    '''
+    Yields the records of a JSON Lines file, e.g. written by a JsonLinesSink (also a left-over .part file,
+    up to its last complete record).
+
+    Parameters:
+        path [string]: path of .jsonl file (decompressed if it ends with .gz or .zst, .zst needs the zstandard package)
+
+    Returns
+        records [generator]: records (dicts), in file order
+    '''
+    name = path[:-len('.part')] if path.endswith('.part') else path
+    with open(path, 'rb') as raw:
+        if name.endswith('.gz'):
+            lines = gzip.GzipFile(fileobj=raw, mode='rb')
+        elif name.endswith('.zst'):
+            if zstandard is None:
+                raise ImportError('zstd files need the zstandard package (pip install zstandard)')
+            # the sink ends a zstd frame on every flush (see JsonLinesSink._flush)
+            lines = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+        else:
+            lines = raw
+        try:
+            for line in lines:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # last line of a file that was still being written
+                        if not path.endswith('.part'):
+                            raise
+                        return
+        except EOFError:
+            # gzip .part files end without the gzip trailer
+            if not path.endswith('.part'):
+                raise
+
+
+class JsonLinesSink:
+    '''
+    Appends records to JSON Lines files in a directory.
+
+    Records are buffered and written when flush_bytes of records are buffered or flush_interval
+    seconds have passed since the last write. Files are written with a .part suffix and renamed
+    once they are complete (rotated or closed), so readers never see a half-written file.
+    If the process crashes, records already flushed stay in the left-over .part file (read_json_lines reads
+    them, gzip and zstd files too: a zstd frame is ended on every flush).
+
+    Parameters:
+        directory [string]: directory to write files in (created if it does not exist)
+        prefix [string] [default='records']: filename prefix (files are named <prefix>-<datetime>-<n>.jsonl)
+        compression [string] [default=None]: None, 'gzip' or 'zstd' (needs the zstandard package)
+        max_bytes [int] [default=256MB]: uncompressed size after which a new file is started
+        max_age [float] [default=None]: seconds after which a new file is started (no limit if not given)
+        flush_bytes [int] [default=1MB]: buffered size after which records are written
+        flush_interval [float] [default=5]: seconds after which buffered records are written
+        on_flush [callable] [default=None]: called with the keys (see write) of the records that
+            have been written to disk by a flush (e.g. to checkpoint them)
+    '''
+
+    def __init__(self, directory, prefix='records', compression=None, max_bytes=256 * 1024 * 1024,
+                 max_age=None, flush_bytes=1024 * 1024, flush_interval=5.0, on_flush=None):
+        if compression not in EXTENSIONS:
+            raise ValueError('compression must be one of {}'.format(list(EXTENSIONS)))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression needs the zstandard package (pip install zstandard)')
+
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.paths = []     # paths of completed files
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffered = 0
+        self._keys = []
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._seq = 0
+
+    def write(self, record, key=None):
+        '''
+        Appends a record.
+
+        Parameters:
+            record [dict]: record to write
+            key [default=None]: passed on to on_flush once the record is written to disk
+        '''
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered += len(line)
+            if key is not None:
+                self._keys.append(key)
+            if self._buffered >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        '''
+        Writes buffered records to the current file.
+        '''
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        '''
+        Writes buffered records and completes the current file.
+
+        Returns:
+            paths [list]: paths of all files completed by this sink
+        '''
+        with self._lock:
+            self._flush()
+            self._complete()
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self._file is not None and self.max_age and time.monotonic() - self._opened >= self.max_age:
+            self._complete()
+        if self._file is None:
+            self._open()
+
+        self._file.write(b''.join(self._buffer))
+        if self.compression == 'zstd':
+            # ends a zstd frame, so that the records of a .part file can be read up to its last flush
+            self._file.flush(zstandard.FLUSH_FRAME)
+        else:
+            self._file.flush()
+        self._written += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+        if self._written >= self.max_bytes:
+            self._complete()
+        if self.on_flush and self._keys:
+            self.on_flush(self._keys)
+        self._keys = []
+
+    def _open(self):
+        self._seq += 1
+        filename = '{}-{}-{:04d}{}'.format(self.prefix, datetime.now().strftime('%Y%m%dT%H%M%S'),
+                                           self._seq, EXTENSIONS[self.compression])
+        self._path = os.path.join(self.directory, filename)
+        self._raw = open(self._path + '.part', 'wb')
+        if self.compression == 'gzip':
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        elif self.compression == 'zstd':
+            self._file = zstandard.ZstdCompressor().stream_writer(self._raw)
+        else:
+            self._file = self._raw
+        self._opened = time.monotonic()
+        self._written = 0
+
+    def _complete(self):
+        if self._file is None:
+            return
+        if self.compression == 'gzip':
+            # writes the gzip trailer, the underlying file stays open
+            self._file.close()
+        elif self.compression == 'zstd':
+            self._file.flush(zstandard.FLUSH_FRAME)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._path + '.part', self._path)
+        self.paths.append(self._path)
+        self._file = None
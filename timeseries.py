@@ -0,0 +1,332 @@
+'''
+Columnar time-series store for the mal stats that change daily (members, score votes, rankings).
+
+Each scraped anime adds one row (mal_id, day, metrics) to the store. Rows are stored by month in
+partition directories (<root>/<YYYY-MM>/), one append-only binary file per column: mal_id (int64),
+day (int32, date.toordinal()) and one float64 column per metric in METRICS (nan if the value is
+unknown), all little-endian. Queries only read the partitions in their date range and the columns
+they ask for, straight into arrays, without deserializing any json records. If numpy is installed,
+columns are read as numpy arrays and filtered / reduced vectorized.
+
+Classes
+-------
+TimeSeriesStore: append rows and run range queries and deltas
+
+Methods
+-------
+get_metrics(info -> dict): returns the METRICS values of an anime info dict
+season_range(year -> int, season -> string): returns the first and last day of an anime season
+
+Usage:
+    python timeseries.py <store dir> series <mal_id> <metric> [--start 2024-01-01] [--end 2024-12-31]
+    python timeseries.py <store dir> delta <metric> [--season 2024 fall | --start ... --end ...] [--top 20]
+'''
+
+import os
+import sys
+import math
+import array
+import argparse
+import threading
+from datetime import date
+
+# numpy is optional, columns are python arrays (and filtered in python) without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# metric: (section of anime info, key in section), None section for top level fields
+METRICS = {
+    'score': ('score', 'score'),
+    'scored_by': ('score', 'scored_by'),
+    'ranked': (None, 'ranked'),
+    'popularity': (None, 'popularity'),
+    'members': (None, 'members'),
+    'favorites': (None, 'favorites'),
+    'watching': ('stats', 'watching'),
+    'completed': ('stats', 'completed'),
+    'on_hold': ('stats', 'on-hold'),
+    'dropped': ('stats', 'dropped'),
+    'plan_to_watch': ('stats', 'plan to watch'),
+    'total': ('stats', 'total')
+}
+
+# column: (array typecode, numpy dtype)
+KEY_COLUMNS = {'mal_id': ('q', '<i8'), 'day': ('i', '<i4')}
+METRIC_TYPES = ('d', '<f8')
+
+SEASON_MONTHS = {'winter': 1, 'spring': 4, 'summer': 7, 'fall': 10}
+
+
+def get_metrics(info):
+    '''
+    Returns the METRICS values of an anime info dict (from anime.get_anime_info, with stats if full).
+
+    Parameters:
+        info [dict]: anime information
+
+    Returns
+        metrics [dict]: float value by metric (nan if not in info)
+    '''
+    metrics = {}
+    for metric, (section, key) in METRICS.items():
+        values = info.get(section) if section else info
+        value = values.get(key) if isinstance(values, dict) else None
+        metrics[metric] = float(value) if isinstance(value, (int, float)) else math.nan
+    return metrics
+
+
+def season_range(year, season):
+    '''
+    Returns the first and last day of an anime season.
+
+    Parameters:
+        year [int]: year of season
+        season [string]: winter, spring, summer or fall
+
+    Returns
+        start [datetime.date]: first day of season
+        end [datetime.date]: last day of season
+    '''
+    month = SEASON_MONTHS[season.lower()]
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 10 else date(year, month + 3, 1)
+    return start, date.fromordinal(end.toordinal() - 1)
+
+
+class TimeSeriesStore:
+    '''
+    Columnar time-series store, partitioned by month. Appends are shared by all threads that use it.
+
+    Parameters:
+        root [string]: directory of store (created if it does not exist)
+    '''
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._checked = set()
+
+    def append(self, mal_id, info, day=None):
+        '''
+        Adds the metrics of an anime to the store.
+
+        Parameters:
+            mal_id [int]: mal anime id
+            info [dict]: anime information (from anime.get_anime_info, with stats if full)
+            day [datetime.date] [default=None]: day of the values (today if not given)
+        '''
+        self.append_rows([(mal_id, day or date.today(), get_metrics(info))])
+
+    def append_rows(self, rows):
+        '''
+        Adds rows to the store.
+
+        Parameters:
+            rows [list]: (mal_id, day [datetime.date], metrics [dict of metric values]) tuples
+        '''
+        partitions = {}
+        for mal_id, day, metrics in rows:
+            columns = partitions.get(day.strftime('%Y-%m'))
+            if columns is None:
+                columns = partitions[day.strftime('%Y-%m')] = self._empty_columns()
+            columns['mal_id'].append(int(mal_id))
+            columns['day'].append(day.toordinal())
+            for metric in METRICS:
+                columns[metric].append(metrics.get(metric, math.nan))
+
+        with self._lock:
+            for partition, columns in partitions.items():
+                directory = os.path.join(self.root, partition)
+                os.makedirs(directory, exist_ok=True)
+                if partition not in self._checked:
+                    self._repair(directory)
+                    self._checked.add(partition)
+                for column, values in columns.items():
+                    if sys.byteorder == 'big':
+                        values.byteswap()
+                    with open(os.path.join(directory, column + '.bin'), 'ab') as f:
+                        values.tofile(f)
+
+    def query(self, metrics, start, end, mal_ids=None):
+        '''
+        Returns the rows between two days (inclusive), only reading the partitions and columns needed.
+
+        Parameters:
+            metrics [list]: metrics (keys of METRICS) to return
+            start [datetime.date]: first day
+            end [datetime.date]: last day
+            mal_ids [list] [default=None]: only return rows of these mal ids (all if not given)
+
+        Returns
+            columns [dict]: mal_id, day (date.toordinal()) and metric columns, as numpy arrays if numpy is
+                installed (array.array otherwise), in the order the rows were added
+        '''
+        first, last = start.toordinal(), end.toordinal()
+        wanted = set(int(mal_id) for mal_id in mal_ids) if mal_ids is not None else None
+        names = ['mal_id', 'day'] + list(metrics)
+        parts = []
+        for directory in self._partitions(start, end):
+            count = self._row_count(directory)
+            columns = {name: self._read_column(directory, name, count) for name in names}
+            if numpy is not None:
+                mask = (columns['day'] >= first) & (columns['day'] <= last)
+                if wanted is not None:
+                    mask &= numpy.isin(columns['mal_id'], list(wanted))
+                parts.append({name: column[mask] for name, column in columns.items()})
+            else:
+                rows = [i for i, (day, mal_id) in enumerate(zip(columns['day'], columns['mal_id']))
+                        if first <= day <= last and (wanted is None or mal_id in wanted)]
+                parts.append({name: array.array(column.typecode, [column[i] for i in rows])
+                              for name, column in columns.items()})
+
+        if numpy is not None:
+            return {name: numpy.concatenate([part[name] for part in parts]) if parts
+                    else numpy.empty(0, self._types(name)[1]) for name in names}
+        result = {name: array.array(self._types(name)[0]) for name in names}
+        for part in parts:
+            for name in names:
+                result[name].extend(part[name])
+        return result
+
+    def series(self, mal_id, metric, start, end):
+        '''
+        Returns the values of one metric of an anime between two days (the last value of each day).
+
+        Parameters:
+            mal_id [int]: mal anime id
+            metric [string]: key of METRICS
+            start [datetime.date]: first day
+            end [datetime.date]: last day
+
+        Returns
+            series [list]: (datetime.date, value) tuples, by day
+        '''
+        columns = self.query([metric], start, end, [mal_id])
+        values = {}
+        for day, value in zip(columns['day'].tolist(), columns[metric].tolist()):
+            values[day] = value
+        return [(date.fromordinal(day), values[day]) for day in sorted(values)]
+
+    def delta(self, metric, start, end, mal_ids=None):
+        '''
+        Returns how much a metric changed between two days for each anime (e.g. member growth
+        over a season), from the first to the last known value in the range.
+
+        Parameters:
+            metric [string]: key of METRICS
+            start [datetime.date]: first day
+            end [datetime.date]: last day
+            mal_ids [list] [default=None]: only for these mal ids (all if not given)
+
+        Returns
+            deltas [dict]: last - first value by mal id (anime with no known value in the range are left out)
+        '''
+        columns = self.query([metric], start, end, mal_ids)
+        if numpy is not None:
+            values = columns[metric]
+            known = ~numpy.isnan(values)
+            ids, days, values = columns['mal_id'][known], columns['day'][known], values[known]
+            # stable sort by mal id then day, keeps the order rows were added in within a day
+            order = numpy.lexsort((days, ids))
+            ids, values = ids[order], values[order]
+            if len(ids) == 0:
+                return {}
+            starts = numpy.flatnonzero(numpy.r_[True, ids[1:] != ids[:-1]])
+            ends = numpy.r_[starts[1:], len(ids)] - 1
+            return dict(zip(ids[starts].tolist(), (values[ends] - values[starts]).tolist()))
+
+        first, last = {}, {}
+        for mal_id, day, value in zip(columns['mal_id'], columns['day'], columns[metric]):
+            if math.isnan(value):
+                continue
+            if mal_id not in first or day < first[mal_id][0]:
+                first[mal_id] = (day, value)
+            if mal_id not in last or day >= last[mal_id][0]:
+                last[mal_id] = (day, value)
+        return {mal_id: last[mal_id][1] - first[mal_id][1] for mal_id in first}
+
+    def _empty_columns(self):
+        columns = {name: array.array(typecode) for name, (typecode, dtype) in KEY_COLUMNS.items()}
+        for metric in METRICS:
+            columns[metric] = array.array(METRIC_TYPES[0])
+        return columns
+
+    def _types(self, name):
+        return KEY_COLUMNS.get(name, METRIC_TYPES)
+
+    def _partitions(self, start, end):
+        month = (start.year, start.month)
+        while month <= (end.year, end.month):
+            directory = os.path.join(self.root, '{:04d}-{:02d}'.format(*month))
+            if os.path.isdir(directory):
+                yield directory
+            month = (month[0] + 1, 1) if month[1] == 12 else (month[0], month[1] + 1)
+
+    def _row_count(self, directory):
+        # a crash during an append can leave some columns a row longer than others
+        counts = []
+        for name in list(KEY_COLUMNS) + list(METRICS):
+            path = os.path.join(directory, name + '.bin')
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // array.array(self._types(name)[0]).itemsize)
+        return min(counts)
+
+    def _repair(self, directory):
+        # truncates the columns to the rows that were completely written, so that appends stay aligned
+        count = self._row_count(directory)
+        for name in list(KEY_COLUMNS) + list(METRICS):
+            path = os.path.join(directory, name + '.bin')
+            if os.path.exists(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(count * array.array(self._types(name)[0]).itemsize)
+
+    def _read_column(self, directory, name, count):
+        typecode, dtype = self._types(name)
+        path = os.path.join(directory, name + '.bin')
+        if numpy is not None:
+            return numpy.fromfile(path, dtype=dtype, count=count)
+        column = array.array(typecode)
+        with open(path, 'rb') as f:
+            column.fromfile(f, count)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        return column
+
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='query a mal stats time-series store')
+    ap.add_argument('store', help='directory of time-series store')
+    commands = ap.add_subparsers(dest='command', required=True)
+
+    series_ap = commands.add_parser('series', help='values of a metric of one anime by day')
+    series_ap.add_argument('mal_id', type=int, help='mal anime id')
+    series_ap.add_argument('metric', choices=list(METRICS))
+
+    delta_ap = commands.add_parser('delta', help='change of a metric over a date range, by anime')
+    delta_ap.add_argument('metric', choices=list(METRICS))
+    delta_ap.add_argument('--season', nargs=2, metavar=('YEAR', 'SEASON'), help='date range of an anime season (e.g. 2024 fall)')
+    delta_ap.add_argument('--top', type=int, default=20, help='number of anime to show (largest changes first)')
+
+    for command_ap in [series_ap, delta_ap]:
+        command_ap.add_argument('--start', type=parse_date, default=date(1970, 1, 1), help='first day (YYYY-MM-DD)')
+        command_ap.add_argument('--end', type=parse_date, default=date.today(), help='last day (YYYY-MM-DD)')
+
+    args = vars(ap.parse_args())
+    store = TimeSeriesStore(args['store'])
+    start, end = args['start'], args['end']
+    if args['command'] == 'series':
+        for day, value in store.series(args['mal_id'], args['metric'], start, end):
+            print('{}\t{}'.format(day.isoformat(), value))
+    else:
+        if args['season']:
+            start, end = season_range(int(args['season'][0]), args['season'][1])
+        deltas = store.delta(args['metric'], start, end)
+        for mal_id, change in sorted(deltas.items(), key=lambda item: item[1], reverse=True)[:args['top']]:
+            print('{}\t{:+g}'.format(mal_id, change))
@@ -4,16 +4,36 @@ Contains utility functions for mal.py
 Methods
 -------
 get_soup(url -> string): returns b24.BeautifulSoup object from url
+get_page(url -> string): returns requests.Response of url (raises Bs4Error if not successful, PageNotFound if 404)
+make_soup(markup -> string or bytes): returns b24.BeautifulSoup object of html markup
+get_html(webpage -> requests.Response): returns the html of a response, as bytes if it is utf-8
+set_parser(parser -> string): sets the html parser that soup objects are made with
+set_partial_parsing(enabled -> bool): sets whether get_soup only parses the regions of a page that are scraped
+page_regions(*regions -> tuple): returns SoupStrainer that only keeps the given regions of a page
+get_mal_type(url -> string): returns the type of mal url (anime, character etc.)
+parse_mal_url(url -> string): returns the type, mal id and canonical url of a mal url
 '''
 
-import sys
-import requests
-from bs4 import BeautifulSoup
+import codecs
+from datetime import datetime
+import fetcher as fetcher_module
+import metrics
+from bs4 import BeautifulSoup, SoupStrainer
 import os
 import json
 import re
+from functools import lru_cache
+from collections import namedtuple
 
 ### MAL SPECIFIC UTILITY FUNCTIONS
+# mal url: optional scheme and www., type of page and the rest of its path (without query / fragment)
+MAL_URL_PATTERN = re.compile(r'(?:https?://)?(?:www\.)?myanimelist\.net/(anime|character|people)/([^?#]+)', re.I)
+MAL_URL_FORMAT = 'https://myanimelist.net/{}/{}'
+MAL_URL_CACHE_SIZE = 65536
+
+MalUrl = namedtuple('MalUrl', ['type', 'mal_id', 'url'])
+NOT_MAL_URL = MalUrl(None, None, None)
+
 def get_mal_type(url):
     '''
     Returns what type (anime, character etc.) of mal url the given url is 
@@ -26,53 +46,241 @@ def get_mal_type(url):
             - types: 'episode', 'anime', 'character', 'people'
             - returns None if not a mal url (does not match any types)
     '''
-    mal_base_pattern = r'([https:\/\/]*myanimelist.net\/)'
-    # episode needs to be matched before anime cos its url is a more specific ver of the anime one
-    # TODO not allow invalid episodes to match anime pattern
-    types_pattern = {
-        'episode': r'anime\/.+\/episode\/\d+',
-        'anime': r'anime\/.+',
-        'character': r'character\/.+',
-        'people': r'people\/.+'
-    }
-    
-    # check for base mal url first
-    patt = re.compile(mal_base_pattern)
-    match = patt.match(url)
+    return parse_mal_url(url).type
+
+@lru_cache(maxsize=MAL_URL_CACHE_SIZE)
+def parse_mal_url(url):
+    '''
+    Returns the type, mal id and canonical url of a mal url, in one pass (cached, as crawls see the same urls
+    many times, e.g. related anime of a franchise).
+
+    Parameters:
+        url [string]: url
+
+    Returns:
+        mal_url [MalUrl]: named tuple of
+            type [string]: type of mal url ('episode', 'anime', 'character', 'people', None if not a mal url)
+            mal_id [string]: mal id of anime (also of episode urls), character or person (None if the url has none)
+            url [string]: canonical url, https://myanimelist.net/<type>/<mal id>/<name> (the anime url and
+                episode number for episode urls, the same for all urls of a page, e.g. with http or www.)
+    '''
+    match = MAL_URL_PATTERN.match(url)
     if not match:
-        return None
-    
-    # get url after the initial base pattern
-    remaining = url[match.span()[1]:]
-    for mal_type, pattern in types_pattern.items():
-        patt = re.compile(pattern)
-        match = patt.match(remaining)
-        if match:
-            return mal_type
-    return None
+        return NOT_MAL_URL
+    mal_type, path = match.group(1).lower(), match.group(2).rstrip('/')
+    if not path:
+        return NOT_MAL_URL
+    parts = path.split('/')
+    if not parts[0].isdigit():
+        return MalUrl(mal_type, None, MAL_URL_FORMAT.format(mal_type, path))
+
+    if mal_type == 'anime' and 'episode' in parts[1:-1]:
+        episode = parts.index('episode', 1)
+        if parts[episode + 1].isdigit():
+            # https://myanimelist.net/anime/<mal id>/<name>/episode/<episode number>
+            anime_path = '/'.join(parts[:min(episode, 2)])
+            return MalUrl('episode', parts[0], MAL_URL_FORMAT.format(mal_type, '{}/episode/{}'.format(anime_path, parts[episode + 1])))
+    canonical = MAL_URL_FORMAT.format(mal_type, '/'.join(parts[:2]))
+    return MalUrl(mal_type, parts[0], canonical)
+
+def parse_mal_urls(urls):
+    '''
+    Returns the type, mal id and canonical url of many urls (e.g. the links of a related table), each distinct
+    url is only parsed once.
+
+    Parameters:
+        urls [iterable]: urls
+
+    Returns:
+        mal_urls [list]: MalUrl of every url (see parse_mal_url)
+    '''
+    urls = list(urls)
+    parsed = {}
+    for url in urls:
+        if url not in parsed:
+            parsed[url] = parse_mal_url(url)
+    return [parsed[url] for url in urls]
 
 ### BEAUTIFULSOUP UTILITY FUNCTIONS
 class Bs4Error(Exception):
     pass
 
-def get_soup(url):
+class PageNotFound(Bs4Error):
     '''
-    Returns a BeautifulSoup object of the HTML contents of a provided url.
+    Raised by get_page if the page does not exist (404), e.g. a mal id that was never used or was removed.
+    '''
+
+# html parsers BeautifulSoup can build soup objects with, lxml and html5lib need their packages installed
+# (lxml is faster than html.parser and gives the same results, see benchmarks/bench_parsers.py)
+PARSERS = ['html.parser', 'lxml', 'html5lib']
+default_parser = 'html.parser'
+
+# encoding of html given as bytes (myanimelist pages are utf-8), see get_html
+HTML_ENCODING = 'utf-8'
+
+def set_parser(name):
+    '''
+    Sets the html parser that get_soup and make_soup use by default.
 
     Parameters:
-        url (string): url of the site to generate soup object of
+        name (string): one of PARSERS
+    '''
+    global default_parser
+    if name not in PARSERS:
+        raise ValueError("parser must be one of {}".format(PARSERS))
+    # fail now rather than on the first page if the parser's package is not installed
+    BeautifulSoup("", name)
+    default_parser = name
+
+# whether get_soup only builds the regions of a page that the scrapers use (see page_regions)
+partial_parsing = False
+
+def set_partial_parsing(enabled):
+    '''
+    Sets whether get_soup only parses the regions of a page that are scraped (if the caller gives them).
+    Uses less memory and cpu, especially for large pages (e.g. /characters of long-running series).
+
+    Parameters:
+        enabled (bool)
+    '''
+    global partial_parsing
+    partial_parsing = enabled
+
+class RegionStrainer(SoupStrainer):
+    '''
+    SoupStrainer that only keeps region tags (with everything inside them), see page_regions.
+
+    Parameters:
+        regions (list): (tag name, attribute name, attribute value) of region tags
+    '''
+
+    def __init__(self, regions):
+        super().__init__()
+        self.regions = regions
+
+    def is_region(self, name, attrs):
+        for tag, attr, value in self.regions:
+            if name != tag or not attrs:
+                continue
+            actual = attrs.get(attr)
+            if actual is None:
+                continue
+            if attr == 'class':
+                # class is still a string (not a list of classes) while the page is being parsed
+                classes = actual.split() if isinstance(actual, str) else actual
+                if value in classes:
+                    return True
+            elif actual == value:
+                return True
+        return False
+
+    # called while parsing by beautifulsoup4 < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        return self.is_region(markup_name, markup_attrs)
+
+    # called while parsing by beautifulsoup4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.is_region(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+def page_regions(*regions):
+    '''
+    Returns a SoupStrainer that only keeps the given regions of a page (each region tag with everything inside it).
+
+    Parameters:
+        *regions (tuple): (tag name, attribute name, attribute value) of region tags,
+            for attribute name 'class' a tag matches if it has the class, otherwise the value has to be equal
+
+    Returns:
+        strainer (RegionStrainer): to pass to make_soup / get_soup
+    '''
+    return RegionStrainer(list(regions))
+
+def make_soup(markup, parser=None, regions=None):
+    '''
+    Returns a BeautifulSoup object of html markup.
+
+    Parameters:
+        markup (string or bytes): html (bytes are HTML_ENCODING, see get_html)
+        parser (string) [default=None]: one of PARSERS (parser set with set_parser if not given)
+        regions (bs4.SoupStrainer) [default=None]: only parse these regions of the page (see page_regions)
 
     Returns:
         soup (bs4.BeautifulSoup):
     '''
-    webpage = requests.get(url)
+    start = metrics.now()
+    if isinstance(markup, bytes):
+        # known encoding, so that beautifulsoup does not detect it
+        soup = BeautifulSoup(markup, parser or default_parser, parse_only=regions, from_encoding=HTML_ENCODING)
+    else:
+        soup = BeautifulSoup(markup, parser or default_parser, parse_only=regions)
+    metrics.observe_since('parse', start)
+    return soup
+
+def get_page(url, fetcher=None):
+    '''
+    Requests a url and returns the response, if it was successful.
+
+    Parameters:
+        url (string): url of the site to get
+        fetcher (fetcher.Fetcher) [default=None]: fetcher to request the page with (shared fetcher if not given)
+
+    Returns:
+        webpage (requests.Response): response with status code 200
+    '''
+    if fetcher is None:
+        fetcher = fetcher_module.get_fetcher()
+    webpage = fetcher.get(url)
     # print("{}\n\t{}".format(url, webpage))
+    if webpage.status_code == 404:
+        raise PageNotFound("{}: status code = 404, page not found".format(url))
     if webpage.status_code != 200:
         # print('webpage status code = {}, exiting'.format(webpage.status_code))
         # sys.exit()
         raise Bs4Error("{}: status code = {}, exiting get_soup function".format(url, webpage.status_code))
+    return webpage
+
+def get_html(webpage):
+    '''
+    Returns the html of a response: the body as received (bytes, no decoded copy) if it is HTML_ENCODING,
+    the body decoded into a string if the response declares another charset.
+    The bytes are the same object the response cache stores and incremental.page_hash hashes.
+
+    Parameters:
+        webpage (requests.Response): response
+
+    Returns:
+        html (bytes or string):
+    '''
+    content_type = webpage.headers.get('Content-Type', '').lower()
+    if 'charset' not in content_type or not webpage.encoding:
+        # no declared charset: requests would decode as ISO-8859-1, but myanimelist pages are utf-8
+        return webpage.content
+    try:
+        if codecs.lookup(webpage.encoding).name == codecs.lookup(HTML_ENCODING).name:
+            return webpage.content
+    except LookupError:
+        pass
+    return webpage.text
 
-    soup = BeautifulSoup(webpage.text, "html.parser")
+def get_soup(url, fetcher=None, parser=None, regions=None):
+    '''
+    Returns a BeautifulSoup object of the HTML contents of a provided url.
+
+    Parameters:
+        url (string): url of the site to generate soup object of
+        fetcher (fetcher.Fetcher) [default=None]: fetcher to request the page with (shared fetcher if not given)
+        parser (string) [default=None]: one of PARSERS (parser set with set_parser if not given)
+        regions (bs4.SoupStrainer) [default=None]: regions of the page that are scraped (see page_regions),
+            only these are parsed if partial parsing is enabled (see set_partial_parsing)
+
+    Returns:
+        soup (bs4.BeautifulSoup):
+    '''
+    webpage = get_page(url, fetcher)
+    soup = make_soup(get_html(webpage), parser, regions if partial_parsing else None)
     if soup is None or soup == "":
         # print("no soup, exiting")
         # sys.exit()
@@ -80,6 +288,7 @@ def get_soup(url):
         
     return soup
 
+@metrics.timed('extract.remove_children')
 def remove_children(element):
     '''
     Removes children elements from a bs4.element.Tag (changes the input element).
@@ -100,12 +309,21 @@ def remove_children(element):
     return element
 
 ### GENERAL UTILITY FUNCTIONS
+def get_timestamp():
+    '''
+    Returns the current datetime as a string (format used for the retrieved_on values).
+
+    Returns:
+        timestamp (string): e.g. 2021-02-28T18:33:26+08:00
+    '''
+    return datetime.now().strftime('%Y-%m-%dT%H:%M:%S+08:00')
+
 def save_json(data, filename):
     '''
     Saves data to a json file.
 
     Parameters:
-        data (dict): data to save to json file
+        data (dict): data to save to json file (or a records.Record)
         filename (string): filename to save json file as (saves to current dir by default)
 
     Returns:
@@ -118,6 +336,9 @@ def save_json(data, filename):
     if ".json" not in filename:
         filename = "{}.json".format(filename)
 
+    if hasattr(data, 'to_dict'):
+        data = data.to_dict()
+
     with open(filename, 'w', encoding='utf-8') as json_file:
         json.dump(data, json_file, ensure_ascii=False, indent=4, sort_keys=True)
 